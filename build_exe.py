@@ -30,7 +30,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('connection_dialog.py', '.'), ('database.py', '.'), ('spatial_dialog.py', '.')],
+    datas=[('connection_dialog.py', '.'), ('database.py', '.'), ('spatial_dialog.py', '.'), ('result_cache.py', '.'), ('profile_dialog.py', '.'), ('column_dialog.py', '.'), ('stream_writers.py', '.'), ('parallel_export.py', '.'), ('resumable_export.py', '.'), ('export_dialog.py', '.')],
     hiddenimports=['email','tkinter', 'urllib','tkinter.ttk', 'tkinter.filedialog', 'tkinter.messagebox', 'psycopg2', 'pandas', 'geopandas', 'shapely', 'matplotlib', 'matplotlib.backends.backend_tkagg', 'descartes'],
     hookspath=[],
     hooksconfig={},
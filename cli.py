@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+Headless Batch Export
+Run the export jobs of a JSON or YAML job spec without the GUI, e.g. from
+cron or CI:
+
+    python cli.py nightly.yaml --jobs 4 --summary summary.json
+
+Job spec:
+
+    connection:
+      host: db.example.com
+      port: 5432
+      database: gis
+      user: export
+      password_env: DBQUERY_PASSWORD   # or password: ...
+      schema: public
+    concurrency: 2          # jobs running at the same time (--jobs overrides)
+    output_dir: exports     # relative output paths are resolved here (relative to the spec)
+    defaults:               # keys every job inherits unless it sets them itself
+      geometry_column: geom
+    jobs:
+      - name: roads
+        table: roads
+        filter: "kind = 'highway'"
+        columns: [id, name, geom]
+        spatial_file: area.geojson      # relative to the spec file
+        spatial_join: false
+        spatial_predicate: intersects
+        outputs:
+          - roads.parquet
+          - path: roads.geojsonl.gz
+            precision: 6
+      - name: report
+        sql: "SELECT ..."
+        outputs: [report.xlsx]
+
+The export type follows from the output suffix unless 'format' is given.
+Output options (format, precision, geometry_encoding, parallel, merge,
+resumable, chunk_rows, restart) are passed to DataExporter.export_data and
+may also be set on the job or in defaults.
+
+Outputs of one job in streamed formats (Excel, GeoJSON, GeoJSONSeq,
+GeoParquet, FlatGeobuf, GeoPackage) with no options besides precision are
+written together from a single run of the query (DataExporter.export_to_many);
+a failing file does not stop the others.
+
+Exit status: 0 when every job succeeded, 1 when any job failed, 2 when the
+spec or arguments are invalid, 130 when interrupted. A JSON summary with
+timings and row counts is printed to stdout.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from database import DatabaseManager
+from dbexport import DataExporter, ExportProgress
+from stream_writers import COMPRESSION_SUFFIXES, FANOUT_EXPORT_TYPES
+
+EXIT_OK = 0
+EXIT_JOB_FAILED = 1
+EXIT_INVALID_SPEC = 2
+EXIT_INTERRUPTED = 130
+
+# Jobs running at the same time when neither the spec nor --jobs sets it
+DEFAULT_CONCURRENCY = 2
+
+# Output file suffix (after a compression suffix) -> export type
+EXPORT_SUFFIXES = {
+    '.xlsx': 'excel',
+    '.shp': 'shapefile',
+    '.geojson': 'geojson',
+    '.geojsonl': 'geojsonseq',
+    '.geojsons': 'geojsonseq',
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.parquet': 'geoparquet',
+    '.fgb': 'flatgeobuf',
+    '.gpkg': 'gpkg',
+}
+
+# Keyword arguments of DataExporter.export_data an output may set
+OUTPUT_OPTIONS = ('precision', 'geometry_encoding', 'parallel', 'merge', 'resumable', 'chunk_rows', 'restart')
+
+JOB_KEYS = {'name', 'table', 'sql', 'filter', 'columns', 'geometry_column', 'spatial_file', 'spatial_join',
+            'spatial_predicate', 'distance', 'outputs', 'format', *OUTPUT_OPTIONS}
+
+SPEC_KEYS = {'connection', 'concurrency', 'output_dir', 'defaults', 'jobs'}
+
+
+class SpecError(ValueError):
+    """The job spec cannot be run"""
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def read_spec(path):
+    """Parse a JSON or YAML (.yaml/.yml, needs PyYAML) job spec"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError as e:
+        raise SpecError(f"Cannot read job spec: {e}")
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise SpecError("YAML job specs need PyYAML (pip install pyyaml)") from None
+        try:
+            spec = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise SpecError(f"Invalid job spec: {e}")
+    else:
+        try:
+            spec = json.loads(text)
+        except ValueError as e:
+            raise SpecError(f"Invalid job spec: {e}")
+    if not isinstance(spec, dict):
+        raise SpecError("The job spec must be a mapping")
+    unknown = set(spec) - SPEC_KEYS
+    if unknown:
+        raise SpecError(f"Unknown keys in job spec: {', '.join(sorted(unknown))}")
+    return spec
+
+
+def connection_config(spec):
+    """DatabaseManager.connect config from the spec's connection section"""
+    config = dict(spec.get('connection') or {})
+    password_env = config.pop('password_env', None)
+    if password_env:
+        if password_env not in os.environ:
+            raise SpecError(f"Environment variable {password_env} (connection.password_env) is not set")
+        config['password'] = os.environ[password_env]
+    config.setdefault('password', '')
+    config.setdefault('port', 5432)
+    config.setdefault('schema', 'public')
+    missing = [key for key in ('host', 'database', 'user') if not config.get(key)]
+    if missing:
+        raise SpecError(f"connection is missing {', '.join(missing)}")
+    return config
+
+
+def export_type_for(path, export_format=None):
+    """Export type of an output: the explicit format, else the file suffix"""
+    if export_format:
+        if export_format not in EXPORT_SUFFIXES.values():
+            raise SpecError(f"Unknown format {export_format} for {path}")
+        return export_format
+    root, suffix = os.path.splitext(path.lower())
+    if suffix in COMPRESSION_SUFFIXES:
+        root, suffix = os.path.splitext(root)
+    if suffix not in EXPORT_SUFFIXES:
+        raise SpecError(f"Cannot tell the format of {path}; add 'format'")
+    return EXPORT_SUFFIXES[suffix]
+
+
+def build_jobs(spec, base_dir, output_dir):
+    """
+    Validate the spec's jobs and resolve their paths and output options
+
+    Returns:
+        list: Job dicts; every output has 'path', 'export_type' and 'options'
+    """
+    jobs = spec.get('jobs')
+    if not isinstance(jobs, list) or not jobs:
+        raise SpecError("The job spec has no jobs")
+    defaults = spec.get('defaults') or {}
+    resolved = []
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise SpecError(f"Job {index + 1} must be a mapping")
+        job = {**defaults, **job}
+        name = str(job.get('name') or job.get('table') or f"job{index + 1}")
+        unknown = set(job) - JOB_KEYS
+        if unknown:
+            raise SpecError(f"Unknown keys in job {name}: {', '.join(sorted(unknown))}")
+        if bool(job.get('table')) == bool(job.get('sql')):
+            raise SpecError(f"Job {name} needs exactly one of 'table' and 'sql'")
+        if job.get('sql') and job.get('spatial_file'):
+            raise SpecError(f"Job {name}: spatial_file cannot be combined with sql")
+        outputs = job.get('outputs')
+        if not isinstance(outputs, list) or not outputs:
+            raise SpecError(f"Job {name} has no outputs")
+
+        job_outputs = []
+        for output in outputs:
+            if isinstance(output, str):
+                output = {'path': output}
+            if not isinstance(output, dict) or not output.get('path'):
+                raise SpecError(f"Every output of job {name} needs a path")
+            unknown = set(output) - {'path', 'format', *OUTPUT_OPTIONS}
+            if unknown:
+                raise SpecError(f"Unknown output keys in job {name}: {', '.join(sorted(unknown))}")
+            path = os.path.join(output_dir, os.path.expanduser(output['path']))
+            options = {key: output.get(key, job.get(key)) for key in OUTPUT_OPTIONS
+                       if key in output or key in job}
+            job_outputs.append({
+                'path': path,
+                'export_type': export_type_for(path, output.get('format', job.get('format'))),
+                'options': options,
+            })
+        paths = [output['path'] for output in job_outputs]
+        if len(set(paths)) != len(paths):
+            raise SpecError(f"Job {name} writes the same file twice")
+
+        job['name'] = name
+        job['outputs'] = job_outputs
+        if job.get('spatial_file'):
+            job['spatial_file'] = os.path.join(base_dir, os.path.expanduser(job['spatial_file']))
+        resolved.append(job)
+
+    names = [job['name'] for job in resolved]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise SpecError(f"Duplicate job names: {', '.join(duplicates)}")
+    return resolved
+
+
+class JobRunner:
+    """Runs jobs, each with its own DatabaseManager, and cancels them on request"""
+
+    def __init__(self, config):
+        self.config = config
+        self._running = {}
+        self._lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def cancel_all(self):
+        """Cancel the running exports; jobs that have not started are skipped"""
+        self.cancelled.set()
+        with self._lock:
+            running = list(self._running.values())
+        for exporter, progress in running:
+            exporter.cancel_export(progress)
+
+    def _prepare(self, db_manager, job, fetch_rows):
+        """
+        Record the job's query on db_manager; fetch_rows runs it so the rows
+        are in memory (Shapefile export writes from a fetched result)
+
+        Returns:
+            spatial geometry for the exporter, or None
+        """
+        spatial_geom = None
+        if job.get('spatial_file'):
+            success, spatial_geom, message = db_manager.load_spatial_file(job['spatial_file'])
+            if not success:
+                raise RuntimeError(message)
+        if job.get('sql'):
+            if fetch_rows:
+                success, message = db_manager.execute_custom_sql(job['sql'])
+            else:
+                success, message = db_manager.set_query_source(custom_sql=job['sql'])
+        else:
+            db_manager.set_current_table(job['table'])
+            geometry_column = job.get('geometry_column')
+            spatial_join = bool(job.get('spatial_join'))
+            query = {
+                'filter_condition': job.get('filter'),
+                'spatial_geom': None if spatial_join else spatial_geom,
+                'geometry_column': geometry_column,
+                'spatial_join': spatial_join,
+                'spatial_predicate': job.get('spatial_predicate') or 'intersects',
+                'distance': job.get('distance'),
+                'columns': job.get('columns'),
+            }
+            if fetch_rows:
+                success, message = db_manager.execute_query(
+                    geometry_format='ewkb' if geometry_column else None, use_cache=False, **query)
+            else:
+                success, message = db_manager.set_query_source(**query)
+        if not success:
+            raise RuntimeError(message)
+        return spatial_geom
+
+    def run_job(self, job):
+        """
+        Run one job; never raises
+
+        Returns:
+            dict: Summary of the job and its outputs
+        """
+        started = time.perf_counter()
+        summary = {'name': job['name'], 'table': job.get('table'), 'success': False, 'error': None,
+                   'elapsed': 0.0, 'outputs': []}
+        if self.cancelled.is_set():
+            summary['error'] = "Not run (interrupted)"
+            return summary
+        db_manager = DatabaseManager()
+        try:
+            success, message = db_manager.connect(self.config)
+            if not success:
+                raise RuntimeError(message)
+            fetch_rows = any(output['export_type'] == 'shapefile' for output in job['outputs'])
+            spatial_geom = self._prepare(db_manager, job, fetch_rows)
+            exporter = DataExporter(db_manager, lambda: '', lambda: job.get('geometry_column'),
+                                    lambda: spatial_geom)
+            results = {}
+            for outputs in fanout_groups(job['outputs']):
+                if len(outputs) > 1:
+                    results.update(zip(map(id, outputs), self._run_fanout(job, exporter, outputs)))
+                else:
+                    results[id(outputs[0])] = self._run_output(job, exporter, outputs[0])
+            summary['outputs'] = [results[id(output)] for output in job['outputs']]
+            summary['success'] = all(output['success'] for output in summary['outputs'])
+            if not summary['success']:
+                summary['error'] = "Some outputs failed"
+        except Exception as e:
+            summary['error'] = str(e)
+            log(f"[{job['name']}] failed: {e}")
+        finally:
+            db_manager.disconnect()
+            summary['elapsed'] = round(time.perf_counter() - started, 3)
+        return summary
+
+    def _run_output(self, job, exporter, output):
+        started = time.perf_counter()
+        progress = ExportProgress()
+        result = {'path': output['path'], 'format': output['export_type'], 'success': False, 'rows': 0}
+        if self.cancelled.is_set():
+            result['message'] = "Not run (interrupted)"
+            return result
+        with self._lock:
+            self._running[job['name']] = (exporter, progress)
+        try:
+            folder = os.path.dirname(output['path'])
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            success, summary = exporter.export_data(output['export_type'], exporter.db_manager.query_result,
+                                                    output['path'], progress=progress, **output['options'])
+        except Exception as e:
+            success, summary = False, str(e)
+        finally:
+            with self._lock:
+                self._running.pop(job['name'], None)
+        message = summary['message'] if success else summary
+        result.update(success=success, message=message, rows=summary['rows'] if success else 0,
+                      elapsed=round(time.perf_counter() - started, 3))
+        state = f"{result['rows']} rows in {result['elapsed']:.1f}s" if success else message
+        log(f"[{job['name']}] {output['export_type']} -> {output['path']}: {'ok, ' if success else 'FAILED: '}{state}")
+        return result
+
+    def _run_fanout(self, job, exporter, outputs):
+        """Write several outputs from one run of the query; returns their results in order"""
+        started = time.perf_counter()
+        progress = ExportProgress()
+        results = [{'path': output['path'], 'format': output['export_type'], 'success': False, 'rows': 0}
+                   for output in outputs]
+        if self.cancelled.is_set():
+            for result in results:
+                result['message'] = "Not run (interrupted)"
+            return results
+        with self._lock:
+            self._running[job['name']] = (exporter, progress)
+        try:
+            for output in outputs:
+                folder = os.path.dirname(output['path'])
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+            success, fanout = exporter.export_to_many([(output['export_type'], output['path']) for output in outputs],
+                                                      fanout_precision(outputs), progress=progress)
+        except Exception as e:
+            success, fanout = False, str(e)
+        finally:
+            with self._lock:
+                self._running.pop(job['name'], None)
+        elapsed = round(time.perf_counter() - started, 3)
+        writers = fanout.results() if success else [(None, fanout)] * len(outputs)
+        for output, result, (writer, error) in zip(outputs, results, writers):
+            if error is None:
+                result.update(success=True, rows=writer.rows_written,
+                              message=f"Exported {writer.rows_written} records")
+                state = f"ok, {writer.rows_written} rows in {elapsed:.1f}s"
+            else:
+                result['message'] = str(error)
+                state = f"FAILED: {error}"
+            result.update(elapsed=elapsed, fanout=len(outputs))
+            log(f"[{job['name']}] {output['export_type']} -> {output['path']}: {state}")
+        return results
+
+
+def fanout_precision(outputs):
+    """Coordinate precision of a fan-out group, set by its GeoJSON outputs"""
+    for output in outputs:
+        if output['export_type'] in ('geojson', 'geojsonseq'):
+            return output['options'].get('precision')
+    return None
+
+
+def fanout_groups(outputs):
+    """
+    Split a job's outputs into groups written from one run of the query
+
+    Outputs in FANOUT_EXPORT_TYPES without options other than precision are
+    grouped; precision only applies to GeoJSON, so GeoJSON outputs with
+    different precisions go to separate groups and the other formats join
+    the first one. Every other output is a group of its own.
+    """
+    groups = {}
+    shared = []
+    for output in outputs:
+        options = output['options']
+        if output['export_type'] not in FANOUT_EXPORT_TYPES or not set(options) <= {'precision'}:
+            groups[id(output)] = [output]
+        elif output['export_type'] in ('geojson', 'geojsonseq'):
+            groups.setdefault(('fanout', options.get('precision')), []).append(output)
+        else:
+            shared.append(output)
+    fanout = [key for key in groups if isinstance(key, tuple)]
+    if shared:
+        groups.setdefault(fanout[0] if fanout else ('fanout', None), []).extend(shared)
+    return list(groups.values())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the export jobs of a JSON/YAML job spec without the GUI.",
+        epilog="Exit status: 0 all jobs succeeded, 1 a job failed, 2 invalid spec or arguments, 130 interrupted.")
+    parser.add_argument('spec', help="Job spec file (.json, .yaml or .yml)")
+    parser.add_argument('-j', '--jobs', type=int, help="Jobs running at the same time (default: spec "
+                                                       f"'concurrency' or {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--only', action='append', metavar='NAME', help="Run only this job (repeatable)")
+    parser.add_argument('--output-dir', help="Directory for relative output paths (default: spec "
+                                             "'output_dir', else the spec's directory)")
+    parser.add_argument('--summary', metavar='FILE', help="Also write the JSON summary to FILE")
+    parser.add_argument('--dry-run', action='store_true', help="Validate the spec and list the outputs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        spec = read_spec(args.spec)
+        base_dir = os.path.dirname(os.path.abspath(args.spec))
+        # --output-dir is relative to the working directory, the spec's output_dir to the spec
+        if args.output_dir:
+            output_dir = os.path.abspath(os.path.expanduser(args.output_dir))
+        else:
+            output_dir = os.path.join(base_dir, os.path.expanduser(spec.get('output_dir') or ''))
+        config = connection_config(spec)
+        jobs = build_jobs(spec, base_dir, output_dir)
+        if args.only:
+            missing = set(args.only) - {job['name'] for job in jobs}
+            if missing:
+                raise SpecError(f"No such job: {', '.join(sorted(missing))}")
+            jobs = [job for job in jobs if job['name'] in args.only]
+        concurrency = args.jobs or spec.get('concurrency') or DEFAULT_CONCURRENCY
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise SpecError("concurrency must be a positive integer")
+    except SpecError as e:
+        log(f"error: {e}")
+        return EXIT_INVALID_SPEC
+
+    if args.dry_run:
+        for job in jobs:
+            for output in job['outputs']:
+                log(f"[{job['name']}] {output['export_type']} -> {output['path']} {output['options'] or ''}")
+        return EXIT_OK
+
+    started_at = datetime.datetime.now().isoformat(timespec='seconds')
+    started = time.perf_counter()
+    runner = JobRunner(config)
+    interrupted = False
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(runner.run_job, job) for job in jobs]
+        while True:
+            try:
+                _, pending = wait(futures, timeout=0.5)
+            except KeyboardInterrupt:
+                if not interrupted:
+                    log("Interrupted, cancelling running exports...")
+                    interrupted = True
+                    runner.cancel_all()
+                continue
+            if not pending:
+                break
+    results = [future.result() for future in futures]
+
+    summary = {
+        'spec': os.path.abspath(args.spec),
+        'started': started_at,
+        'elapsed': round(time.perf_counter() - started, 3),
+        'succeeded': sum(result['success'] for result in results),
+        'failed': sum(not result['success'] for result in results),
+        'rows': sum(output['rows'] for result in results for output in result['outputs']),
+        'jobs': results,
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if not summary['failed'] else EXIT_JOB_FAILED
+
+
+if __name__ == '__main__':
+    # Worker processes of parallel exports re-import this module
+    multiprocessing.freeze_support()
+    sys.exit(main())
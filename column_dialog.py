@@ -0,0 +1,76 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class ColumnPickerDialog:
+    """查询字段选择对话框"""
+
+    def __init__(self, parent, columns, selected=None):
+        """
+        Args:
+            columns: 表的字段信息列表（字段名, 类型, 是否可空），来自get_table_info
+            selected: 当前已选字段名列表，None表示全部字段
+        """
+        self.parent = parent
+        self.columns = columns
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("选择查询字段")
+        self.dialog.geometry("380x420")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+
+        # 居中显示
+        self.dialog.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - self.dialog.winfo_width()) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - self.dialog.winfo_height()) // 2
+        self.dialog.geometry(f"+{x}+{y}")
+
+        self.result = None
+        self.create_widgets(selected)
+
+    def create_widgets(self, selected):
+        frame = ttk.Frame(self.dialog, padding="10")
+        frame.pack(fill="both", expand=True)
+
+        ttk.Label(frame, text="只查询选中的字段（不选表示全部字段）:").pack(anchor="w", pady=(0, 5))
+
+        list_frame = ttk.Frame(frame)
+        list_frame.pack(fill="both", expand=True)
+        self.column_list = tk.Listbox(list_frame, selectmode=tk.MULTIPLE, exportselection=False)
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.column_list.yview)
+        self.column_list.configure(yscrollcommand=scrollbar.set)
+        self.column_list.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        for index, (name, data_type, _) in enumerate(self.columns):
+            self.column_list.insert(tk.END, f"{name}  ({data_type})")
+            if selected is None or name in selected:
+                self.column_list.selection_set(index)
+
+        # 按钮框架
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(fill="x", pady=(10, 0))
+
+        ttk.Button(button_frame, text="全选",
+                   command=lambda: self.column_list.selection_set(0, tk.END)).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="全不选",
+                   command=lambda: self.column_list.selection_clear(0, tk.END)).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="取消", command=self.on_cancel).pack(side="right", padx=5)
+        ttk.Button(button_frame, text="确定", command=self.on_ok).pack(side="right", padx=5)
+
+    def on_ok(self):
+        """确定按钮点击事件：全选或全不选时返回空列表，表示查询全部字段"""
+        indexes = self.column_list.curselection()
+        if len(indexes) in (0, len(self.columns)):
+            self.result = []
+        else:
+            self.result = [self.columns[index][0] for index in indexes]
+        self.dialog.destroy()
+
+    def on_cancel(self):
+        self.result = None
+        self.dialog.destroy()
+
+    def show(self):
+        self.dialog.wait_window()
+        return self.result
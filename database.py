@@ -1,111 +1,1540 @@
+import hashlib
+import io
+import itertools
+import json
+import re
+import struct
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
 import psycopg2
+import shapely
+from psycopg2 import pool as pg_pool
+from psycopg2 import errors as pg_errors
+from psycopg2 import sql
+from psycopg2.extensions import encodings as pg_encodings
+from result_cache import ResultCache
 import pandas as pd
 import geopandas as gpd
-from tkinter import messagebox
+
+# 服务器端游标每次从数据库拉取的行数
+DEFAULT_ITERSIZE = 2000
+
+# 连接池默认大小（可在连接配置中用pool_min/pool_max覆盖）
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 8
+# 连接空闲超过该秒数后，借出前先执行健康检查
+POOL_HEALTH_CHECK_INTERVAL = 30
+# 连接池耗尽时等待空闲连接的最长秒数
+POOL_CHECKOUT_TIMEOUT = 30
+# 每个连接最多保留的服务器端预备语句数，超出时DEALLOCATE最久未用的
+MAX_PREPARED_STATEMENTS = 32
+# 分页浏览时每页的行数
+DEFAULT_PAGE_SIZE = 1000
+# 元数据快照的有效期（秒），过期后下次访问时重新加载
+CATALOG_TTL = 300
+# 界面查询使用的默认查询标识，用于取消正在执行的查询
+DEFAULT_QUERY_KEY = 'query'
+# 创建空间索引使用的查询标识，用于读取进度和取消
+INDEX_QUERY_KEY = 'index'
+# 可用于几何字段空间过滤（ST_Intersects、&&等）的索引访问方法
+SPATIAL_INDEX_METHODS = ('gist', 'spgist', 'brin')
+# 上次ANALYZE后修改的行数超过 阈值 + 比例 × 行数 时认为统计信息过期（与autovacuum默认值一致）
+STALE_STATS_THRESHOLD = 50
+STALE_STATS_RATIO = 0.1
+# 空间过滤谓词：{column}为表的几何字段，{geometry}为过滤几何，%s为距离参数。
+# 这些函数都会先用&&比较外包框，可以使用几何字段上的GIST索引
+SPATIAL_PREDICATES = {
+    'intersects': 'ST_Intersects({column}, {geometry})',
+    'dwithin': 'ST_DWithin({column}, {geometry}, %s)',
+    'contains': 'ST_Contains({column}, {geometry})',
+    'within': 'ST_Within({column}, {geometry})',
+    'covers': 'ST_Covers({geometry}, {column})',
+    'bbox': '{column} && {geometry}',
+}
+# geography类型不提供ST_Contains/ST_Within，需改用covers
+GEOGRAPHY_PREDICATES = ('intersects', 'dwithin', 'covers', 'bbox')
+# 空间连接模式下存放空间文件全部要素的会话临时表
+FEATURE_TABLE = 'dbquery_features'
+# COPY ... (FORMAT binary)的文件头：签名、标志位和扩展区长度
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+# 并行导出时可按取值范围切分的主键类型（单字段整数主键）
+PARTITION_KEY_TYPES = ('int2', 'int4', 'int8')
+
+
+# 元数据快照查询：一次取回schema下所有表的字段、类型、几何字段（SRID和几何类型）、
+# 主键、索引和估算行数。{spatial_select}/{spatial_join}在未安装PostGIS时为空。
+CATALOG_QUERY = """
+    WITH rels AS (
+        SELECT c.oid, c.relname, c.relkind,
+               CASE
+                   WHEN c.relkind IN ('v', 'f') THEN NULL
+                   WHEN c.reltuples >= 0 AND c.relpages > 0 THEN
+                       c.reltuples / c.relpages
+                       * GREATEST(pg_relation_size(c.oid) / current_setting('block_size')::int, 1)
+                   ELSE COALESCE(s.n_live_tup, NULLIF(c.reltuples, -1))
+               END AS row_estimate
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE n.nspname = %(schema)s
+        AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+    )
+    SELECT r.relname,
+           r.relkind,
+           r.row_estimate,
+           a.attname,
+           format_type(a.atttypid, a.atttypmod),
+           t.typname,
+           NOT a.attnotnull,
+           array_position(pk.indkey::int2[], a.attnum),
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'name', ic.relname, 'method', am.amname, 'valid', i.indisvalid)
+                      ORDER BY ic.relname)
+               FROM pg_index i
+               JOIN pg_class ic ON ic.oid = i.indexrelid
+               JOIN pg_am am ON am.oid = ic.relam
+               WHERE i.indrelid = r.oid AND a.attnum = ANY(i.indkey)
+           ), '[]'::json)
+           {spatial_select}
+    FROM rels r
+    JOIN pg_attribute a ON a.attrelid = r.oid AND a.attnum > 0 AND NOT a.attisdropped
+    JOIN pg_type t ON t.oid = a.atttypid
+    LEFT JOIN pg_index pk ON pk.indrelid = r.oid AND pk.indisprimary
+    {spatial_join}
+    ORDER BY r.relname, a.attnum;
+"""
+
+CATALOG_SPATIAL_SELECT = """,
+           COALESCE(gc.srid, gg.srid),
+           COALESCE(gc.type, gg.type)"""
+
+CATALOG_SPATIAL_JOIN = """
+    LEFT JOIN geometry_columns gc
+        ON gc.f_table_schema = %(schema)s AND gc.f_table_name = r.relname
+        AND gc.f_geometry_column = a.attname
+    LEFT JOIN geography_columns gg
+        ON gg.f_table_schema = %(schema)s AND gg.f_table_name = r.relname
+        AND gg.f_geography_column = a.attname"""
+
+
+def decode_geometries(values, crs=None):
+    """把一批几何值（EWKB/WKB的bytes、memoryview或十六进制字符串，或WKT）一次性解码
+
+    使用shapely.from_wkb向量化解码整批数据，避免逐行解析。未指定crs时从
+    EWKB中携带的SRID推断。
+
+    Returns:
+        geopandas.array.GeometryArray: 可直接用于构建GeoDataFrame
+    """
+    data = np.array([bytes(value) if isinstance(value, memoryview) else value for value in values],
+                    dtype=object)
+    try:
+        geometries = shapely.from_wkb(data)
+    except shapely.errors.GEOSException:
+        # 自定义SQL中用ST_AsText取出的WKT文本
+        geometries = shapely.from_wkt(data)
+    if crs is None and len(geometries):
+        srids = shapely.get_srid(geometries)
+        srids = srids[srids > 0]
+        if len(srids):
+            crs = f"EPSG:{int(srids[0])}"
+    return gpd.array.from_shapely(geometries, crs=crs)
+
+
+def encode_features_copy(features, srid):
+    """把空间文件的要素编码为COPY ... (FORMAT binary)数据
+
+    每个要素一行：_feature_id（bigint，要素在文件中的序号，从0开始）、
+    _feature_attrs（jsonb，其余属性字段）和_feature_geom（带SRID的EWKB，由
+    geometry/geography的二进制输入函数直接解析）。空几何的要素被跳过。
+    """
+    geometries = shapely.set_srid(np.asarray(features.geometry.values, dtype=object), srid)
+    wkbs = shapely.to_wkb(geometries, include_srid=True)
+    attributes = features.drop(columns=features.geometry.name)
+    if len(attributes.columns):
+        # JSON中字符串内的换行已被转义，按行切分是安全的
+        text = attributes.to_json(orient='records', lines=True, date_format='iso', force_ascii=False)
+        records = [line for line in text.split('\n') if line]
+    else:
+        records = ['{}'] * len(features)
+
+    buffer = io.BytesIO()
+    buffer.write(COPY_BINARY_HEADER)
+    for feature_id, (record, wkb) in enumerate(zip(records, wkbs)):
+        if wkb is None:
+            continue
+        # jsonb的二进制格式为版本号1加JSON文本
+        attrs = b'\x01' + record.encode('utf-8')
+        buffer.write(struct.pack('!hiq', 3, 8, feature_id))
+        buffer.write(struct.pack('!i', len(attrs)) + attrs)
+        buffer.write(struct.pack('!i', len(wkb)) + wkb)
+    buffer.write(struct.pack('!h', -1))
+    return buffer.getvalue()
+
+
+def create_feature_table(conn, kind, payload):
+    """在连接上建立临时要素表：二进制COPY全部要素，建GIST索引并ANALYZE后提交
+
+    Args:
+        kind: 几何字段类型（geometry或geography）
+        payload: encode_features_copy生成的COPY数据
+    """
+    table = sql.Identifier(FEATURE_TABLE)
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL('DROP TABLE IF EXISTS pg_temp.{}').format(table))
+        cursor.execute(sql.SQL(
+            'CREATE TEMP TABLE {} (_feature_id bigint, _feature_attrs jsonb, _feature_geom {})'
+        ).format(table, sql.SQL(kind)))
+        cursor.copy_expert(sql.SQL('COPY pg_temp.{} FROM STDIN WITH (FORMAT binary)').format(table)
+                           .as_string(conn), io.BytesIO(payload))
+        cursor.execute(sql.SQL('CREATE INDEX ON pg_temp.{} USING GIST (_feature_geom)').format(table))
+        cursor.execute(sql.SQL('ANALYZE pg_temp.{}').format(table))
+    conn.commit()
+
+
+def result_to_geodataframe(columns, rows, geometry_column, crs=None):
+    """把查询结果转换为GeoDataFrame，几何字段整批解码（保留字段名和SRID）"""
+    df = pd.DataFrame(rows, columns=columns)
+    geometries = decode_geometries(df[geometry_column].to_numpy(), crs)
+    df[geometry_column] = geometries
+    return gpd.GeoDataFrame(df, geometry=geometry_column, crs=geometries.crs)
+
 
 class DatabaseManager:
     """数据库管理器类，处理所有数据库相关操作"""
 
     def __init__(self):
-        self.conn = None
-        self.cursor = None
+        self.pool = None
         self.current_table = None
+        self.current_table_name = None
         self.query_result = None
+        self.query_columns = None
+        # 当前结果为分页浏览的一页时保存其分页信息，完整结果时为None
+        self.query_page = None
+        # 产生当前结果的查询（build_query的参数或自定义SQL），供COPY导出重新生成查询
+        self.query_source = None
         self.schema = None
+        # 连接参数，供并行导出的工作进程建立自己的连接
+        self.connect_params = None
+        self._stream_counter = itertools.count(1)
+        self._pool_slots = None
+        self._last_used = {}
+        # 借出的连接 -> 借出时的(连接池, 连接池名额)，重新连接后旧池的连接归还时直接关闭
+        self._checkouts = weakref.WeakKeyDictionary()
+        self._running_lock = threading.Lock()
+        self._running = {}
+        self._cancel_requested = set()
+        self._catalog = None
+        self._catalog_loaded_at = 0
+        self._catalog_lock = threading.Lock()
+        # 每个连接上已PREPARE的语句名，按最近使用排序（连接被关闭后自动清除）
+        self._prepared = weakref.WeakKeyDictionary()
+        self.result_cache = ResultCache()
+        # 空间连接模式使用的空间文件全部要素
+        self.spatial_features = None
+        self.spatial_source = None
+        # (几何类型, SRID) -> (COPY数据, 摘要)，加载新文件时清空
+        self._feature_payloads = {}
+        # 投影到各SRID后的要素和过滤几何，按(文件, SRID[, 几何摘要])缓存，加载新文件时清空
+        self._projections = {}
+        # 每个连接上临时要素表当前内容的摘要（连接被关闭后自动清除）
+        self._feature_tables = weakref.WeakKeyDictionary()
 
     def connect(self, config):
-        """连接数据库"""
+        """连接数据库，建立连接池"""
+        if self.pool:
+            self.disconnect()
         try:
-            self.conn = psycopg2.connect(
+            pool_min = int(config.get('pool_min') or DEFAULT_POOL_MIN)
+            pool_max = max(int(config.get('pool_max') or DEFAULT_POOL_MAX), pool_min)
+            self.pool = pg_pool.ThreadedConnectionPool(
+                pool_min, pool_max,
                 host=config['host'],
                 database=config['database'],
                 user=config['user'],
                 password=config['password'],
                 port=config['port']
             )
-            self.cursor = self.conn.cursor()
+            self._pool_slots = threading.BoundedSemaphore(pool_max)
+            self._last_used = {}
             self.schema = config['schema']
+            self.connect_params = {key: config[key] for key in ('host', 'database', 'user', 'password', 'port')}
             return True, f"已连接到 {config['host']}/{config['database']}"
         except Exception as e:
+            self.pool = None
             return False, f"连接数据库失败: {e}"
 
     def disconnect(self):
-        """断开数据库连接"""
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
-        self.conn = None
-        self.cursor = None
+        """断开数据库连接，关闭连接池中的所有连接"""
+        if self.pool:
+            self.pool.closeall()
+        self.pool = None
+        self._pool_slots = None
+        self._last_used = {}
+        self.connect_params = None
         self.current_table = None
+        self.current_table_name = None
         self.query_result = None
+        self.query_columns = None
+        self.query_page = None
+        self.query_source = None
+        self._catalog = None
+        self._catalog_loaded_at = 0
+        self.result_cache.clear()
+
+    def _checkout(self):
+        """从连接池借出一个健康的连接
+
+        连接池耗尽时最多等待POOL_CHECKOUT_TIMEOUT秒；已断开或空闲过久且
+        健康检查失败的连接会被丢弃并重新获取。
+        """
+        pool, slots = self.pool, self._pool_slots
+        if not pool:
+            raise RuntimeError("请先连接数据库！")
+        if not slots.acquire(timeout=POOL_CHECKOUT_TIMEOUT):
+            raise RuntimeError("数据库连接池已满，请稍后重试")
+        try:
+            while True:
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    self._checkouts[conn] = (pool, slots)
+                    return conn
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+        except Exception:
+            slots.release()
+            raise
+
+    def _is_healthy(self, conn):
+        """检查连接是否可用"""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < POOL_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _release(self, conn):
+        """归还连接：结束未完成的事务，损坏的连接直接关闭
+
+        连接归还到借出它的连接池；该连接池已被关闭或替换（断开或重新连接时
+        仍有操作在进行）时直接关闭连接。
+        """
+        pool, slots = self._checkouts.pop(conn, (None, None))
+        try:
+            if pool is None or pool is not self.pool:
+                conn.close()
+                return
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            if broken:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken)
+        finally:
+            if slots:
+                slots.release()
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接供单次操作使用，操作结束后自动归还连接池
+
+        每个操作使用独立连接，因此加载表列表、查找几何字段、执行查询和
+        后台导出可以并发进行，互不等待。
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def pooled_cursor(self):
+        """借出一个连接并返回其游标，操作结束后自动关闭游标并归还连接"""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
 
     def load_tables(self):
-        """加载数据库表列表"""
-        if not self.cursor:
-            return []
+        """加载数据库表列表
+
+        Returns:
+            tuple: (success, [(表名, 表类型), ...]或错误信息)
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
         try:
-            self.cursor.execute(f"""
-                SELECT table_name, table_type 
-                FROM information_schema.tables 
-                WHERE table_schema = '{self.schema}'
-                ORDER BY table_name;
-            """)
-            tables = self.cursor.fetchall()
-            return tables
+            with self.pooled_cursor() as cursor:
+                cursor.execute("""
+                    SELECT table_name, table_type 
+                    FROM information_schema.tables 
+                    WHERE table_schema = %s
+                    ORDER BY table_name;
+                """, (self.schema,))
+                tables = cursor.fetchall()
+            return True, tables
         except Exception as e:
-            messagebox.showerror("错误", f"加载表列表失败: {e}")
-            return []
+            return False, f"加载表列表失败: {e}"
+
+    def get_catalog(self, refresh=False):
+        """获取当前schema的元数据快照
+
+        快照在首次访问时用一次联合查询加载，之后在CATALOG_TTL秒内直接从内存
+        返回；refresh=True时强制重新加载。加载失败时返回空字典。
+
+        Returns:
+            dict: 表名 -> 表元数据，包含name、kind、row_estimate、columns
+                  （与get_table_info相同的(字段名, 类型, 是否可空)列表）、
+                  column_types、geometry_columns（name、kind、srid、type）、
+                  primary_key和indexes（字段名 -> 索引列表）
+        """
+        if not self.pool:
+            return {}
+        with self._catalog_lock:
+            expired = time.monotonic() - self._catalog_loaded_at > CATALOG_TTL
+            if self._catalog is None or expired or refresh:
+                try:
+                    self._catalog = self._load_catalog()
+                    self._catalog_loaded_at = time.monotonic()
+                except Exception:
+                    if self._catalog is None:
+                        return {}
+            return self._catalog
+
+    def refresh_catalog(self):
+        """重新加载元数据快照（表结构变化后使用）"""
+        return self.get_catalog(refresh=True)
+
+    def get_table_catalog(self, table_name):
+        """从元数据快照中获取单个表的元数据，不存在时返回None"""
+        return self.get_catalog().get(table_name)
+
+    def get_geometry_column_info(self, table_name, column_name):
+        """从元数据快照中获取几何字段的信息（kind、srid、type），不存在时返回None"""
+        table = self.get_table_catalog(table_name)
+        if not table:
+            return None
+        for geometry_column in table['geometry_columns']:
+            if geometry_column['name'] == column_name:
+                return geometry_column
+        return None
+
+    def _load_catalog(self):
+        """执行元数据快照查询并建立按表名索引的字典"""
+        params = {'schema': self.schema}
+        try:
+            with self.pooled_cursor() as cursor:
+                cursor.execute(CATALOG_QUERY.format(spatial_select=CATALOG_SPATIAL_SELECT,
+                                                    spatial_join=CATALOG_SPATIAL_JOIN), params)
+                rows = cursor.fetchall()
+        except pg_errors.UndefinedTable:
+            # 数据库未安装PostGIS，没有geometry_columns/geography_columns视图
+            with self.pooled_cursor() as cursor:
+                cursor.execute(CATALOG_QUERY.format(spatial_select='', spatial_join=''), params)
+                rows = [row + (None, None) for row in cursor.fetchall()]
+
+        catalog = {}
+        for (table_name, kind, row_estimate, column_name, data_type, type_name, nullable,
+             pk_position, indexes, srid, geometry_type) in rows:
+            table = catalog.get(table_name)
+            if table is None:
+                table = catalog[table_name] = {
+                    'name': table_name,
+                    'kind': kind,
+                    'row_estimate': int(round(row_estimate)) if row_estimate is not None else None,
+                    'columns': [],
+                    'column_types': {},
+                    'geometry_columns': [],
+                    'primary_key': [],
+                    'indexes': {}
+                }
+            table['columns'].append((column_name, data_type, 'YES' if nullable else 'NO'))
+            table['column_types'][column_name] = type_name
+            if type_name in ('geometry', 'geography'):
+                table['geometry_columns'].append({
+                    'name': column_name,
+                    'kind': type_name,
+                    'srid': srid if srid else (4326 if type_name == 'geography' else 0),
+                    'type': geometry_type or 'GEOMETRY'
+                })
+            if pk_position is not None:
+                table['primary_key'].append((pk_position, column_name))
+            if indexes:
+                table['indexes'][column_name] = indexes
+
+        for table in catalog.values():
+            table['primary_key'] = [name for _, name in sorted(table['primary_key'])]
+        return catalog
+
+    def _register_running(self, query_key, conn):
+        """登记正在执行查询的连接，以便从其他线程取消"""
+        with self._running_lock:
+            self._running[query_key] = conn
+            self._cancel_requested.discard(query_key)
+
+    def _unregister_running(self, query_key, conn):
+        """查询结束后注销连接"""
+        with self._running_lock:
+            if self._running.get(query_key) is conn:
+                del self._running[query_key]
+
+    def cancel_query(self, query_key=DEFAULT_QUERY_KEY):
+        """取消正在执行的查询
+
+        先通过libpq的取消请求（connection.cancel）中止后端语句，失败时再
+        借用另一个连接调用pg_cancel_backend。
+
+        Returns:
+            tuple: (success, message)
+        """
+        with self._running_lock:
+            conn = self._running.get(query_key)
+            if conn is None:
+                return False, "没有正在执行的查询"
+            self._cancel_requested.add(query_key)
+        try:
+            conn.cancel()
+            return True, "已发送取消请求"
+        except Exception:
+            pass
+        try:
+            backend_pid = conn.get_backend_pid()
+            with self.pooled_cursor() as cursor:
+                cursor.execute("SELECT pg_cancel_backend(%s)", (backend_pid,))
+                cancelled = cursor.fetchone()[0]
+            if cancelled:
+                return True, "已发送取消请求"
+            return False, "取消查询失败"
+        except Exception as e:
+            return False, f"取消查询失败: {e}"
+
+    def _apply_statement_timeout(self, cursor, statement_timeout):
+        """为当前事务设置语句超时（秒），None或0表示不限制"""
+        if statement_timeout:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(statement_timeout * 1000),))
+
+    def _describe_error(self, query_key, error):
+        """区分被用户取消和超时两种中止情况"""
+        if isinstance(error, pg_errors.QueryCanceled):
+            with self._running_lock:
+                cancelled = query_key in self._cancel_requested
+                self._cancel_requested.discard(query_key)
+            if cancelled:
+                return "查询已取消"
+            return "查询超时，已超过设置的语句超时时间"
+        return str(error)
+
+    def _run_query(self, query, statement_timeout=None, query_key=DEFAULT_QUERY_KEY, params=None,
+                   prepare=False, profile=False, setup=None):
+        """在连接池连接上执行查询并取回全部结果（不修改当前查询结果）
+
+        prepare=True时在服务器端PREPARE该语句并用EXECUTE执行，同一连接上
+        重复执行相同SQL时复用已生成的执行计划。
+
+        profile=True时记录实际执行计划和客户端各阶段耗时，结果中增加
+        'profile'：'plan'为计划树，'timings'为各阶段毫秒数，'executions'为
+        语句执行的次数。能加载并设置auto_explain时（其参数只有超级用户能设置）
+        计划由服务器在执行查询的同时记录，查询只执行一次；否则先用
+        EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)另外执行一遍。执行两次时事务
+        设为只读，任何修改数据的语句（包括SELECT中调用的写数据函数）都被拒绝。
+
+        setup(conn)在执行查询前于同一连接上调用（如上传临时要素表）。
+        """
+        timings = {}
+        with self.connection() as conn:
+            self._register_running(query_key, conn)
+            try:
+                if setup:
+                    setup(conn)
+                with conn.cursor() as cursor:
+                    self._apply_statement_timeout(cursor, statement_timeout)
+                    auto_explain = profile and self._enable_auto_explain(cursor)
+                    if profile and not auto_explain:
+                        # 语句要执行两次，只允许不修改数据的语句
+                        cursor.execute("SET LOCAL transaction_read_only = on")
+                        started = time.perf_counter()
+                        try:
+                            plan = self._explain_analyze(cursor, query, params)
+                        except pg_errors.ReadOnlySqlTransaction:
+                            raise ValueError("无法使用auto_explain（服务器未提供或需要超级用户），性能分析需要把语句额外执行一次，"
+                                             "只支持不修改数据的查询，请取消“性能分析”后执行") from None
+                        timings['explain_analyze'] = (time.perf_counter() - started) * 1000
+                    started = time.perf_counter()
+                    if prepare and params:
+                        self._execute_prepared(conn, cursor, query, params)
+                    else:
+                        cursor.execute(query, params)
+                    # 客户端游标在execute返回时已收到全部结果（服务器执行+网络传输）
+                    timings['execute'] = (time.perf_counter() - started) * 1000
+                    started = time.perf_counter()
+                    rows = cursor.fetchall()
+                    # fetchall把libpq缓冲区中的结果转换为Python对象
+                    timings['fetch'] = (time.perf_counter() - started) * 1000
+                    columns = [desc[0] for desc in cursor.description]
+                    if auto_explain:
+                        plan = self._auto_explain_plan(conn)
+            finally:
+                self._unregister_running(query_key, conn)
+        result = {
+            'columns': columns,
+            'data': rows,
+            'row_count': len(rows)
+        }
+        if profile:
+            server_time = plan.get('Execution Time', 0) + plan.get('Planning Time', 0)
+            timings['server'] = server_time
+            timings['transfer'] = max(timings['execute'] - server_time, 0)
+            result['profile'] = {'plan': plan, 'timings': timings, 'executions': 1 if auto_explain else 2}
+        return result
+
+    def _enable_auto_explain(self, cursor):
+        """在当前事务中开启auto_explain，之后执行的语句结束时服务器把实际执行计划
+        （JSON）作为LOG消息发给客户端。服务器不允许加载或设置时返回False"""
+        cursor.execute("SAVEPOINT dbquery_auto_explain")
+        try:
+            cursor.execute("LOAD 'auto_explain'")
+            # log_min_duration最后设置，前面的设置语句本身不会被记录
+            for name, value in (('auto_explain.log_analyze', 'on'), ('auto_explain.log_buffers', 'on'),
+                                ('auto_explain.log_format', 'json'), ('client_min_messages', 'log'),
+                                ('auto_explain.log_min_duration', '0')):
+                cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT dbquery_auto_explain")
+            return False
+        cursor.execute("RELEASE SAVEPOINT dbquery_auto_explain")
+        del cursor.connection.notices[:]
+        return True
+
+    def _auto_explain_plan(self, conn):
+        """从auto_explain的LOG消息中取出最后一条执行计划，duration记为Execution Time"""
+        for notice in reversed(conn.notices):
+            match = re.search(r'duration: ([\d.]+) ms\s+plan:\s*(\{.*\})', notice, re.S)
+            if match:
+                plan = json.loads(match.group(2))
+                plan['Execution Time'] = float(match.group(1))
+                return plan
+        raise RuntimeError("未收到auto_explain记录的执行计划")
+
+    def _explain_analyze(self, cursor, query, params=None):
+        """执行EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)并返回计划（含Planning/Execution Time）"""
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+        if isinstance(query, sql.Composable):
+            cursor.execute(sql.SQL(prefix) + query, params)
+        else:
+            cursor.execute(prefix + query.strip().rstrip(';'), params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]
+
+    def _execute_prepared(self, conn, cursor, query, params):
+        """以服务器端预备语句执行参数化查询
+
+        语句名由SQL文本的哈希生成，每个连接只PREPARE一次（PREPARE不随事务
+        回滚而失效）；占位符%s按顺序改写为$1、$2…，%%还原为%。每个过滤条件
+        文本都对应一条语句，每个连接最多保留MAX_PREPARED_STATEMENTS条，超出时
+        DEALLOCATE最久未用的一条。
+        """
+        query_text = query.as_string(conn) if isinstance(query, sql.Composable) else query
+        name = 'dbquery_' + hashlib.sha1(query_text.encode('utf-8')).hexdigest()[:16]
+        prepared = self._prepared.setdefault(conn, OrderedDict())
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            counter = itertools.count(1)
+            statement = re.sub(r'%%|%s', lambda m: '%' if m.group() == '%%' else f'${next(counter)}',
+                               query_text)
+            cursor.execute(sql.SQL('PREPARE {} AS ').format(sql.Identifier(name)) + sql.SQL(statement))
+            prepared[name] = True
+            while len(prepared) > MAX_PREPARED_STATEMENTS:
+                evicted, _ = prepared.popitem(last=False)
+                cursor.execute(sql.SQL('DEALLOCATE {}').format(sql.Identifier(evicted)))
+        cursor.execute(sql.SQL('EXECUTE {} ({})').format(
+            sql.Identifier(name), sql.SQL(', ').join(sql.Placeholder() * len(params))), params)
+
+    def _keep_result(self, result, source=None):
+        """保存查询结果及产生它的查询，供导出等后续操作使用"""
+        self.query_result = result['data']
+        self.query_columns = result['columns']
+        self.query_page = None
+        self.query_source = source
+        return result
+
+    def set_query_source(self, filter_condition=None, spatial_geom=None, geometry_column=None, spatial_join=False,
+                         spatial_predicate='intersects', distance=None, columns=None, custom_sql=None):
+        """只记录要导出的查询而不执行（供命令行批量导出）
+
+        流式导出按query_source重新执行完整查询，不需要先把结果读入内存。
+        query_result为None，表示结果未读取。参数含义与execute_query相同，
+        custom_sql不为空时导出该SQL的结果。
+
+        Returns:
+            tuple: (success, message)
+        """
+        if custom_sql:
+            source = {'sql': custom_sql}
+        else:
+            if not self.current_table:
+                return False, "请先选择表！"
+            source = {
+                'table': self.current_table_name,
+                'filter_condition': filter_condition,
+                'spatial_geom': spatial_geom,
+                'geometry_column': geometry_column,
+                'spatial_join': spatial_join,
+                'spatial_predicate': spatial_predicate,
+                'distance': distance,
+                'columns': columns
+            }
+        self.query_result = None
+        self.query_columns = None
+        self.query_page = None
+        self.query_source = source
+        try:
+            # 提前检查字段名、空间参数等，错误在导出开始前报告
+            self._source_query('ewkb' if geometry_column else None)
+        except Exception as e:
+            self.query_source = None
+            return False, f"查询无效: {e}"
+        return True, "查询已记录"
 
     def set_current_table(self, table_name):
         """设置当前选中的表"""
         self.current_table = f"{self.schema}.{table_name}"
+        self.current_table_name = table_name
+
+    def get_primary_key(self, table_name):
+        """获取表的主键字段列表（按主键定义顺序），没有主键时返回空列表"""
+        if not self.pool:
+            return []
+        table = self.get_table_catalog(table_name)
+        if table is not None:
+            return table['primary_key']
+        try:
+            with self.pooled_cursor() as cursor:
+                cursor.execute("""
+                    SELECT a.attname
+                    FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = to_regclass(quote_ident(%s) || '.' || quote_ident(%s))
+                    AND i.indisprimary
+                    ORDER BY array_position(i.indkey::int2[], a.attnum);
+                """, (self.schema, table_name))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception:
+            return []
 
-    def execute_query(self, filter_condition=None, spatial_geom=None, geometry_column=None, convert_wkt=False):
+    def browse_table(self, after_key=None, before_key=None, page_size=DEFAULT_PAGE_SIZE,
+                     statement_timeout=None, query_key=DEFAULT_QUERY_KEY, columns=None,
+                     geometry_column=None, geometry_format=None):
+        """分页浏览当前表（键集分页）
+
+        按主键（没有主键时按ctid）排序，用上一页的最后一个键或下一页的第一个
+        键作为起点，借助索引直接定位到页首，每页的开销与表的大小无关，也不
+        使用OFFSET扫描。没有主键时每次只读取起点附近的一段数据块（见
+        _browse_ctid_blocks）；分区表的ctid在各分区内独立编号，按(tableoid, ctid)
+        分页。视图和外部表没有ctid，没有主键时不分页，整体执行一次查询。
+
+        Args:
+            after_key: 取该键之后的一页（下一页），为None且before_key为None时取第一页
+            before_key: 取该键之前的一页（上一页）
+            page_size: 每页行数
+            statement_timeout: 语句超时秒数，None或0表示不限制
+            query_key: 查询标识，cancel_query(query_key)可取消该查询
+            columns: 只查询这些字段，None或空列表表示全部字段
+            geometry_column, geometry_format: 几何字段及其传输格式（见build_query）
+
+        Returns:
+            tuple: (success, result)，result在execute_query结果的基础上增加'page'，
+                   包含key_columns、page_size、first_key、last_key、has_next、has_previous；
+                   不分页时即execute_query的结果
+        """
+        if not self.current_table:
+            return False, "请先选择表！"
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            key_columns = self.get_primary_key(self.current_table_name)
+            kind = None if key_columns else self.relation_kind(self.current_table_name)
+            if key_columns:
+                key_exprs = [sql.Identifier(column) for column in key_columns]
+                key_params = lambda key: list(key)
+                key_placeholder = sql.SQL(', ').join(sql.Placeholder() * len(key_columns))
+            elif kind == 'p':
+                # 分区表：各分区的ctid会重复，加上tableoid区分
+                key_columns = ['tableoid', 'ctid']
+                key_exprs = [sql.SQL('tableoid'), sql.SQL('ctid')]
+                key_params = lambda key: list(key)
+                key_placeholder = sql.SQL('%s::oid, %s::tid')
+            elif kind not in ('r', 'm'):
+                return self.execute_query(statement_timeout=statement_timeout, query_key=query_key,
+                                          columns=columns, geometry_column=geometry_column,
+                                          geometry_format=geometry_format)
+            else:
+                # 没有主键时按物理位置（ctid）分页
+                key_exprs = [sql.SQL('ctid')]
+                key_params = lambda key: [key[0]]
+                key_placeholder = sql.SQL('%s::tid')
+            key_row = sql.SQL('({})').format(sql.SQL(', ').join(key_exprs))
+
+            backwards = before_key is not None
+            conditions = []
+            if backwards:
+                conditions.append(sql.SQL('{} < ({})').format(key_row, key_placeholder))
+                params = key_params(before_key)
+            elif after_key is not None:
+                conditions.append(sql.SQL('{} > ({})').format(key_row, key_placeholder))
+                params = key_params(after_key)
+            else:
+                params = []
+            direction = sql.SQL(' DESC') if backwards else sql.SQL('')
+            order_by = sql.SQL(', ').join(expr + direction for expr in key_exprs)
+
+            if not geometry_column:
+                geometry_format = None
+            select_list = [sql.SQL('*')]
+            if columns or geometry_format:
+                select_list = self._select_list(columns, geometry_column, geometry_format)
+
+            def run_page(conditions, params, limit):
+                where = sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions) if conditions else sql.SQL('')
+                query = sql.SQL('SELECT {keys}, {select} FROM {table}{where} ORDER BY {order_by} LIMIT {limit}').format(
+                    keys=sql.SQL(', ').join(
+                        sql.SQL('{} AS {}').format(expr, sql.Identifier(f'__page_key_{i}'))
+                        for i, expr in enumerate(key_exprs)),
+                    select=sql.SQL(', ').join(select_list),
+                    table=sql.Identifier(self.schema, self.current_table_name),
+                    where=where,
+                    order_by=order_by,
+                    limit=sql.Literal(limit))
+                return self._run_query(query, statement_timeout, query_key, params)
+
+            # 多取一行用于判断该方向上是否还有数据
+            if key_columns:
+                result = run_page(conditions, params, page_size + 1)
+            else:
+                result = self._browse_ctid_blocks(run_page, conditions, params, page_size + 1,
+                                                  after_key or before_key, backwards)
+
+            rows = result['data']
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            if backwards:
+                rows.reverse()
+
+            key_count = len(key_exprs)
+            keys = [tuple(row[:key_count]) for row in rows]
+            data = [row[key_count:] for row in rows]
+            columns = result['columns'][key_count:]
+            page = {
+                'key_columns': key_columns or ['ctid'],
+                'page_size': page_size,
+                'first_key': keys[0] if keys else None,
+                'last_key': keys[-1] if keys else None,
+                'has_next': has_more if not backwards else True,
+                'has_previous': has_more if backwards else after_key is not None
+            }
+            self.query_result = data
+            self.query_columns = columns
+            self.query_page = page
+            # 导出时按整表导出，而不仅是当前页
+            self.query_source = {'table': self.current_table_name, 'columns': columns,
+                                 'geometry_column': geometry_column}
+
+            return True, {
+                'columns': columns,
+                'data': data,
+                'row_count': len(data),
+                'page': page
+            }
+        except Exception as e:
+            return False, f"查询失败: {self._describe_error(query_key, e)}"
+
+    def _browse_ctid_blocks(self, run_page, conditions, params, limit, start_key, backwards):
+        """没有主键时按数据块范围取一页
+
+        WHERE ctid > x ORDER BY ctid LIMIT n无法按ctid顺序读取，每页都要顺序
+        扫描全表再排序。这里给每次查询加上数据块范围（ctid >= '(p,0)' AND
+        ctid < '(p+k,0)'），PostgreSQL 14起用TID Range Scan只读取这k个数据块；
+        行数不够一页时把范围加倍，从上一段的末尾（上一页时从开头）继续读取，
+        直到凑满或到达表的首尾。最后一段不设上限，表在浏览期间增长也不会漏行。
+
+        Args:
+            run_page: run_page(conditions, params, limit)执行一次分页查询
+            conditions, params: 相对起点键的条件及其参数
+            start_key: 起点键（ctid文本'(块号,行号)'），为None时从表头开始
+
+        Returns:
+            dict: _run_query的结果，data按读取方向排列
+        """
+        blocks, rows_per_block = self.table_blocks(self.current_table_name)
+        span = max(int(limit / rows_per_block) + 1, 1) if rows_per_block else 1
+        block = int(start_key[0].strip('()').split(',')[0]) if start_key is not None else 0
+        rows = []
+        while True:
+            if backwards:
+                block = max(block - span, 0)
+                window = [sql.SQL('ctid >= %s::tid')] if block > 0 else []
+            else:
+                block += span
+                window = [sql.SQL('ctid < %s::tid')] if block < blocks else []
+            result = run_page(conditions + window, params + [f'({block},0)'] * len(window), limit - len(rows))
+            rows.extend(result['data'])
+            if len(rows) >= limit or not window:
+                break
+            # 下一段紧接在这一段之后（上一页时在之前）
+            conditions = [sql.SQL('ctid < %s::tid') if backwards else sql.SQL('ctid >= %s::tid')]
+            params = [f'({block},0)']
+            span *= 2
+        result['data'] = rows
+        return result
+
+    def relation_kind(self, table_name):
+        """表的relkind（'r'普通表、'p'分区表、'v'视图、'm'物化视图、'f'外部表），不存在时为None"""
+        table = self.get_table_catalog(table_name)
+        if table is not None:
+            return table['kind']
+        with self.pooled_cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relkind
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = %s;
+            """, (self.schema, table_name))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def table_blocks(self, table_name):
+        """表当前的数据块数和统计信息中的每块行数（从未ANALYZE时为None）"""
+        with self.pooled_cursor() as cursor:
+            cursor.execute("""
+                SELECT pg_relation_size(c.oid) / current_setting('block_size')::int,
+                       CASE WHEN c.reltuples > 0 AND c.relpages > 0 THEN c.reltuples / c.relpages END
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = %s;
+            """, (self.schema, table_name))
+            blocks, rows_per_block = cursor.fetchone()
+        return int(blocks), rows_per_block
+
+    def build_query(self, filter_condition=None, spatial_geom=None, geometry_column=None, convert_wkt=False,
+                    geometry_format=None, spatial_join=False, spatial_predicate='intersects', distance=None,
+                    columns=None, extra_condition=None, leading_columns=None):
+        """根据过滤条件构建参数化查询
+
+        表名和字段名按标识符转义；空间过滤几何以WKB二进制参数传递，服务器
+        无需解析WKT文本，SQL长度也不随几何复杂度增长。
+
+        Args:
+            convert_wkt: 是否将几何字段原位转换为WKT，等同于geometry_format='wkt'
+            geometry_format: 几何字段的传输格式。None为PostGIS默认的十六进制EWKB
+                文本；'ewkb'为二进制EWKB（bytea，体积为十六进制的一半）；'wkt'为
+                WKT文本。后两者原位替换几何字段，字段名不变
+            spatial_join: 为True时与临时要素表（空间文件的全部要素，见
+                _feature_setup）做索引连接代替单个几何过滤，结果第一列
+                _feature_id为匹配到的要素序号；此时忽略spatial_geom
+            spatial_predicate: 空间谓词，SPATIAL_PREDICATES中的一个：intersects、
+                dwithin（距离内）、contains（字段包含过滤几何）、within（字段位于
+                过滤几何内）、covers（过滤几何覆盖字段）、bbox（仅比较外包框，
+                最快，适合预览）
+            distance: dwithin的距离，geometry字段为坐标单位，geography字段为米
+            columns: 只查询这些字段（按给定顺序），None或空列表表示全部字段
+            extra_condition: 附加的(条件, 参数)，如并行导出的分区范围
+            leading_columns: 放在选择列表最前面的SQL表达式，如断点续传导出的排序键
+
+        Returns:
+            tuple: (query, params)，query为psycopg2.sql.Composed对象
+        """
+        table = sql.Identifier(self.schema, self.current_table_name)
+        if convert_wkt and not geometry_format:
+            geometry_format = 'wkt'
+        if not geometry_column:
+            geometry_format = None
+        if columns or geometry_format:
+            select_list = self._select_list(columns, geometry_column, geometry_format)
+        else:
+            # 空间连接时*只展开业务表的字段
+            select_list = [sql.SQL('{}.*').format(table) if spatial_join else sql.SQL('*')]
+        leading = list(leading_columns or [])
+        conditions = []
+        params = []
+        if spatial_join:
+            select_list.insert(0, sql.SQL('f._feature_id'))
+            join_condition, params = self._spatial_predicate(geometry_column or 'local_geometry',
+                                                             sql.SQL('f._feature_geom'), [],
+                                                             spatial_predicate, distance)
+            query = sql.SQL('SELECT {} FROM {} JOIN pg_temp.{} f ON {}').format(
+                sql.SQL(', ').join(leading + select_list), table, sql.Identifier(FEATURE_TABLE), join_condition)
+        else:
+            query = sql.SQL('SELECT {} FROM {}').format(sql.SQL(', ').join(leading + select_list), table)
+
+        if filter_condition:
+            # 用户输入的条件原样拼接，其中的%需转义以免被当作参数占位符
+            conditions.append(sql.SQL(filter_condition.replace('%', '%%')))
+        if spatial_geom is not None and not spatial_join:
+            # 如果没有选择几何字段，使用默认的local_geometry字段
+            condition, condition_params = self._spatial_condition(geometry_column or 'local_geometry',
+                                                                  spatial_geom, spatial_predicate, distance)
+            conditions.append(condition)
+            params.extend(condition_params)
+        if extra_condition:
+            conditions.append(extra_condition[0])
+            params.extend(extra_condition[1])
+        if conditions:
+            query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions)
+        return query, params
+
+    def _select_list(self, columns=None, geometry_column=None, geometry_format=None):
+        """列出要查询的字段（None为全部字段），几何字段按指定格式编码后原位输出
+
+        几何字段只传输一次，编码由调用方决定（界面显示、导出各取所需）。
+        """
+        table_info = self.get_table_info(self.current_table_name) or {}
+        table_columns = [column[0] for column in table_info.get('columns', [])]
+        if columns:
+            missing = [name for name in columns if name not in table_columns]
+            if missing:
+                raise ValueError(f"表中不存在字段: {', '.join(missing)}")
+        else:
+            columns = table_columns
+            if geometry_format and geometry_column not in columns:
+                raise ValueError(f"表中不存在几何字段: {geometry_column}")
+        if not geometry_format:
+            return [sql.Identifier(name) for name in columns]
+        column_info = self.get_geometry_column_info(self.current_table_name, geometry_column) or {}
+        geometry = sql.Identifier(geometry_column)
+        if column_info.get('kind') == 'geography':
+            geometry = sql.SQL('{}::geometry').format(geometry)
+        encoder = {'ewkb': 'ST_AsEWKB', 'wkt': 'ST_AsText'}[geometry_format]
+        return [
+            sql.SQL('{}({}) AS {}').format(sql.SQL(encoder), geometry, sql.Identifier(name))
+            if name == geometry_column else sql.Identifier(name)
+            for name in columns
+        ]
+
+    def _spatial_condition(self, geometry_column, spatial_geom, spatial_predicate='intersects', distance=None):
+        """构建空间过滤条件，几何以WKB参数绑定
+
+        SRID取自几何字段的定义，过滤几何事先在客户端投影到该SRID（见
+        _project_geometry），几何字段本身不做转换，可以直接使用索引。
+        """
+        column_info = self.get_geometry_column_info(self.current_table_name, geometry_column) or {}
+        srid = column_info.get('srid', 0)
+        spatial_geom = self._project_geometry(spatial_geom, srid)
+        if column_info.get('kind') == 'geography':
+            geometry, params = sql.SQL('ST_GeogFromWKB(%s)'), [psycopg2.Binary(spatial_geom.wkb)]
+        else:
+            geometry = sql.SQL('ST_GeomFromWKB(%s, %s)')
+            params = [psycopg2.Binary(spatial_geom.wkb), srid]
+        return self._spatial_predicate(geometry_column, geometry, params, spatial_predicate, distance)
+
+    def _project_geometry(self, spatial_geom, srid):
+        """把过滤几何从空间文件的坐标系投影到几何字段的SRID
+
+        投影在客户端用pyproj一次完成，服务器端无需对每行执行ST_Transform。
+        空间文件没有坐标系或字段SRID未知（0）时原样返回。结果按(文件, SRID,
+        几何)缓存，重复查询不再重新投影。
+        """
+        crs = self.spatial_features.crs if self.spatial_features is not None else None
+        if crs is None or not srid:
+            return spatial_geom
+        key = (self.spatial_source, srid, hashlib.sha1(spatial_geom.wkb).hexdigest())
+        if key not in self._projections:
+            self._projections[key] = gpd.GeoSeries([spatial_geom], crs=crs).to_crs(epsg=srid).iloc[0]
+        return self._projections[key]
+
+    def _projected_features(self, srid):
+        """返回投影到指定SRID的空间文件全部要素，按(文件, SRID)缓存"""
+        features = self.spatial_features
+        if features.crs is None or not srid:
+            return features
+        key = (self.spatial_source, srid)
+        if key not in self._projections:
+            self._projections[key] = features.to_crs(epsg=srid)
+        return self._projections[key]
+
+    def _spatial_predicate(self, geometry_column, geometry, params, spatial_predicate='intersects', distance=None):
+        """把几何字段和过滤几何表达式代入空间谓词模板
+
+        Args:
+            geometry: 过滤几何的SQL表达式，params为其参数
+
+        Returns:
+            tuple: (condition, params)
+        """
+        if spatial_predicate not in SPATIAL_PREDICATES:
+            raise ValueError(f"不支持的空间谓词: {spatial_predicate}")
+        column_info = self.get_geometry_column_info(self.current_table_name, geometry_column) or {}
+        if column_info.get('kind') == 'geography' and spatial_predicate not in GEOGRAPHY_PREDICATES:
+            raise ValueError(f"geography字段不支持{spatial_predicate}，请改用covers")
+        params = list(params)
+        if spatial_predicate == 'dwithin':
+            if distance is None or distance < 0:
+                raise ValueError("距离范围查询需要指定非负的距离")
+            params.append(distance)
+        condition = sql.SQL(SPATIAL_PREDICATES[spatial_predicate]).format(
+            column=sql.Identifier(geometry_column), geometry=geometry)
+        return condition, params
+
+    def execute_query(self, filter_condition=None, spatial_geom=None, geometry_column=None, convert_wkt=False,
+                      stream=False, itersize=DEFAULT_ITERSIZE, statement_timeout=None,
+                      query_key=DEFAULT_QUERY_KEY, geometry_format=None, use_cache=True, profile=False,
+                      spatial_join=False, spatial_predicate='intersects', distance=None, columns=None):
         """执行查询
         
         Args:
             filter_condition: WHERE条件
             spatial_geom: 空间几何对象
             geometry_column: 几何字段名
-            convert_wkt: 是否将几何字段转换为WKT格式（用于导出Excel）
+            convert_wkt: 是否将几何字段原位转换为WKT格式（用于导出Excel）
+            stream: 是否使用服务器端游标流式返回结果（结果中'batches'为分批生成器）
+            itersize: 流式模式下每批从服务器拉取的行数
+            statement_timeout: 语句超时秒数，None或0表示不限制
+            query_key: 查询标识，cancel_query(query_key)可取消该查询
+            geometry_format: 几何字段传输格式（None、'ewkb'或'wkt'），见build_query；
+                'ewkb'结果可用decode_geometries/result_to_geodataframe整批解码
+            use_cache: 是否使用结果缓存。相同查询（含相同空间过滤几何）在表未被
+                修改时直接返回缓存结果，结果中'cached'为True
+            profile: 是否采集执行计划和各阶段耗时（见_run_query），分析时不使用缓存
+            spatial_join: 是否与空间文件的全部要素做空间连接（见build_query），
+                每行结果带有匹配要素的序号_feature_id
+            spatial_predicate: 空间谓词，distance: dwithin的距离（见build_query）
+            columns: 只查询这些字段，None或空列表表示全部字段
         """
         if not self.current_table:
             return False, "请先选择表！"
-        if not self.cursor:
+        if not self.pool:
             return False, "请先连接数据库！"
         try:
             # 构建查询
-            if convert_wkt and geometry_column:
-                # 导出Excel时，将几何字段转换为WKT
-                query = f"SELECT *, ST_AsText({geometry_column}) as {geometry_column}_wkt FROM {self.current_table}"
-            else:
-                query = f"SELECT * FROM {self.current_table}"
-            
-            conditions = []
-            if filter_condition:
-                conditions.append(filter_condition)
-            if spatial_geom and geometry_column:
-                # 使用用户选择的几何字段进行空间查询
-                conditions.append(f"ST_Intersects({geometry_column}, ST_GeomFromText('{spatial_geom.wkt}'))")
-            elif spatial_geom:
-                # 如果没有选择几何字段，使用默认的local_geometry字段
-                conditions.append(f"ST_Intersects(local_geometry, ST_GeomFromText('{spatial_geom.wkt}'))")
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
+            started = time.perf_counter()
+            query, params = self.build_query(filter_condition, spatial_geom, geometry_column, convert_wkt,
+                                             geometry_format, spatial_join, spatial_predicate, distance,
+                                             columns)
+            setup = features_digest = None
+            if spatial_join:
+                setup, features_digest = self._feature_setup(geometry_column or 'local_geometry')
+            build_time = (time.perf_counter() - started) * 1000
+            if stream:
+                return True, self._stream_query(query, itersize, statement_timeout, query_key, params, setup)
+            source = {
+                'table': self.current_table_name,
+                'filter_condition': filter_condition,
+                'spatial_geom': spatial_geom,
+                'geometry_column': geometry_column,
+                'spatial_join': spatial_join,
+                'spatial_predicate': spatial_predicate,
+                'distance': distance,
+                'columns': columns
+            }
             
-            # 执行查询
-            self.cursor.execute(query)
-            self.query_result = self.cursor.fetchall()
-            columns = [desc[0] for desc in self.cursor.description]
+            cache_key = version = None
+            if use_cache and not profile:
+                cache_key, version = self._cache_state(query, params, features_digest)
+                cached = self.result_cache.get(cache_key, version)
+                if cached is not None:
+                    return True, self._keep_result(dict(cached, cached=True), source)
             
-            return True, {
-                'columns': columns,
-                'data': self.query_result,
-                'row_count': len(self.query_result)
-            }
+            # 执行查询（带空间参数的查询在服务器端预备，重复执行时复用执行计划）
+            result = self._run_query(query, statement_timeout, query_key, params, prepare=True,
+                                     profile=profile, setup=setup)
+            if profile:
+                result['profile']['timings']['build'] = build_time
+            if version is not None:
+                self.result_cache.put(cache_key, version, result)
+            return True, self._keep_result(result, source)
         except Exception as e:
-            return False, f"查询失败: {e}"
+            return False, f"查询失败: {self._describe_error(query_key, e)}"
+
+    def _cache_state(self, query, params, features_digest=None):
+        """计算查询的缓存键和当前表的修改版本
+
+        缓存键由规范化（合并空白）后的SQL文本和参数组成，空间过滤几何的WKB
+        以其SHA-1摘要参与计算，空间连接时还包括临时要素表内容的摘要。修改版本取自pg_stat_user_tables的插入/更新/
+        删除计数及relfilenode（TRUNCATE会改变它）；其他会话的修改要等其后端
+        刷新统计信息后（通常在数秒内）才会使缓存失效。视图等没有统计信息的
+        对象返回版本None，不缓存。
+        """
+        with self.connection() as conn:
+            query_text = query.as_string(conn) if isinstance(query, sql.Composable) else query
+            digest = hashlib.sha1(' '.join(query_text.split()).encode('utf-8'))
+            for param in params or []:
+                if isinstance(param, psycopg2.Binary):
+                    param = hashlib.sha1(param.adapted).hexdigest()
+                digest.update(repr(param).encode('utf-8'))
+            if features_digest:
+                digest.update(features_digest.encode('utf-8'))
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT s.n_tup_ins, s.n_tup_upd, s.n_tup_del, pg_relation_filenode(s.relid)
+                    FROM pg_stat_user_tables s
+                    WHERE s.schemaname = %s AND s.relname = %s;
+                """, (self.schema, self.current_table_name))
+                version = cursor.fetchone()
+        return digest.hexdigest(), version
+
+    def _feature_setup(self, geometry_column):
+        """准备空间连接所需的临时要素表
+
+        要素先投影到几何字段的SRID，再按字段类型（geometry/geography）编码为
+        COPY数据，同一文件、字段类型和SRID只投影和编码一次。
+
+        Returns:
+            tuple: (setup, digest)。setup(conn)在查询连接上建立临时表，digest为
+                   要素数据的摘要
+        """
+        kind, payload, digest = self._feature_payload(geometry_column)
+        return (lambda conn: self._upload_features(conn, kind, payload, digest)), digest
+
+    def _feature_payload(self, geometry_column):
+        """返回临时要素表的(字段类型, COPY数据, 摘要)，见_feature_setup"""
+        if self.spatial_features is None or not len(self.spatial_features):
+            raise ValueError("请先加载空间文件！")
+        column_info = self.get_geometry_column_info(self.current_table_name, geometry_column) or {}
+        kind = column_info.get('kind', 'geometry')
+        srid = column_info.get('srid', 0)
+        payload_key = (kind, srid)
+        if payload_key not in self._feature_payloads:
+            payload = encode_features_copy(self._projected_features(srid), srid)
+            digest = f"{kind}:{hashlib.sha1(payload).hexdigest()}"
+            self._feature_payloads[payload_key] = (payload, digest)
+        payload, digest = self._feature_payloads[payload_key]
+        return kind, payload, digest
+
+    def _upload_features(self, conn, kind, payload, digest):
+        """在连接上建立临时要素表：二进制COPY全部要素，建GIST索引并ANALYZE
+
+        临时表属于数据库会话，随连接保留到连接关闭；同一连接上已上传相同
+        内容时直接复用，不再重复上传。
+        """
+        if self._feature_tables.get(conn) == digest:
+            return
+        create_feature_table(conn, kind, payload)
+        self._feature_tables[conn] = digest
+
+    def _source_query(self, geometry_format=None, extra_condition=None, leading_columns=None):
+        """按query_source重新生成当前结果的完整查询
+
+        Args:
+            geometry_format: 几何字段格式（见build_query），对自定义SQL无效
+            extra_condition: 附加的(条件, 参数)（见build_query），对自定义SQL无效
+            leading_columns: 选择列表前的表达式（见build_query），对自定义SQL无效
+
+        Returns:
+            tuple: (query, params, setup)
+        """
+        source = self.query_source
+        if not source:
+            raise ValueError("没有查询结果可导出！")
+        if 'sql' in source:
+            return sql.SQL(source['sql'].strip().rstrip(';').replace('%', '%%')), [], None
+        if source['table'] != self.current_table_name:
+            raise ValueError("当前表已切换，请重新查询后再导出！")
+        args = {key: value for key, value in source.items() if key != 'table'}
+        query, params = self.build_query(geometry_format=geometry_format, extra_condition=extra_condition,
+                                         leading_columns=leading_columns, **args)
+        setup = None
+        if args.get('spatial_join'):
+            setup, _ = self._feature_setup(args['geometry_column'] or 'local_geometry')
+        return query, params, setup
+
+    def copy_result_to(self, file_obj, delimiter=',', geometry_encoding='wkt', query_key='export'):
+        """用COPY ... TO STDOUT把当前结果的完整查询以CSV格式写入文件对象
+
+        服务器直接生成CSV文本，copy_expert边接收边写入文件，内存占用与结果
+        大小无关，也不经过Python逐行转换。COPY不支持参数绑定，参数由mogrify
+        内联到SQL中。分页浏览时导出整表。
+
+        Args:
+            file_obj: 以文本模式打开的文件对象
+            delimiter: 字段分隔符，','为CSV，'\t'为TSV
+            geometry_encoding: 几何字段格式，'wkt'为WKT文本，'hex'为十六进制EWKB
+            query_key: 查询标识，cancel_query(query_key)可取消导出
+
+        Returns:
+            tuple: (success, 导出行数或错误信息)
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            query, params, setup = self._source_query('wkt' if geometry_encoding == 'wkt' else None)
+            with self.connection() as conn:
+                self._register_running(query_key, conn)
+                try:
+                    if setup:
+                        setup(conn)
+                    with conn.cursor() as cursor:
+                        copy = sql.SQL('COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER, DELIMITER {})').format(
+                            sql.SQL(cursor.mogrify(query, params).decode(pg_encodings[conn.encoding])),
+                            sql.Literal(delimiter))
+                        cursor.copy_expert(copy.as_string(conn), file_obj)
+                        row_count = cursor.rowcount
+                finally:
+                    self._unregister_running(query_key, conn)
+            return True, row_count
+        except Exception as e:
+            return False, f"导出失败: {self._describe_error(query_key, e)}"
+
+    def stream_result(self, itersize=DEFAULT_ITERSIZE, geometry_format='ewkb', query_key='export'):
+        """用服务器端游标重新执行当前结果的完整查询，按批返回
+
+        供流式导出使用：只执行一次查询，内存中同时只有一批数据。分页浏览时
+        返回整表。
+
+        Returns:
+            tuple: (success, result或错误信息)，result与execute_query(stream=True)相同
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            query, params, setup = self._source_query(geometry_format)
+            return True, self._stream_query(query, itersize, None, query_key, params, setup)
+        except Exception as e:
+            return False, f"导出失败: {self._describe_error(query_key, e)}"
+
+    def _keyset_keys(self):
+        """断点续传导出的排序键：主键字段，空间连接时再加上_feature_id（同一行可能匹配多个要素）"""
+        source = self.query_source
+        if not source:
+            raise ValueError("没有查询结果可导出！")
+        if 'sql' in source:
+            raise ValueError("自定义SQL的结果不支持断点续传导出")
+        key_columns = self.get_primary_key(source['table'])
+        if not key_columns:
+            raise ValueError("该表没有主键，无法按稳定的顺序断点续传导出")
+        table_id = sql.Identifier(self.schema, source['table'])
+        keys = [sql.SQL('{}.{}').format(table_id, sql.Identifier(column)) for column in key_columns]
+        if source.get('spatial_join'):
+            keys.append(sql.SQL('f._feature_id'))
+        return keys
+
+    def chunk_source(self, geometry_format='ewkb'):
+        """在导出开始时固定断点续传导出的查询，之后每一块都用它读取（见stream_chunk）
+
+        后台导出期间界面仍可执行新查询或切换表，query_source和当前表随之改变；
+        各块若每次按query_source重新生成查询，前后几块就可能来自不同的查询。
+        这里一次生成查询，空间连接的要素数据也在此时固定在setup中。
+
+        Returns:
+            dict: 'query'为按排序键排序的完整查询，'keyset_query'为其中键大于
+                  上一块最后一个键的部分（键值参数接在'params'之后），
+                  'key_count'为每行前面的键值个数，'setup'为查询前在连接上
+                  执行的准备函数，'fingerprint'见result_fingerprint
+        """
+        keys = self._keyset_keys()
+        leading = [sql.SQL('{} AS {}').format(key, sql.Identifier(f'__page_key_{i}')) for i, key in enumerate(keys)]
+        condition = sql.SQL('({}) > ({})').format(sql.SQL(', ').join(keys),
+                                                  sql.SQL(', ').join(sql.Placeholder() * len(keys)))
+        order_by = sql.SQL(' ORDER BY {}').format(sql.SQL(', ').join(keys))
+        query, params, setup = self._source_query(geometry_format, leading_columns=leading)
+        keyset_query, _, _ = self._source_query(geometry_format, (condition, []), leading)
+        return {
+            'query': query + order_by,
+            'keyset_query': keyset_query + order_by,
+            'params': params,
+            'key_count': len(keys),
+            'setup': setup,
+            'fingerprint': self.result_fingerprint(geometry_format),
+        }
+
+    def stream_chunk(self, source, after_key=None, limit=None, itersize=DEFAULT_ITERSIZE, query_key='export'):
+        """按排序键顺序读取固定查询中after_key之后的最多limit行，供断点续传导出使用
+
+        与browse_table相同用键集定位起点，每块的开销与已导出的行数无关。每行
+        前面依次是各排序键的值（见_keyset_keys），之后才是结果字段。
+
+        Args:
+            source: chunk_source()在导出开始时固定的查询
+            after_key: 上一块最后一行的键值序列，None表示从头开始
+            limit: 最多读取的行数，None表示读到结果末尾
+
+        Returns:
+            tuple: (success, result或错误信息)，result与stream_result相同，
+                   另有'key_count'为每行前面的键值个数
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            if after_key is None:
+                query, params = source['query'], list(source['params'])
+            else:
+                query, params = source['keyset_query'], list(source['params']) + list(after_key)
+            if limit:
+                query += sql.SQL(' LIMIT {}').format(sql.Literal(limit))
+            result = self._stream_query(query, itersize, None, query_key, params, source['setup'])
+            result['key_count'] = source['key_count']
+            return True, result
+        except Exception as e:
+            return False, f"导出失败: {self._describe_error(query_key, e)}"
+
+    def result_fingerprint(self, geometry_format='ewkb'):
+        """当前结果完整查询（参数已内联）的摘要，用于确认续传时仍是同一个查询"""
+        query, params, _ = self._source_query(geometry_format)
+        with self.pooled_cursor() as cursor:
+            digest = hashlib.sha1(cursor.mogrify(query, params))
+        if self.query_source.get('spatial_join'):
+            digest.update(self._feature_payload(self.query_source['geometry_column'] or 'local_geometry')[2].encode())
+        return digest.hexdigest()
+
+    @contextmanager
+    def exported_snapshot(self):
+        """在连接池连接上开启REPEATABLE READ事务并导出其快照（pg_export_snapshot）
+
+        其他连接（包括其他进程的连接）在事务开始时执行SET TRANSACTION SNAPSHOT
+        导入该快照后，看到的数据与本事务完全一致。快照只在with块内有效，块结束
+        时事务回滚、连接归还。
+
+        Yields:
+            tuple: (快照标识, 该事务中的游标)
+        """
+        with self.pooled_cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SELECT pg_export_snapshot()")
+            yield cursor.fetchone()[0], cursor
+
+    def partition_queries(self, cursor, parts, geometry_format='ewkb'):
+        """把当前结果的完整查询按键范围切分为最多parts个互不重叠的查询
+
+        单字段整数主键按min/max等分取值范围；否则按ctid的数据块范围切分
+        （PostgreSQL 14起以TID Range Scan执行，每个查询只读取自己的数据块）。
+        范围在cursor所在的事务（即导出快照的事务）中计算；第一个范围不设下限、
+        最后一个不设上限，不会漏掉任何行。
+
+        Returns:
+            dict: 'method'为'primary_key'或'ctid'；'queries'为按键顺序排列、参数
+                  已内联的SQL文本；'features'在空间连接时为临时要素表的
+                  (字段类型, COPY数据)，否则为None
+        """
+        source = self.query_source
+        if not source:
+            raise ValueError("没有查询结果可导出！")
+        if 'sql' in source:
+            raise ValueError("自定义SQL的结果不支持并行导出")
+        table_name = source['table']
+        table = self.get_table_catalog(table_name) or {}
+        table_id = sql.Identifier(self.schema, table_name)
+        key_columns = table.get('primary_key') or []
+        if len(key_columns) == 1 and table['column_types'].get(key_columns[0]) in PARTITION_KEY_TYPES:
+            method = 'primary_key'
+            key = sql.SQL('{}.{}').format(table_id, sql.Identifier(key_columns[0]))
+            cursor.execute(sql.SQL('SELECT min({key}), max({key}) FROM {table}').format(key=key, table=table_id))
+            low, high = cursor.fetchone()
+            low, high = (low, high) if low is not None else (0, 0)
+            bounds = [low + (high - low + 1) * i // parts for i in range(1, parts)]
+            placeholder = sql.SQL('%s')
+        elif table.get('kind') in ('r', 'm', 'p'):
+            method = 'ctid'
+            key = sql.SQL('{}.ctid').format(table_id)
+            # 分区表的ctid在每个分区内独立编号，按最大分区的数据块数切分
+            cursor.execute("""
+                WITH rel AS (SELECT to_regclass(quote_ident(%s) || '.' || quote_ident(%s)) AS oid)
+                SELECT max(pg_relation_size(relid)) / current_setting('block_size')::int
+                FROM (
+                    SELECT oid AS relid FROM rel
+                    UNION ALL
+                    SELECT t.relid FROM rel, pg_partition_tree(rel.oid) t WHERE t.isleaf
+                ) relations;
+            """, (self.schema, table_name))
+            pages = cursor.fetchone()[0]
+            bounds = [f'({pages * i // parts},0)' for i in range(1, parts)]
+            placeholder = sql.SQL('%s::tid')
+        else:
+            raise ValueError("该表既没有整数主键也没有ctid（如视图），不支持并行导出")
+
+        queries = []
+        bounds = sorted(set(bounds), key=bounds.index)
+        for lower, upper in zip([None] + bounds, bounds + [None]):
+            conditions, params = [], []
+            if lower is not None:
+                conditions.append(sql.SQL('{} >= {}').format(key, placeholder))
+                params.append(lower)
+            if upper is not None:
+                conditions.append(sql.SQL('{} < {}').format(key, placeholder))
+                params.append(upper)
+            condition = sql.SQL(' AND ').join(conditions) if conditions else sql.SQL('TRUE')
+            query, query_params, _ = self._source_query(geometry_format, (condition, params))
+            queries.append(cursor.mogrify(query, query_params).decode(pg_encodings[cursor.connection.encoding]))
+
+        features = None
+        if source.get('spatial_join'):
+            kind, payload, _ = self._feature_payload(source['geometry_column'] or 'local_geometry')
+            features = (kind, payload)
+        return {'method': method, 'queries': queries, 'features': features}
+
+    def clear_result_cache(self):
+        """清空查询结果缓存"""
+        self.result_cache.clear()
+
+    def _stream_query(self, query, itersize=DEFAULT_ITERSIZE, statement_timeout=None,
+                      query_key=DEFAULT_QUERY_KEY, params=None, setup=None):
+        """使用服务器端命名游标执行查询，按批返回结果
+
+        客户端游标会在返回第一行之前把整个结果集读入内存，命名游标则由
+        服务器保存结果，每次只拉取itersize行，内存占用与结果集大小无关。
+
+        生成器在整个迭代期间独占一个连接池连接，迭代结束或被关闭时归还。
+
+        Returns:
+            dict: 'columns'为字段名列表，'batches'为逐批产出行列表的生成器，
+                  'row_count'为None（流式模式下事先无法得知总行数）
+        """
+        conn = self._checkout()
+        self._register_running(query_key, conn)
+        cursor = conn.cursor(name=f"dbquery_stream_{next(self._stream_counter)}")
+        cursor.itersize = itersize
+        try:
+            if setup:
+                setup(conn)
+            with conn.cursor() as setup_cursor:
+                self._apply_statement_timeout(setup_cursor, statement_timeout)
+            cursor.execute(query, params)
+            # 命名游标在第一次取数后才有字段描述
+            first_batch = cursor.fetchmany(itersize)
+            columns = [desc[0] for desc in cursor.description]
+        except Exception:
+            if not conn.closed:
+                cursor.close()
+            self._unregister_running(query_key, conn)
+            self._release(conn)
+            raise
+
+        def batches():
+            try:
+                # 生成器在返回前先启动到这里，未迭代就close()时也会执行finally归还连接
+                yield
+                batch = first_batch
+                while batch:
+                    yield batch
+                    batch = cursor.fetchmany(itersize)
+            finally:
+                if not cursor.closed and not conn.closed:
+                    cursor.close()
+                self._unregister_running(query_key, conn)
+                self._release(conn)
+
+        batch_iterator = batches()
+        next(batch_iterator)
+        return {
+            'columns': columns,
+            'batches': batch_iterator,
+            'row_count': None
+        }
 
     def export_to_excel(self, file_path):
         """导出查询结果为Excel文件"""
@@ -113,116 +1542,240 @@ class DatabaseManager:
             return False, "没有查询结果可导出！"
         
         try:
-            columns = [desc[0] for desc in self.cursor.description]
-            df = pd.DataFrame(self.query_result, columns=columns)
+            df = pd.DataFrame(self.query_result, columns=self.query_columns)
             df.to_excel(file_path, index=False)
             return True, f"导出成功！\n文件保存到: {file_path}"
         except Exception as e:
             return False, f"导出失败: {e}"
 
     def load_spatial_file(self, file_path):
-        """加载空间文件"""
+        """加载空间文件
+
+        返回第一个要素的几何用于单几何过滤；全部要素保存在spatial_features中，
+        供空间连接模式使用。
+        """
         try:
             gdf = gpd.read_file(file_path)
             if len(gdf) > 0:
-                return True, gdf.geometry.iloc[0], f"已加载: {file_path.split('/')[-1]}"
+                self.spatial_features = gdf
+                self.spatial_source = file_path
+                self._feature_payloads = {}
+                self._projections = {}
+                if gdf.crs is None:
+                    crs_name = "未知坐标系"
+                else:
+                    epsg = gdf.crs.to_epsg()
+                    crs_name = f"EPSG:{epsg}" if epsg else gdf.crs.name
+                return True, gdf.geometry.iloc[0], \
+                    f"已加载: {file_path.split('/')[-1]}（{len(gdf)} 个要素，{crs_name}）"
             else:
                 return False, None, "空间文件为空！"
         except Exception as e:
             return False, None, f"加载空间文件失败: {e}"
 
-    def get_table_info(self, table_name):
-        """获取表的详细信息"""
-        if not self.cursor:
+    def get_table_info(self, table_name, exact=False):
+        """获取表的详细信息
+
+        Args:
+            table_name: 表名
+            exact: 是否执行COUNT(*)精确计数。默认只读取统计信息中的估算行数，
+                   大表上的COUNT(*)需要全表扫描，应在后台按需执行
+
+        Returns:
+            dict: 'columns'为字段信息，'row_count'为行数（估算时可能为None），
+                  'row_count_estimated'表示行数是否为估算值
+        """
+        if not self.pool:
             return None
         
         try:
-            # 获取表结构信息
-            self.cursor.execute(f"""
-                SELECT column_name, data_type, is_nullable
-                FROM information_schema.columns
-                WHERE table_name = '{table_name}'
-                ORDER BY ordinal_position;
-            """)
-            columns = self.cursor.fetchall()
+            table = self.get_table_catalog(table_name)
+            if table is not None:
+                columns = table['columns']
+            else:
+                with self.pooled_cursor() as cursor:
+                    # 获取表结构信息
+                    cursor.execute(f"""
+                        SELECT column_name, data_type, is_nullable
+                        FROM information_schema.columns
+                        WHERE table_name = '{table_name}'
+                        AND table_schema = '{self.schema}'
+                        ORDER BY ordinal_position;
+                    """)
+                    columns = cursor.fetchall()
             
             # 获取表行数
-            self.cursor.execute(f"SELECT COUNT(*) FROM {table_name};")
-            row_count = self.cursor.fetchone()[0]
+            if exact:
+                row_count = self.count_rows(table_name)
+            else:
+                row_count = self.estimate_row_count(table_name)
             
             return {
                 'columns': columns,
-                'row_count': row_count
+                'row_count': row_count,
+                'row_count_estimated': not exact
             }
         except Exception as e:
             return None
 
+    def estimate_row_count(self, table_name, cached=True):
+        """根据统计信息估算表的行数，不扫描表
+
+        与查询规划器的做法相同：用pg_class.reltuples/relpages得到每页行数，
+        再乘以表当前的页数；表从未被VACUUM/ANALYZE过时退回到
+        pg_stat_user_tables.n_live_tup。无法估算时返回None。
+        cached=True时优先使用元数据快照中的估算值，不访问数据库。
+        """
+        if not self.pool:
+            return None
+        if cached:
+            table = self.get_table_catalog(table_name)
+            if table is not None and table['row_estimate'] is not None:
+                return table['row_estimate']
+        try:
+            with self.pooled_cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.reltuples, c.relpages,
+                           pg_relation_size(c.oid) / current_setting('block_size')::int,
+                           s.n_live_tup
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                    WHERE n.nspname = %s AND c.relname = %s;
+                """, (self.schema, table_name))
+                row = cursor.fetchone()
+        except Exception:
+            return None
+        if not row:
+            return None
+        reltuples, relpages, current_pages, live_tuples = row
+        if reltuples is not None and reltuples >= 0 and relpages:
+            return int(round(reltuples / relpages * max(current_pages, 1)))
+        if live_tuples is not None:
+            return int(live_tuples)
+        if reltuples is not None and reltuples >= 0:
+            return int(reltuples)
+        return None
+
+    def count_rows(self, table_name, statement_timeout=None, query_key='count'):
+        """精确统计表的行数（全表扫描，应在后台线程中调用）"""
+        if not self.pool:
+            return None
+        query = sql.SQL('SELECT COUNT(*) FROM {}').format(sql.Identifier(self.schema, table_name))
+        return self._run_query(query, statement_timeout, query_key)['data'][0][0]
+
+    def _explain_rows(self, query, params=None):
+        """用EXPLAIN获取规划器对查询结果行数的估算，不实际执行查询"""
+        if isinstance(query, str):
+            query = sql.SQL(query)
+        with self.pooled_cursor() as cursor:
+            cursor.execute(sql.SQL('EXPLAIN (FORMAT JSON) ') + query, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def estimate_query_rows(self, filter_condition=None, spatial_geom=None, geometry_column=None,
+                            spatial_predicate='intersects', distance=None):
+        """估算带过滤条件的查询将返回的行数，参数与execute_query相同，无法估算时返回None"""
+        if not self.current_table or not self.pool:
+            return None
+        try:
+            return self._explain_rows(*self.build_query(filter_condition, spatial_geom, geometry_column,
+                                                        spatial_predicate=spatial_predicate,
+                                                        distance=distance))
+        except Exception:
+            return None
+
+    def estimate_custom_sql_rows(self, sql_text):
+        """估算自定义SQL将返回的行数，无法估算（如非查询语句）时返回None"""
+        if not self.pool:
+            return None
+        try:
+            return self._explain_rows(sql_text.strip().rstrip(';'))
+        except Exception:
+            return None
+
     def get_geometry_columns(self, table_name):
-        """获取表中的几何字段列表"""
-        if not self.cursor:
+        """获取表中的几何字段列表
+
+        优先从元数据快照中获取（不访问数据库）；表不在快照中时（如快照加载后
+        新建的表）再逐个查询PostGIS视图并探测USER-DEFINED字段。
+        """
+        if not self.pool:
             return []
         
+        table = self.get_table_catalog(table_name)
+        if table is not None:
+            return [column['name'] for column in table['geometry_columns']]
+        
         try:
             # 方法1: 查询PostGIS的geometry_columns视图（最可靠）
-            self.cursor.execute(f"""
-                SELECT f_geometry_column 
-                FROM geometry_columns 
-                WHERE f_table_name = '{table_name}'
-                AND f_table_schema = '{self.schema}';
-            """)
-            geometry_columns = [row[0] for row in self.cursor.fetchall()]
+            with self.pooled_cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT f_geometry_column 
+                    FROM geometry_columns 
+                    WHERE f_table_name = '{table_name}'
+                    AND f_table_schema = '{self.schema}';
+                """)
+                geometry_columns = [row[0] for row in cursor.fetchall()]
             if geometry_columns:
                 return geometry_columns
             
             # 方法2: 查询geography_columns视图
             try:
-                self.cursor.execute(f"""
-                    SELECT f_geography_column 
-                    FROM geography_columns 
-                    WHERE f_table_name = '{table_name}'
-                    AND f_table_schema = '{self.schema}';
-                """)
-                geography_columns = [row[0] for row in self.cursor.fetchall()]
+                with self.pooled_cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT f_geography_column 
+                        FROM geography_columns 
+                        WHERE f_table_name = '{table_name}'
+                        AND f_table_schema = '{self.schema}';
+                    """)
+                    geography_columns = [row[0] for row in cursor.fetchall()]
                 if geography_columns:
                     return geography_columns
             except:
                 pass
             
             # 方法3: 检查所有USER-DEFINED类型的字段
-            self.cursor.execute(f"""
-                SELECT column_name 
-                FROM information_schema.columns
-                WHERE table_name = '{table_name}' 
-                AND data_type = 'USER-DEFINED'
-                ORDER BY ordinal_position;
-            """)
-            user_defined_columns = [row[0] for row in self.cursor.fetchall()]
+            with self.pooled_cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT column_name 
+                    FROM information_schema.columns
+                    WHERE table_name = '{table_name}' 
+                    AND data_type = 'USER-DEFINED'
+                    ORDER BY ordinal_position;
+                """)
+                user_defined_columns = [row[0] for row in cursor.fetchall()]
             
             # 对USER-DEFINED字段进行几何类型验证
+            # 每次探测单独借出连接，失败的语句不会让后续探测落入已中止的事务
             geometry_columns = []
             for column in user_defined_columns:
                 try:
                     # 尝试检查是否为几何类型
-                    self.cursor.execute(f"""
-                        SELECT ST_GeometryType({column}) 
-                        FROM {self.schema}.{table_name} 
-                        WHERE {column} IS NOT NULL 
-                        LIMIT 1;
-                    """)
-                    geom_type = self.cursor.fetchone()
+                    with self.pooled_cursor() as cursor:
+                        cursor.execute(f"""
+                            SELECT ST_GeometryType({column}) 
+                            FROM {self.schema}.{table_name} 
+                            WHERE {column} IS NOT NULL 
+                            LIMIT 1;
+                        """)
+                        geom_type = cursor.fetchone()
                     if geom_type and geom_type[0]:
                         geometry_columns.append(column)
                 except:
                     # 如果ST_GeometryType失败，尝试其他方法
                     try:
                         # 检查字段值是否可以转换为几何类型
-                        self.cursor.execute(f"""
-                            SELECT {column}::geometry 
-                            FROM {self.schema}.{table_name} 
-                            WHERE {column} IS NOT NULL 
-                            LIMIT 1;
-                        """)
-                        result = self.cursor.fetchone()
+                        with self.pooled_cursor() as cursor:
+                            cursor.execute(f"""
+                                SELECT {column}::geometry 
+                                FROM {self.schema}.{table_name} 
+                                WHERE {column} IS NOT NULL 
+                                LIMIT 1;
+                            """)
+                            result = cursor.fetchone()
                         if result:
                             geometry_columns.append(column)
                     except:
@@ -232,23 +1785,203 @@ class DatabaseManager:
         except Exception as e:
             return []
 
-    def execute_custom_sql(self, sql):
-        """执行自定义SQL查询"""
-        if not self.cursor:
+    def check_spatial_indexes(self, table_name):
+        """检查表中各几何字段的空间索引和统计信息
+
+        几何字段来自get_geometry_columns，索引直接读取pg_index/pg_am（不使用
+        元数据快照，刚建好的索引能立即反映）。只有以该字段为首列的GIST/
+        SP-GIST/BRIN索引才能加速空间过滤；CREATE INDEX CONCURRENTLY中断后
+        留下的无效索引单独列出。
+
+        Returns:
+            tuple: (success, 检查结果或错误信息)。检查结果包含indexable（视图等
+                   不能建索引）、can_create_index（当前用户是否为表的所有者，可建
+                   索引和ANALYZE）、stale_stats、last_analyze、modified_since_analyze、
+                   live_rows，以及columns：每个几何字段的name、indexes、
+                   invalid_indexes和needs_index
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            geometry_columns = self.get_geometry_columns(table_name)
+            with self.pooled_cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.oid, c.relkind, pg_has_role(c.relowner, 'USAGE'),
+                           GREATEST(s.last_analyze, s.last_autoanalyze),
+                           s.n_mod_since_analyze, s.n_live_tup
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                    WHERE n.nspname = %s AND c.relname = %s;
+                """, (self.schema, table_name))
+                row = cursor.fetchone()
+                if not row:
+                    return False, f"表不存在: {table_name}"
+                table_oid, kind, is_owner, last_analyze, modified, live_rows = row
+                cursor.execute("""
+                    SELECT a.attname, ic.relname, i.indisvalid
+                    FROM pg_index i
+                    JOIN pg_class ic ON ic.oid = i.indexrelid
+                    JOIN pg_am am ON am.oid = ic.relam
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                    WHERE i.indrelid = %s AND am.amname = ANY(%s) AND a.attname = ANY(%s)
+                    ORDER BY ic.relname;
+                """, (table_oid, list(SPATIAL_INDEX_METHODS), geometry_columns))
+                index_rows = cursor.fetchall()
+        except Exception as e:
+            return False, f"检查空间索引失败: {e}"
+
+        indexable = kind in ('r', 'p', 'm')
+        modified = modified or 0
+        live_rows = live_rows or 0
+        # 从未ANALYZE过（且有数据）或修改量超过阈值
+        stale_stats = indexable and (
+            (last_analyze is None and modified + live_rows > 0)
+            or modified > STALE_STATS_THRESHOLD + STALE_STATS_RATIO * live_rows
+        )
+        columns = []
+        for name in geometry_columns:
+            indexes = [index for column, index, valid in index_rows if column == name and valid]
+            invalid = [index for column, index, valid in index_rows if column == name and not valid]
+            columns.append({
+                'name': name,
+                'indexes': indexes,
+                'invalid_indexes': invalid,
+                'needs_index': indexable and not indexes
+            })
+        return True, {
+            'indexable': indexable,
+            'can_create_index': indexable and is_owner,
+            'stale_stats': stale_stats,
+            'last_analyze': last_analyze,
+            'modified_since_analyze': modified,
+            'live_rows': live_rows,
+            'columns': columns
+        }
+
+    def create_spatial_index(self, table_name, geometry_column, query_key=INDEX_QUERY_KEY):
+        """为几何字段创建GIST索引并ANALYZE（耗时较长，应在后台线程中调用）
+
+        普通表和物化视图使用CREATE INDEX CONCURRENTLY，建索引期间不阻塞表的
+        读写；分区表不支持CONCURRENTLY，使用普通CREATE INDEX。CONCURRENTLY
+        不能在事务块中执行，因此连接临时切换为autocommit。之前中断留下的
+        同名无效索引会先被删除。进度可用get_index_progress(query_key)读取，
+        cancel_query(query_key)可取消。
+        """
+        if not self.pool:
+            return False, "请先连接数据库！"
+        # PostgreSQL标识符最长63字节
+        index_name = f"{table_name}_{geometry_column}_gist".encode('utf-8')[:63].decode('utf-8', 'ignore')
+        table = sql.Identifier(self.schema, table_name)
+        catalog_table = self.get_table_catalog(table_name)
+        concurrently = catalog_table is None or catalog_table['kind'] != 'p'
+        try:
+            with self.connection() as conn:
+                self._register_running(query_key, conn)
+                conn.autocommit = True
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("""
+                            SELECT i.indisvalid
+                            FROM pg_index i
+                            JOIN pg_class ic ON ic.oid = i.indexrelid
+                            JOIN pg_namespace n ON n.oid = ic.relnamespace
+                            WHERE n.nspname = %s AND ic.relname = %s;
+                        """, (self.schema, index_name))
+                        existing = cursor.fetchone()
+                        if existing and existing[0]:
+                            return False, f"索引 {index_name} 已存在"
+                        if existing:
+                            cursor.execute(sql.SQL('DROP INDEX CONCURRENTLY {}').format(
+                                sql.Identifier(self.schema, index_name)))
+                        cursor.execute(sql.SQL('CREATE INDEX {}{} ON {} USING GIST ({})').format(
+                            sql.SQL('CONCURRENTLY ' if concurrently else ''), sql.Identifier(index_name),
+                            table, sql.Identifier(geometry_column)))
+                        cursor.execute(sql.SQL('ANALYZE {}').format(table))
+                finally:
+                    if not conn.closed:
+                        conn.autocommit = False
+                    self._unregister_running(query_key, conn)
+        except Exception as e:
+            return False, f"创建空间索引失败: {self._describe_error(query_key, e)}"
+        self.refresh_catalog()
+        return True, f"已创建空间索引 {index_name} 并更新统计信息"
+
+    def analyze_table(self, table_name, query_key=INDEX_QUERY_KEY):
+        """更新表的统计信息（ANALYZE），使规划器对空间过滤的行数估算准确"""
+        if not self.pool:
+            return False, "请先连接数据库！"
+        try:
+            query = sql.SQL('ANALYZE {}').format(sql.Identifier(self.schema, table_name))
+            with self.connection() as conn:
+                self._register_running(query_key, conn)
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(query)
+                    conn.commit()
+                finally:
+                    self._unregister_running(query_key, conn)
+        except Exception as e:
+            return False, f"更新统计信息失败: {self._describe_error(query_key, e)}"
+        self.refresh_catalog()
+        return True, f"已更新表 {table_name} 的统计信息"
+
+    def get_index_progress(self, query_key=INDEX_QUERY_KEY):
+        """读取正在创建的索引的进度（pg_stat_progress_create_index）
+
+        Returns:
+            dict: phase为当前阶段，percent为当前阶段的完成百分比（无法计算时为None）；
+                  没有正在创建的索引时返回None
+        """
+        with self._running_lock:
+            conn = self._running.get(query_key)
+        if conn is None or conn.closed:
+            return None
+        try:
+            backend_pid = conn.get_backend_pid()
+            with self.pooled_cursor() as cursor:
+                cursor.execute("""
+                    SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+                    FROM pg_stat_progress_create_index
+                    WHERE pid = %s;
+                """, (backend_pid,))
+                row = cursor.fetchone()
+        except Exception:
+            return None
+        if not row:
+            return None
+        phase, blocks_done, blocks_total, tuples_done, tuples_total = row
+        if blocks_total:
+            percent = blocks_done * 100 / blocks_total
+        elif tuples_total:
+            percent = tuples_done * 100 / tuples_total
+        else:
+            percent = None
+        return {'phase': phase, 'percent': percent}
+
+    def execute_custom_sql(self, sql, stream=False, itersize=DEFAULT_ITERSIZE, statement_timeout=None,
+                           query_key=DEFAULT_QUERY_KEY, profile=False):
+        """执行自定义SQL查询
+
+        Args:
+            sql: SQL语句
+            stream: 是否使用服务器端游标流式返回结果（仅适用于SELECT语句）
+            itersize: 流式模式下每批从服务器拉取的行数
+            statement_timeout: 语句超时秒数，None或0表示不限制
+            query_key: 查询标识，cancel_query(query_key)可取消该查询
+            profile: 是否采集执行计划和各阶段耗时（见_run_query）。不能使用
+                auto_explain时查询执行两次，且不支持修改数据的语句
+        """
+        if not self.pool:
             return False, "请先连接数据库！"
         
         try:
+            if stream:
+                # DECLARE ... CURSOR FOR 中不能带结尾分号
+                return True, self._stream_query(sql.strip().rstrip(';'), itersize, statement_timeout, query_key)
+
             # 执行自定义SQL
-            self.cursor.execute(sql)
-            
-            # 获取结果
-            self.query_result = self.cursor.fetchall()
-            columns = [desc[0] for desc in self.cursor.description]
-            
-            return True, {
-                'columns': columns,
-                'data': self.query_result,
-                'row_count': len(self.query_result)
-            }
+            return True, self._keep_result(self._run_query(sql, statement_timeout, query_key, profile=profile),
+                                           {'sql': sql})
         except Exception as e:
-            return False, f"SQL执行失败: {e}"
+            return False, f"SQL执行失败: {self._describe_error(query_key, e)}"
@@ -1,18 +1,143 @@
 # -*- coding: utf-8 -*-
 """
 Database Export Module - Fixed Version
-Handles data export to Excel, Shapefile, GeoJSON formats
+Handles data export to Excel, Shapefile, GeoJSON, CSV, GeoParquet,
+FlatGeobuf and GeoPackage formats
 """
 
-import pandas as pd
+import io
+import os
+import threading
+import time
+
 import geopandas as gpd
-from shapely import wkt
+import pandas as pd
+
+from database import DEFAULT_ITERSIZE, result_to_geodataframe
+from parallel_export import PARALLEL_EXPORT_TYPES, export_parallel
+from resumable_export import DEFAULT_CHUNK_ROWS, RESUMABLE_EXPORT_TYPES, export_resumable
+from stream_writers import (EXCEL_MAX_CELL_CHARS, FANOUT_EXPORT_TYPES, SHAPEFILE_SIDECARS, CSVWriter,
+                            FanOutWriter, create_writer)
+
+
+# Display names of the formats written through Arrow record batches
+ARROW_EXPORT_NAMES = {'geoparquet': 'GeoParquet', 'flatgeobuf': 'FlatGeobuf', 'gpkg': 'GeoPackage'}
+
+# Query key of export queries, for DatabaseManager.cancel_query
+EXPORT_QUERY_KEY = 'export'
+
+
+class ExportCancelled(Exception):
+    """Raised inside an export whose ExportProgress was cancelled"""
+
+
+class ExportProgress:
+    """
+    Progress of one export job, updated by the export thread and read by the UI
+    
+    Counters are plain attributes: only the export thread updates them, and
+    readers only need an approximate, monotonic view.
+    """
+    
+    def __init__(self, total_rows=None):
+        """
+        Args:
+            total_rows: Expected number of rows, None when unknown
+        """
+        self.total_rows = total_rows
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.started = time.monotonic()
+        self._cancel_event = threading.Event()
+    
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+    
+    def cancel(self):
+        self._cancel_event.set()
+    
+    def check(self):
+        """Raise ExportCancelled once the job was cancelled"""
+        if self.cancelled:
+            raise ExportCancelled("Export cancelled")
+    
+    def add(self, fetched=0, written=0):
+        self.rows_fetched += fetched
+        self.rows_written += written
+    
+    def snapshot(self):
+        """
+        Current progress
+        
+        Returns:
+            dict: rows_fetched, rows_written, total_rows, elapsed (seconds),
+                  rate (rows fetched per second), percent and eta (seconds),
+                  the last two None while the total is unknown
+        """
+        elapsed = time.monotonic() - self.started
+        rate = self.rows_fetched / elapsed if elapsed > 0 else 0
+        percent = eta = None
+        if self.total_rows:
+            percent = min(self.rows_fetched * 100 / self.total_rows, 100)
+            if rate and self.total_rows > self.rows_fetched:
+                eta = (self.total_rows - self.rows_fetched) / rate
+        return {
+            'rows_fetched': self.rows_fetched,
+            'rows_written': self.rows_written,
+            'total_rows': self.total_rows,
+            'elapsed': elapsed,
+            'rate': rate,
+            'percent': percent,
+            'eta': eta,
+        }
+
+
+class ProgressFile(io.TextIOBase):
+    """
+    Text file wrapper that reports the lines COPY writes to it as exported rows
+    
+    Derives from TextIOBase so copy_expert decodes the data before writing.
+    """
+    
+    def __init__(self, file_obj, progress, header_lines=1):
+        self.file_obj = file_obj
+        self.progress = progress
+        self.header_lines = header_lines
+    
+    def write(self, data):
+        lines = data.count('\n')
+        header = min(lines, self.header_lines)
+        self.header_lines -= header
+        self.progress.add(lines - header, lines - header)
+        return self.file_obj.write(data)
+
+
+def remove_output(file_path):
+    """Delete a partially written export, including Shapefile sidecar files"""
+    paths = [file_path]
+    if file_path.lower().endswith('.shp'):
+        paths += [file_path[:-4] + suffix for suffix in SHAPEFILE_SIDECARS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_summary(message, rows, files, skipped=0):
+    """
+    Result of a successful export_data / export_many call
+    
+    Returns:
+        dict: 'message' (text for the user), 'rows' written, 'files'
+              written and 'skipped' rows without geometry
+    """
+    return {'message': message, 'rows': rows, 'files': list(files), 'skipped': skipped}
 
 
 class DataExporter:
     """Data exporter class for various formats"""
     
-    def __init__(self, db_manager, get_query_input, get_geom_field, get_spatial_geom):
+    def __init__(self, db_manager, get_query_input, get_geom_field, get_spatial_geom, get_spatial_options=None):
         """
         Initialize exporter
         
@@ -21,264 +146,546 @@ class DataExporter:
             get_query_input: Function to get query input
             get_geom_field: Function to get geometry field
             get_spatial_geom: Function to get spatial geometry
+            get_spatial_options: Function returning extra spatial filter keyword
+                arguments for execute_query (spatial_join, spatial_predicate, distance)
         """
         self.db_manager = db_manager
         self.get_query_input = get_query_input
         self.get_geom_field = get_geom_field
         self.get_spatial_geom = get_spatial_geom
+        self.get_spatial_options = get_spatial_options or (lambda: {})
     
-    def export_to_excel(self, query_result, status_bar_callback=None):
-        """Export to Excel, convert geometry field to WKT format"""
-        if not query_result:
+    def expected_rows(self):
+        """
+        Number of rows an export of the current result will write: the browsed
+        table's planner estimate when paging, otherwise the fetched result size
+        
+        Returns:
+            int or None when unknown
+        """
+        if self.db_manager.query_page is not None:
+            return self.db_manager.estimate_row_count(self.db_manager.query_source['table'])
+        if self.db_manager.query_result is not None:
+            return len(self.db_manager.query_result)
+        return None
+    
+    def _has_result(self, query_result):
+        """
+        Whether there is a result to export: fetched rows, or for streamed
+        formats, which re-run the query, one recorded by set_query_source
+        """
+        return bool(query_result) or (self.db_manager.query_result is None
+                                      and self.db_manager.query_source is not None)
+    
+    def cancel_export(self, progress):
+        """
+        Cancel a running export: later batches are skipped and the statement
+        currently running on the export connection is interrupted
+        """
+        progress.cancel()
+        self.db_manager.cancel_query(EXPORT_QUERY_KEY)
+    
+    def _fetch_geodataframe(self, query_result, progress=None):
+        """
+        Build a GeoDataFrame from the rows the last query already fetched
+        
+        Geometry arrives as EWKB (binary or hex) and is decoded locally for
+        the whole result at once, keeping the SRID as the CRS. A browsed page
+        is not the whole result; exports of a browsed table stream it instead.
+        
+        Returns:
+            tuple: (success, GeoDataFrame - or a plain DataFrame when the
+                   result has no geometry column - or error message)
+        """
+        if not query_result or self.db_manager.query_columns is None:
             return False, "No query results to export!"
         
-        # Get current geometry field
+        columns = list(self.db_manager.query_columns)
         geom_field = self.get_geom_field()
+        if geom_field not in columns:
+            geom_field = None
+        
+        if self.db_manager.query_page is not None:
+            return False, "A browsed page is not the whole table; export it with export_data"
+        rows = self.db_manager.query_result
+        if progress:
+            progress.add(fetched=len(rows))
+        
         if not geom_field:
-            return False, "Please select geometry field first!"
+            return True, pd.DataFrame(rows, columns=columns)
+        return True, result_to_geodataframe(columns, rows, geom_field)
+    
+    def export_to_excel(self, file_path, status_bar_callback=None, progress=None):
+        """
+        Stream the current result to an .xlsx workbook with flat memory use
         
-        # Get current table info
-        current_table = self.db_manager.current_table
-        if not current_table:
-            return False, "Please select table first!"
+        Geometry is written as WKT. Rows beyond Excel's sheet limit continue
+        on new sheets and oversized values go to a side sheet (see ExcelWriter).
         
-        try:
-            # Re-execute query with WKT conversion
-            query_content = self.get_query_input()
+        Returns:
+            tuple: (success, ExcelWriter or error message)
+        """
+        if status_bar_callback:
+            status_bar_callback(text="Streaming Excel...")
+        writers = []
+        
+        def make_writer(columns):
+            writers.append(create_writer('excel', file_path, columns, self.get_geom_field()))
+            return writers[-1]
+        
+        success, result = self._stream_to_writer(make_writer, progress)
+        if not success:
+            return False, f"Excel export failed: {result}"
+        return True, writers[0]
+    
+    def _fetch_spatial_result(self, query_result, progress=None):
+        """Like _fetch_geodataframe, but the result must contain geometry"""
+        success, result = self._fetch_geodataframe(query_result, progress)
+        if success and not isinstance(result, gpd.GeoDataFrame):
+            return False, "Query result has no geometry column, please select the geometry field first!"
+        return success, result
+    
+    def export_to_shapefile(self, query_result, file_path, status_bar_callback=None, progress=None):
+        """
+        Export to Shapefile format
+        
+        A complete result is written from the fetched rows. A browsed page
+        stands for the whole table, which is streamed into the file batch by
+        batch (see ShapefileWriter) instead of being collected in memory.
+        
+        Returns:
+            tuple: (success, exported row count or error message)
+        """
+        if status_bar_callback:
+            status_bar_callback(text="Preparing Shapefile data...")
+        if self.db_manager.query_page is not None:
             geom_field = self.get_geom_field()
-            
-            # Execute query with WKT conversion
-            success, result = self.db_manager.execute_query(
-                filter_condition=query_content if query_content else None,
-                spatial_geom=self.get_spatial_geom(),
-                geometry_column=geom_field,
-                convert_wkt=True  # Enable WKT conversion
-            )
-            
+            if not geom_field:
+                return False, "Please select geometry field first!"
+            success, result = self._stream_to_writer(
+                lambda columns: create_writer('shapefile', file_path, columns, geom_field), progress)
             if not success:
-                return False, result
-            
-            # Get new query result (with WKT field)
-            columns = result['columns']
-            data = result['data']
-            
-            # Find WKT column name
-            wkt_column_name = f"{geom_field}_wkt"
-            if wkt_column_name not in columns:
-                return False, f"WKT conversion result column not found: {wkt_column_name}"
-            
-            # Simplified export logic: create DataFrame, replace geometry column with WKT
-            df = pd.DataFrame(data, columns=columns)
-            
-            # Replace geometry column with WKT values
-            df[geom_field] = df[wkt_column_name]
-            
-            # Drop WKT column
-            df.drop(columns=[wkt_column_name], inplace=True)
-            
-            if status_bar_callback:
-                status_bar_callback(text=f"Exporting Excel, {len(data)} records...")
-            
-            return True, df
-            
+                return False, f"Shapefile export failed: {result}"
+            return True, result
+        
+        try:
+            success, result = self._fetch_spatial_result(query_result, progress)
         except Exception as e:
-            return False, f"Export failed: {e}"
+            return False, f"Shapefile export failed: {e}"
+        if not success:
+            return False, result
+        try:
+            if progress:
+                progress.check()
+            result.to_file(file_path, encoding='utf-8')
+        except ExportCancelled as e:
+            return False, str(e)
+        except Exception as e:
+            remove_output(file_path)
+            return False, f"Shapefile file save failed: {e}"
+        if progress:
+            progress.rows_written = len(result)
+        return True, len(result)
     
-    def export_to_shapefile(self, query_result, status_bar_callback=None):
-        """Export to Shapefile format"""
-        if not query_result:
-            return False, "No query results to export!"
+    def export_to_csv(self, file_path, delimiter=',', geometry_encoding='wkt', status_bar_callback=None,
+                      progress=None):
+        """
+        Write the current result to CSV/TSV
+        
+        A result the last query fetched completely is written from memory.
+        Otherwise (a browsed table, or a query recorded by set_query_source)
+        the query is streamed with a server-side COPY: PostgreSQL formats the
+        rows and they are written to the file as they arrive, so memory use
+        stays constant however many rows are exported.
+        
+        Args:
+            delimiter: Field delimiter (',' for CSV, '\t' for TSV)
+            geometry_encoding: 'wkt' for WKT text, 'hex' for hex EWKB
+        
+        Returns:
+            tuple: (success, exported row count or error message)
+        """
+        if status_bar_callback:
+            status_bar_callback(text="Exporting CSV...")
+        if self._result_complete():
+            geom_field = self.get_geom_field()
+            return self._stream_to_writer(
+                lambda columns: CSVWriter(file_path, columns, geom_field, delimiter, geometry_encoding), progress)
+        try:
+            with open(file_path, 'w', encoding='utf-8', newline='') as f:
+                success, result = self.db_manager.copy_result_to(ProgressFile(f, progress) if progress else f,
+                                                                 delimiter, geometry_encoding, EXPORT_QUERY_KEY)
+        except Exception as e:
+            success, result = False, f"CSV export failed: {e}"
+        if not success:
+            remove_output(file_path)
+        elif progress:
+            progress.rows_written = result
+        return success, result
+    
+    def _result_complete(self):
+        """Whether the last query fetched the whole result, which exports then write from memory"""
+        return self.db_manager.query_page is None and self.db_manager.query_result is not None
+    
+    def _result_batches(self, itersize=DEFAULT_ITERSIZE):
+        """
+        Batches of the current result: slices of the fetched rows when the
+        last query returned the whole result, otherwise the query run again
+        through a server-side cursor (see DatabaseManager.stream_result)
+        
+        Returns:
+            tuple: (success, dict with 'columns' and 'batches' or error message)
+        """
+        if self._result_complete():
+            rows = self.db_manager.query_result
+            batches = (rows[start:start + itersize] for start in range(0, len(rows), itersize))
+            return True, {'columns': list(self.db_manager.query_columns), 'batches': batches}
+        return self.db_manager.stream_result(query_key=EXPORT_QUERY_KEY)
+    
+    def _stream_to_writer(self, make_writer, progress=None):
+        """
+        Feed every batch of the current result (see _result_batches) to the
+        writer returned by make_writer(columns); a browsed table or a recorded
+        query is run once through a server-side cursor
+        
+        With a progress, fetched and written rows are reported after every
+        batch, and a cancelled job stops before the next batch (a running
+        fetch is interrupted through cancel_export); the partial file is
+        removed by writer.abort().
+        
+        Returns:
+            tuple: (success, exported row count or error message)
+        """
+        success, result = self._result_batches()
+        if not success:
+            return False, result
+        batches = result['batches']
+        try:
+            writer = make_writer(result['columns'])
+        except Exception as e:
+            batches.close()
+            return False, str(e)
+        try:
+            for batch in batches:
+                if progress:
+                    progress.check()
+                    progress.add(fetched=len(batch))
+                writer.write_batch(batch)
+                if progress:
+                    progress.rows_written = writer.rows_written
+            writer.close()
+        except Exception as e:
+            writer.abort()
+            if progress and progress.cancelled:
+                return False, "Export cancelled"
+            return False, str(e)
+        finally:
+            batches.close()
+        return True, writer.rows_written
+    
+    def export_to_geojson_stream(self, file_path, sequence=False, precision=None, status_bar_callback=None,
+                                 progress=None):
+        """
+        Stream the current result to GeoJSON or GeoJSONSeq with flat memory use
+        
+        Compression is chosen from the file suffix (.gz or .zst).
+        
+        Args:
+            sequence: Write newline-delimited GeoJSONSeq instead of a FeatureCollection
+            precision: Number of coordinate decimals to keep, None for full precision
+        
+        Returns:
+            tuple: (success, exported row count or error message)
+        """
+        geom_field = self.get_geom_field()
+        if not geom_field:
+            return False, "Please select geometry field first!"
+        if status_bar_callback:
+            status_bar_callback(text="Streaming GeoJSON...")
+        success, result = self._stream_to_writer(
+            lambda columns: create_writer('geojsonseq' if sequence else 'geojson', file_path, columns, geom_field,
+                                          precision=precision),
+            progress)
+        if not success:
+            return False, f"GeoJSON export failed: {result}"
+        return True, result
+    
+    def export_to_arrow_stream(self, export_type, file_path, status_bar_callback=None, progress=None):
+        """
+        Stream the current result to GeoParquet, FlatGeobuf or GeoPackage
+        
+        Result batches (see _result_batches) are converted to Arrow record
+        batches and written as they arrive: GeoParquet as row groups with a
+        bbox covering column, FlatGeobuf with its packed R-tree spatial index
+        and GeoPackage with bulk inserts in large transactions.
         
-        # Get current geometry field
+        Args:
+            export_type: 'geoparquet', 'flatgeobuf' or 'gpkg'
+        
+        Returns:
+            tuple: (success, writer or error message)
+        """
         geom_field = self.get_geom_field()
         if not geom_field:
             return False, "Please select geometry field first!"
+        if status_bar_callback:
+            status_bar_callback(text=f"Streaming {ARROW_EXPORT_NAMES[export_type]}...")
+        
+        writers = []
         
-        # Get current table info
-        current_table = self.db_manager.current_table
-        if not current_table:
-            return False, "Please select table first!"
+        def make_writer(columns):
+            writers.append(create_writer(export_type, file_path, columns, geom_field))
+            return writers[-1]
         
+        success, result = self._stream_to_writer(make_writer, progress)
+        if not success:
+            return False, f"{ARROW_EXPORT_NAMES[export_type]} export failed: {result}"
+        return True, writers[0]
+    
+    def export_to_parallel(self, export_type, file_path, workers, merge=True, precision=None,
+                           status_bar_callback=None, progress=None):
+        """
+        Export the current result in key-range partitions with several worker
+        processes reading one exported snapshot (see parallel_export)
+        
+        Args:
+            workers: Number of partitions and worker processes
+            merge: Merge the parts into file_path instead of keeping ordered part files
+        
+        Returns:
+            tuple: (success, result dict of export_parallel or error message)
+        """
+        geom_field = self.get_geom_field()
+        if not geom_field:
+            return False, "Please select geometry field first!"
+        if status_bar_callback:
+            status_bar_callback(text=f"Exporting with {workers} parallel workers...")
         try:
-            # Re-execute query with WKT conversion
-            query_content = self.get_query_input()
-            geom_field = self.get_geom_field()
-            
-            # Execute query with WKT conversion
-            success, result = self.db_manager.execute_query(
-                filter_condition=query_content if query_content else None,
-                spatial_geom=self.get_spatial_geom(),
-                geometry_column=geom_field,
-                convert_wkt=True  # Enable WKT conversion
-            )
-            
-            if not success:
-                return False, result
-            
-            # Get new query result (with WKT field)
-            columns = result['columns']
-            data = result['data']
-            
-            # Find WKT column name
-            wkt_column_name = f"{geom_field}_wkt"
-            if wkt_column_name not in columns:
-                return False, f"WKT conversion result column not found: {wkt_column_name}"
-            
-            if status_bar_callback:
-                status_bar_callback(text="Preparing Shapefile data...")
-            
-            # Create DataFrame
-            df = pd.DataFrame(data, columns=columns)
-            
-            # Convert WKT strings to geometry objects
-            geometries = []
-            for wkt_value in df[wkt_column_name]:
-                if wkt_value:
-                    try:
-                        geometry = wkt.loads(wkt_value)
-                        geometries.append(geometry)
-                    except Exception as e:
-                        print(f"WKT parsing error: {e}, WKT value: {wkt_value}")
-                        geometries.append(None)
-                else:
-                    geometries.append(None)
-            
-            # Drop WKT and original geometry columns, keep other columns
-            drop_columns = [wkt_column_name, geom_field]
-            existing_drop_columns = [col for col in drop_columns if col in df.columns]
-            if existing_drop_columns:
-                df.drop(columns=existing_drop_columns, inplace=True)
-            
-            # Create GeoDataFrame
-            gdf = gpd.GeoDataFrame(df, geometry=geometries)
-            
-            return True, gdf
-            
+            return True, export_parallel(self.db_manager, export_type, file_path, geom_field, workers, merge,
+                                         precision, progress=progress)
+        except ExportCancelled as e:
+            return False, str(e)
         except Exception as e:
-            return False, f"Shapefile export failed: {e}"
+            return False, f"Parallel export failed: {e}"
     
-    def export_to_geojson(self, query_result, status_bar_callback=None):
-        """Export to GeoJSON format"""
-        if not query_result:
-            return False, "No query results to export!"
+    def export_to_many(self, outputs, precision=None, status_bar_callback=None, progress=None):
+        """
+        Export the current result to several formats from a single query run
+        
+        Rows are fetched and their geometry decoded once; every batch is then
+        written by one thread per format (see FanOutWriter).
         
-        # Get current geometry field
+        Args:
+            outputs: List of (export_type, file_path), export types from FANOUT_EXPORT_TYPES
+            precision: Coordinate decimals for GeoJSON/GeoJSONSeq outputs
+        
+        Returns:
+            tuple: (success, FanOutWriter or error message); formats that
+                   failed while others succeeded are in FanOutWriter.results()
+        """
+        unsupported = [export_type for export_type, _ in outputs if export_type not in FANOUT_EXPORT_TYPES]
+        if unsupported:
+            return False, f"Unsupported export type: {', '.join(unsupported)}"
         geom_field = self.get_geom_field()
-        if not geom_field:
+        if not geom_field and any(export_type != 'excel' for export_type, _ in outputs):
             return False, "Please select geometry field first!"
+        if status_bar_callback:
+            status_bar_callback(text=f"Exporting {len(outputs)} formats...")
+        writers = []
         
-        # Get current table info
-        current_table = self.db_manager.current_table
-        if not current_table:
-            return False, "Please select table first!"
+        def make_writer(columns):
+            created = []
+            try:
+                for export_type, file_path in outputs:
+                    created.append(create_writer(export_type, file_path, columns, geom_field, precision=precision))
+            except Exception:
+                for writer in created:
+                    writer.abort()
+                raise
+            writers.append(FanOutWriter(created))
+            return writers[-1]
         
+        success, result = self._stream_to_writer(make_writer, progress)
+        if not success:
+            return False, f"Export failed: {result}"
+        return True, writers[0]
+    
+    def export_many(self, outputs, query_result, precision=None, status_bar_callback=None, progress=None):
+        """
+        Export to several formats at once (see export_to_many)
+        
+        Returns:
+            tuple: (success, export_summary or error message); success when at
+                   least one format was written
+        """
+        if not self._has_result(query_result):
+            return False, "No query results to export!"
+        success, result = self.export_to_many(outputs, precision, status_bar_callback, progress)
+        if not success:
+            return False, result
+        lines = []
+        for writer, error in result.results():
+            if error is not None:
+                lines.append(f"{writer.file_path}: failed - {error}")
+            else:
+                line = f"{writer.file_path}: {writer.rows_written} records"
+                if getattr(writer, 'rows_skipped', 0):
+                    line += f" ({writer.rows_skipped} without geometry skipped)"
+                lines.append(line)
+        failed = len(result.errors)
+        title = "Export successful!" if not failed else f"Export finished, {failed} of {len(lines)} formats failed"
+        written = [writer for writer, error in result.results() if error is None]
+        return True, export_summary(
+            f"{title}\nFormats: {len(lines)}\nExported {result.rows_written} records\n" + "\n".join(lines),
+            result.rows_written, [writer.file_path for writer in written],
+            max([getattr(writer, 'rows_skipped', 0) for writer in written], default=0))
+    
+    def export_to_resumable(self, export_type, file_path, chunk_rows=DEFAULT_CHUNK_ROWS, merge=False,
+                            restart=False, precision=None, status_bar_callback=None, progress=None):
+        """
+        Export the current result as numbered chunks in primary key order,
+        checkpointed in a manifest so a rerun continues where it stopped
+        (see resumable_export)
+        
+        Returns:
+            tuple: (success, result dict of export_resumable or error message)
+        """
+        geom_field = self.get_geom_field()
+        if not geom_field and export_type != 'excel':
+            return False, "Please select geometry field first!"
+        if status_bar_callback:
+            status_bar_callback(text="Exporting in resumable chunks...")
         try:
-            # Re-execute query with WKT conversion
-            query_content = self.get_query_input()
-            geom_field = self.get_geom_field()
-            
-            # Execute query with WKT conversion
-            success, result = self.db_manager.execute_query(
-                filter_condition=query_content if query_content else None,
-                spatial_geom=self.get_spatial_geom(),
-                geometry_column=geom_field,
-                convert_wkt=True  # Enable WKT conversion
-            )
-            
-            if not success:
-                return False, result
-            
-            # Get new query result (with WKT field)
-            columns = result['columns']
-            data = result['data']
-            
-            # Find WKT column name
-            wkt_column_name = f"{geom_field}_wkt"
-            if wkt_column_name not in columns:
-                return False, f"WKT conversion result column not found: {wkt_column_name}"
-            
-            if status_bar_callback:
-                status_bar_callback(text="Preparing GeoJSON data...")
-            
-            # Create DataFrame
-            df = pd.DataFrame(data, columns=columns)
-            
-            # Convert WKT strings to geometry objects
-            geometries = []
-            for wkt_value in df[wkt_column_name]:
-                if wkt_value:
-                    try:
-                        geometry = wkt.loads(wkt_value)
-                        geometries.append(geometry)
-                    except Exception as e:
-                        print(f"WKT parsing error: {e}, WKT value: {wkt_value}")
-                        geometries.append(None)
-                else:
-                    geometries.append(None)
-            
-            # Drop WKT and original geometry columns, keep other columns
-            drop_columns = [wkt_column_name, geom_field]
-            existing_drop_columns = [col for col in drop_columns if col in df.columns]
-            if existing_drop_columns:
-                df.drop(columns=existing_drop_columns, inplace=True)
-            
-            # Create GeoDataFrame
-            gdf = gpd.GeoDataFrame(df, geometry=geometries)
-            
-            # Ensure geometry column name is correct
-            gdf.rename_geometry(geom_field, inplace=True)
-            
-            return True, gdf
-            
+            return True, export_resumable(self.db_manager, export_type, file_path, geom_field, chunk_rows,
+                                          precision, merge, restart, progress=progress)
         except Exception as e:
-            print(f"GeoJSON export error: {e}")
-            return False, f"GeoJSON export failed: {e}"
+            # A cancel that interrupts the running fetch surfaces as a database error
+            if progress and progress.cancelled:
+                return False, "Export cancelled; the finished chunks are kept and the export resumes from there"
+            return False, f"Resumable export failed: {e}"
     
-    def export_data(self, export_type, query_result, file_path, status_bar_callback=None):
+    def export_data(self, export_type, query_result, file_path, status_bar_callback=None, geometry_encoding='wkt',
+                    precision=None, parallel=0, merge=True, progress=None, resumable=False,
+                    chunk_rows=DEFAULT_CHUNK_ROWS, restart=False):
         """
         General export function
         
         Args:
-            export_type: Export type ('excel', 'shapefile', 'geojson')
-            query_result: Query result data
+            export_type: Export type ('excel', 'shapefile', 'geojson', 'geojsonseq', 'csv', 'tsv',
+                'geoparquet', 'flatgeobuf', 'gpkg')
+            query_result: Query result data; streamed formats also accept None
+                after DatabaseManager.set_query_source recorded the query
             file_path: Save file path
             status_bar_callback: Status bar update callback
+            geometry_encoding: Geometry format for CSV/TSV ('wkt' or 'hex')
+            precision: Coordinate decimals for GeoJSON/GeoJSONSeq, None for full precision
+            parallel: Number of worker processes for a partitioned export of
+                'geojsonseq', 'geoparquet', 'flatgeobuf' or 'gpkg'; 0 or 1 exports
+                over a single connection
+            merge: With parallel, merge the parts into one file instead of
+                keeping ordered part files
+            progress: ExportProgress updated while exporting; cancelling it
+                (see cancel_export) stops the export and removes partial output
+            resumable: Write numbered chunks of chunk_rows rows with a
+                checkpoint manifest; calling again with the same file_path
+                resumes after the last finished chunk (restart=True starts
+                over). With merge, mergeable formats are combined into
+                file_path once complete
         
         Returns:
-            tuple: (success, message)
+            tuple: (success, export_summary or error message)
         """
+        has_result = self._has_result(query_result)
+        if resumable and export_type in RESUMABLE_EXPORT_TYPES:
+            if not has_result:
+                return False, "No query results to export!"
+            success, result = self.export_to_resumable(export_type, file_path, chunk_rows,
+                                                       merge and export_type in PARALLEL_EXPORT_TYPES, restart,
+                                                       precision, status_bar_callback, progress)
+            if not success:
+                return False, result
+            files = result['files']
+            if len(files) > 3:
+                files = [files[0], '...', files[-1], f"({len(result['files'])} files)"]
+            message = (f"Resumable export successful ({result['chunks']} chunks written in this run)!\n"
+                       f"Files: {', '.join(files)}\nExported {result['rows']} records")
+            if result['resumed']:
+                message += f"\nResumed after {result['resumed']} records exported earlier"
+            if result['skipped']:
+                message += f"\nSkipped {result['skipped']} records without geometry (not allowed with the spatial index)"
+            return True, export_summary(message, result['rows'], result['files'], result['skipped'])
+        
+        if parallel > 1 and export_type in PARALLEL_EXPORT_TYPES:
+            if not has_result:
+                return False, "No query results to export!"
+            success, result = self.export_to_parallel(export_type, file_path, parallel, merge, precision,
+                                                      status_bar_callback, progress)
+            if not success:
+                return False, result
+            message = (f"Parallel export successful ({parallel} workers, split by {result['method']})!\n"
+                       f"Files: {', '.join(result['files'])}\nExported {result['rows']} records")
+            if result['skipped']:
+                message += f"\nSkipped {result['skipped']} records without geometry (not allowed with the spatial index)"
+            return True, export_summary(message, result['rows'], result['files'], result['skipped'])
+        
         if export_type == 'excel':
-            success, result = self.export_to_excel(query_result, status_bar_callback)
-            if success:
-                try:
-                    result.to_excel(file_path, index=False)
-                    return True, f"Excel export successful!\nFile saved to: {file_path}\nExported {len(result)} records"
-                except Exception as e:
-                    return False, f"Excel file save failed: {e}"
-            else:
+            if not has_result:
+                return False, "No query results to export!"
+            success, result = self.export_to_excel(file_path, status_bar_callback, progress)
+            if not success:
                 return False, result
+            message = f"Excel export successful!\nFile saved to: {file_path}\nExported {result.rows_written} records"
+            if len(result.sheets) > 1:
+                message += f"\nRows split across {len(result.sheets)} sheets (Excel row limit)"
+            if result.values_moved:
+                message += (f"\n{result.values_moved} values longer than {EXCEL_MAX_CELL_CHARS} characters "
+                            f"were moved to the '{result.long_text_sheet}' sheet")
+            return True, export_summary(message, result.rows_written, [file_path])
         
         elif export_type == 'shapefile':
-            success, result = self.export_to_shapefile(query_result, status_bar_callback)
+            success, result = self.export_to_shapefile(query_result, file_path, status_bar_callback, progress)
+            if not success:
+                return False, result
+            return True, export_summary(
+                f"Shapefile export successful!\nFile saved to: {file_path}\nExported {result} records", result,
+                [file_path])
+        
+        elif export_type in ('geojson', 'geojsonseq'):
+            if not has_result:
+                return False, "No query results to export!"
+            success, result = self.export_to_geojson_stream(file_path, export_type == 'geojsonseq', precision,
+                                                            status_bar_callback, progress)
             if success:
-                try:
-                    result.to_file(file_path, encoding='utf-8')
-                    return True, f"Shapefile export successful!\nFile saved to: {file_path}\nExported {len(result)} records"
-                except Exception as e:
-                    return False, f"Shapefile file save failed: {e}"
+                return True, export_summary(
+                    f"GeoJSON export successful!\nFile saved to: {file_path}\nExported {result} records", result,
+                    [file_path])
             else:
                 return False, result
         
-        elif export_type == 'geojson':
-            success, result = self.export_to_geojson(query_result, status_bar_callback)
+        elif export_type in ('csv', 'tsv'):
+            if not has_result:
+                return False, "No query results to export!"
+            delimiter = '\t' if export_type == 'tsv' else ','
+            success, result = self.export_to_csv(file_path, delimiter, geometry_encoding, status_bar_callback,
+                                                 progress)
             if success:
-                try:
-                    result.to_file(file_path, driver='GeoJSON', encoding='utf-8')
-                    return True, f"GeoJSON export successful!\nFile saved to: {file_path}\nExported {len(result)} records"
-                except Exception as e:
-                    return False, f"GeoJSON file save failed: {e}"
+                return True, export_summary(
+                    f"{export_type.upper()} export successful!\nFile saved to: {file_path}\nExported {result} records",
+                    result, [file_path])
             else:
                 return False, result
         
+        elif export_type in ARROW_EXPORT_NAMES:
+            if not has_result:
+                return False, "No query results to export!"
+            success, result = self.export_to_arrow_stream(export_type, file_path, status_bar_callback, progress)
+            if not success:
+                return False, result
+            message = (f"{ARROW_EXPORT_NAMES[export_type]} export successful!\nFile saved to: {file_path}\n"
+                       f"Exported {result.rows_written} records")
+            if getattr(result, 'rows_skipped', 0):
+                message += f"\nSkipped {result.rows_skipped} records without geometry (not allowed with the spatial index)"
+            return True, export_summary(message, result.rows_written, [file_path], getattr(result, 'rows_skipped', 0))
+        
         else:
             return False, f"Unsupported export type: {export_type}"
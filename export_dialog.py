@@ -0,0 +1,121 @@
+import os
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+
+# 一次导出多种格式时可选的格式：(导出类型, 显示名称, 扩展名)，导出类型见stream_writers.FANOUT_EXPORT_TYPES
+MULTI_EXPORT_FORMATS = [
+    ('excel', "Excel", '.xlsx'),
+    ('geojson', "GeoJSON", '.geojson'),
+    ('geojsonseq', "GeoJSONSeq（每行一个要素）", '.geojsonl'),
+    ('geoparquet', "GeoParquet", '.parquet'),
+    ('flatgeobuf', "FlatGeobuf", '.fgb'),
+    ('gpkg', "GeoPackage", '.gpkg'),
+]
+
+
+class MultiExportDialog:
+    """多格式导出对话框：查询只执行一次，同时写出选中的各种格式"""
+
+    def __init__(self, parent, base_name="export"):
+        """
+        Args:
+            base_name: 默认的输出文件名（不含扩展名）
+        """
+        self.parent = parent
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("导出多种格式")
+        self.dialog.geometry("440x380")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+
+        # 居中显示
+        self.dialog.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - self.dialog.winfo_width()) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - self.dialog.winfo_height()) // 2
+        self.dialog.geometry(f"+{x}+{y}")
+
+        self.result = None
+        self.create_widgets(base_name)
+
+    def create_widgets(self, base_name):
+        frame = ttk.Frame(self.dialog, padding="10")
+        frame.pack(fill="both", expand=True)
+
+        ttk.Label(frame, text="选择要导出的格式（数据只读取一次）:").pack(anchor="w", pady=(0, 5))
+
+        format_frame = ttk.Frame(frame)
+        format_frame.pack(fill="x")
+        self.format_vars = {}
+        for index, (export_type, label, suffix) in enumerate(MULTI_EXPORT_FORMATS):
+            var = tk.BooleanVar(value=export_type in ('excel', 'gpkg'))
+            self.format_vars[export_type] = var
+            ttk.Checkbutton(format_frame, text=f"{label} ({suffix})", variable=var).grid(
+                row=index // 2, column=index % 2, sticky="w", padx=5, pady=2)
+
+        # 输出文件：目录加文件名，各格式使用各自的扩展名
+        ttk.Label(frame, text="输出文件（不含扩展名）:").pack(anchor="w", pady=(10, 5))
+        path_frame = ttk.Frame(frame)
+        path_frame.pack(fill="x")
+        self.path_var = tk.StringVar(value=os.path.join(os.getcwd(), base_name))
+        ttk.Entry(path_frame, textvariable=self.path_var).pack(side="left", fill="x", expand=True)
+        ttk.Button(path_frame, text="浏览...", command=self.choose_path).pack(side="left", padx=(5, 0))
+
+        # GeoJSON坐标精度
+        precision_frame = ttk.Frame(frame)
+        precision_frame.pack(fill="x", pady=(10, 0))
+        self.full_precision_var = tk.BooleanVar(value=False)
+        ttk.Label(precision_frame, text="GeoJSON坐标小数位数:").pack(side="left")
+        self.precision_var = tk.StringVar(value="7")
+        ttk.Spinbox(precision_frame, from_=0, to=15, width=4,
+                    textvariable=self.precision_var).pack(side="left", padx=5)
+        ttk.Checkbutton(precision_frame, text="保留全部精度",
+                        variable=self.full_precision_var).pack(side="left", padx=5)
+
+        # 按钮框架
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(side="bottom", fill="x", pady=(10, 0))
+        ttk.Button(button_frame, text="取消", command=self.on_cancel).pack(side="right", padx=5)
+        ttk.Button(button_frame, text="导出", command=self.on_ok).pack(side="right", padx=5)
+
+    def choose_path(self):
+        file_path = filedialog.asksaveasfilename(parent=self.dialog, initialfile=os.path.basename(self.path_var.get()),
+                                                 initialdir=os.path.dirname(self.path_var.get()))
+        if file_path:
+            self.path_var.set(os.path.splitext(file_path)[0])
+
+    def on_ok(self):
+        """确定按钮点击事件：返回导出的(导出类型, 文件路径)列表和坐标精度"""
+        base_path = self.path_var.get().strip()
+        if not base_path:
+            messagebox.showwarning("警告", "请输入输出文件", parent=self.dialog)
+            return
+        outputs = [(export_type, base_path + suffix) for export_type, _, suffix in MULTI_EXPORT_FORMATS
+                   if self.format_vars[export_type].get()]
+        if not outputs:
+            messagebox.showwarning("警告", "请至少选择一种格式", parent=self.dialog)
+            return
+        folder = os.path.dirname(base_path)
+        if folder and not os.path.isdir(folder):
+            messagebox.showerror("错误", f"目录不存在: {folder}", parent=self.dialog)
+            return
+        precision = None
+        if not self.full_precision_var.get():
+            try:
+                precision = int(self.precision_var.get())
+            except ValueError:
+                messagebox.showwarning("警告", "坐标小数位数必须是整数", parent=self.dialog)
+                return
+        existing = [os.path.basename(path) for _, path in outputs if os.path.exists(path)]
+        if existing and not messagebox.askyesno("确认", "以下文件已存在，是否覆盖？\n" + "\n".join(existing),
+                                                parent=self.dialog):
+            return
+        self.result = {'outputs': outputs, 'precision': precision}
+        self.dialog.destroy()
+
+    def on_cancel(self):
+        self.result = None
+        self.dialog.destroy()
+
+    def show(self):
+        self.dialog.wait_window()
+        return self.result
@@ -1,9 +1,37 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
+import numpy as np
+import shapely
 from connection_dialog import ConnectionDialog
 from spatial_dialog import SpatialGeometryDialog
-from database import DatabaseManager
-from dbexport import DataExporter
+from profile_dialog import ProfileDialog
+from column_dialog import ColumnPickerDialog
+from export_dialog import MultiExportDialog
+from database import DatabaseManager, decode_geometries
+from parallel_export import PARALLEL_EXPORT_TYPES
+from resumable_export import DEFAULT_CHUNK_ROWS, RESUMABLE_EXPORT_TYPES, load_manifest
+from dbexport import DataExporter, ExportProgress
+
+# 空间关系选项：(database.SPATIAL_PREDICATES中的键, 显示名称)
+SPATIAL_PREDICATE_LABELS = [
+    ('intersects', "相交 (ST_Intersects)"),
+    ('dwithin', "距离范围内 (ST_DWithin)"),
+    ('contains', "字段包含过滤图形 (ST_Contains)"),
+    ('within', "字段位于过滤图形内 (ST_Within)"),
+    ('covers', "过滤图形覆盖字段 (ST_Covers)"),
+    ('bbox', "外包框相交，快速预览 (&&)"),
+]
+
+# GIS格式导出：文件扩展名对应的导出类型
+GIS_EXPORT_SUFFIXES = {'.parquet': 'geoparquet', '.fgb': 'flatgeobuf', '.gpkg': 'gpkg'}
+
+# 导出进度刷新间隔（毫秒）
+EXPORT_PROGRESS_INTERVAL = 200
 
 
 class DBQueryApp:
@@ -48,6 +76,17 @@ class DBQueryApp:
         
         # 保存所有表数据用于过滤
         self.all_tables = []
+        
+        # 当前表行数信息（估算值立即显示，精确计数按需在后台执行）
+        table_info_frame = ttk.Frame(self.left_frame)
+        table_info_frame.pack(fill="x", padx=5, pady=(0, 5))
+        
+        self.table_info_label = ttk.Label(table_info_frame, text="")
+        self.table_info_label.pack(side="left", padx=5)
+        
+        self.exact_count_button = ttk.Button(table_info_frame, text="精确计数", width=8,
+                                             command=self.count_table_rows, state="disabled")
+        self.exact_count_button.pack(side="right", padx=2)
 
         # 右侧面板（使用垂直分割）
         self.right_paned = ttk.PanedWindow(self.main_paned, orient=tk.VERTICAL)
@@ -72,6 +111,11 @@ class DBQueryApp:
         ttk.Radiobutton(mode_frame, text="完整SQL", variable=self.query_mode_var, 
                        value="SQL", command=self.on_query_mode_change).pack(side="left", padx=5)
         
+        # 查询字段选择（WHERE模式下只查询选中的字段，减少传输量）
+        self.selected_columns = []
+        self.column_button = ttk.Button(mode_frame, text="查询字段: 全部", command=self.choose_columns)
+        self.column_button.pack(side="right", padx=5)
+        
         # 输入框（根据模式切换内容和提示）
         self.query_input = tk.Text(self.query_input_frame, height=4, wrap=tk.WORD)
         self.query_input.pack(fill="x", padx=5, pady=5)
@@ -98,6 +142,33 @@ class DBQueryApp:
         self.geom_field_combo.pack(side="left", padx=5)
         self.geom_field_combo.bind("<<ComboboxSelected>>", self.on_geom_field_select)
         
+        # 空间索引检查结果（缺少索引或统计信息过期时提示，有权限时可一键修复）
+        self.index_advice_label = ttk.Label(geom_field_frame, text="", foreground="#c0392b")
+        self.index_advice_label.pack(side="left", padx=5)
+        
+        self.fix_index_button = ttk.Button(geom_field_frame, text="创建空间索引",
+                                           command=self.fix_spatial_index)
+        self.index_advice = None
+        self.index_task_running = False
+        
+        # 空间谓词和距离（距离仅用于“距离范围内”）
+        predicate_frame = ttk.Frame(self.spatial_frame)
+        predicate_frame.pack(fill="x", padx=5, pady=5)
+        
+        ttk.Label(predicate_frame, text="空间关系:").pack(side="left", padx=5)
+        
+        self.spatial_predicate_var = tk.StringVar(value=SPATIAL_PREDICATE_LABELS[0][1])
+        self.spatial_predicate_combo = ttk.Combobox(predicate_frame, textvariable=self.spatial_predicate_var,
+                                                    values=[label for _, label in SPATIAL_PREDICATE_LABELS],
+                                                    state="readonly", width=24)
+        self.spatial_predicate_combo.pack(side="left", padx=5)
+        
+        ttk.Label(predicate_frame, text="距离:").pack(side="left", padx=(10, 2))
+        self.distance_var = tk.StringVar(value="0")
+        ttk.Entry(predicate_frame, textvariable=self.distance_var, width=10).pack(side="left", padx=2)
+        ttk.Label(predicate_frame, text="（geometry为坐标单位，geography为米）",
+                  font=("Arial", 8)).pack(side="left", padx=2)
+        
         # 按钮框架
         spatial_button_frame = ttk.Frame(self.spatial_frame)
         spatial_button_frame.pack(fill="x", padx=5, pady=5)
@@ -117,6 +188,12 @@ class DBQueryApp:
                                             style="Accent.TButton")
         self.show_spatial_button.pack(side="left", padx=5, pady=2)
         
+        # 空间连接模式：用文件中的全部要素做索引连接，结果标注匹配的要素序号
+        self.spatial_join_var = tk.BooleanVar(value=False)
+        self.spatial_join_check = ttk.Checkbutton(spatial_button_frame, text="按全部要素连接",
+                                                  variable=self.spatial_join_var, state="disabled")
+        self.spatial_join_check.pack(side="left", padx=5, pady=2)
+        
         self.spatial_label = ttk.Label(self.spatial_frame, text="未选择空间文件")
         self.spatial_label.pack(pady=5)
         
@@ -132,6 +209,24 @@ class DBQueryApp:
                                      width=20)
         self.query_button.pack(side="left", padx=5)
         
+        # 取消查询按钮（查询执行期间可用，会中止数据库端正在执行的语句）
+        self.cancel_query_button = ttk.Button(query_button_frame,
+                                              text="■ 取消查询",
+                                              command=self.cancel_query,
+                                              state="disabled")
+        self.cancel_query_button.pack(side="left", padx=5)
+        
+        # 语句超时设置（秒，0表示不限制）
+        ttk.Label(query_button_frame, text="超时(秒):").pack(side="left", padx=(10, 2))
+        self.statement_timeout_var = tk.StringVar(value="0")
+        ttk.Spinbox(query_button_frame, from_=0, to=86400, increment=30, width=6,
+                    textvariable=self.statement_timeout_var).pack(side="left", padx=2)
+        
+        # 性能分析开关（采集执行计划和各阶段耗时）
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(query_button_frame, text="性能分析",
+                        variable=self.profile_var).pack(side="left", padx=(10, 2))
+        
         # 添加说明标签（放在按钮右侧，确保可见）
         ttk.Label(query_button_frame, text="根据上方选择的模式执行查询", font=("Arial", 9, "italic")).pack(side="left", padx=10, fill="x", expand=True)
         
@@ -153,6 +248,18 @@ class DBQueryApp:
         export_button_frame = ttk.Frame(self.result_info_frame)
         export_button_frame.pack(side="right", padx=5)
         
+        # 分页浏览按钮（无过滤条件浏览全表时可用）
+        page_button_frame = ttk.Frame(self.result_info_frame)
+        page_button_frame.pack(side="right", padx=5)
+        
+        self.prev_page_button = ttk.Button(page_button_frame, text="◀ 上一页", width=8,
+                                           command=self.show_previous_page, state="disabled")
+        self.prev_page_button.pack(side="left", padx=2)
+        
+        self.next_page_button = ttk.Button(page_button_frame, text="下一页 ▶", width=8,
+                                           command=self.show_next_page, state="disabled")
+        self.next_page_button.pack(side="left", padx=2)
+        
         # 导出Shapefile按钮
         self.export_shape_button = ttk.Button(export_button_frame, 
                                             text="?? 导出Shapefile", 
@@ -174,6 +281,38 @@ class DBQueryApp:
                                       style="Accent.TButton")
         self.export_button.pack(side="left", padx=2)
         
+        # 导出CSV/TSV按钮（服务器端COPY流式导出，适合大结果集）
+        self.export_csv_button = ttk.Button(export_button_frame, 
+                                          text="? 导出CSV", 
+                                          command=self.export_to_csv,
+                                          style="Accent.TButton")
+        self.export_csv_button.pack(side="left", padx=2)
+        
+        # 导出GeoParquet/FlatGeobuf/GeoPackage按钮（带空间索引，适合大结果集）
+        self.export_gis_button = ttk.Button(export_button_frame, 
+                                          text="? 导出GIS格式", 
+                                          command=self.export_to_gis_format,
+                                          style="Accent.TButton")
+        self.export_gis_button.pack(side="left", padx=2)
+        
+        # 一次查询同时导出多种格式
+        self.export_many_button = ttk.Button(export_button_frame, 
+                                           text="? 导出多种格式", 
+                                           command=self.export_to_many_formats,
+                                           style="Accent.TButton")
+        self.export_many_button.pack(side="left", padx=2)
+        
+        # 并行导出进程数（GeoJSONSeq和GIS格式按键范围分区导出，0或1表示单连接导出）
+        ttk.Label(export_button_frame, text="并行:").pack(side="left", padx=(8, 2))
+        self.export_workers_var = tk.StringVar(value="0")
+        ttk.Spinbox(export_button_frame, from_=0, to=32, width=3,
+                    textvariable=self.export_workers_var).pack(side="left", padx=2)
+        
+        # 断点续传导出（按主键顺序分块写出，中断后从最后完成的分块继续）
+        self.resumable_export_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_button_frame, text="断点续传",
+                        variable=self.resumable_export_var).pack(side="left", padx=(8, 2))
+        
         # 创建结果显示容器
         result_container = ttk.Frame(self.result_frame)
         result_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -216,17 +355,34 @@ class DBQueryApp:
         self.status_bar = ttk.Label(root, text="就绪", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
+        # 导出进度条（导出任务运行时显示在状态栏上方）
+        self.export_progress_frame = ttk.Frame(root)
+        self.export_progress_bar = ttk.Progressbar(self.export_progress_frame, length=240, maximum=100)
+        self.export_progress_bar.pack(side="left", padx=5, pady=2)
+        self.export_progress_label = ttk.Label(self.export_progress_frame, text="")
+        self.export_progress_label.pack(side="left", padx=5, fill=tk.X, expand=True)
+        self.cancel_export_button = ttk.Button(self.export_progress_frame, text="取消导出",
+                                               command=self.cancel_export)
+        self.cancel_export_button.pack(side="right", padx=5, pady=2)
+        self.export_progress = None  # 正在运行的导出任务的ExportProgress
+        
         # 初始化变量
         self.spatial_geom = None
         self.schema = None
         self.query_result = []  # 保存查询结果用于导出
+        self.browse_page = None  # 分页浏览时当前页的键信息
+        self.browse_page_number = 0
+        self.browse_projection = {}
+        self.pending_page_number = 0
+        self.query_running = False
         
         # 初始化数据导出器
         self.data_exporter = DataExporter(
             db_manager=self.db_manager,
             get_query_input=self.get_query_input_content,
             get_geom_field=self.get_current_geom_field,
-            get_spatial_geom=self.get_current_spatial_geom
+            get_spatial_geom=self.get_current_spatial_geom,
+            get_spatial_options=self.get_current_spatial_options
         )
 
     def create_menu(self):
@@ -238,6 +394,8 @@ class DBQueryApp:
         file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="文件", menu=file_menu)
         file_menu.add_command(label="连接...", command=self.show_connection_dialog)
+        file_menu.add_command(label="刷新元数据", command=self.refresh_catalog)
+        file_menu.add_command(label="清空查询缓存", command=self.clear_result_cache)
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.root.quit)
         
@@ -263,6 +421,8 @@ class DBQueryApp:
             # 获取表列表
             self.schema = config['schema']
             self.load_tables()
+            # 在后台预先加载元数据快照，之后选择表时无需再访问数据库
+            self.run_in_background(lambda: (True, self.db_manager.get_catalog()), lambda result: None)
         else:
             messagebox.showerror("错误", message)
             self.status_bar.config(text="连接失败")
@@ -272,7 +432,10 @@ class DBQueryApp:
         # 清空现有表
         for item in self.table_tree.get_children():
             self.table_tree.delete(item)
-        tables = self.db_manager.load_tables()
+        success, tables = self.db_manager.load_tables()
+        if not success:
+            messagebox.showerror("错误", tables)
+            tables = []
         # 保存所有表数据用于过滤
         self.all_tables = tables
         
@@ -283,6 +446,29 @@ class DBQueryApp:
         # 绑定选择事件
         self.table_tree.bind("<<TreeviewSelect>>", self.on_table_select)
 
+    def refresh_catalog(self):
+        """重新加载表列表和元数据快照（表结构变化后使用）"""
+        if not self.db_manager.pool:
+            messagebox.showwarning("警告", "请先连接数据库！")
+            return
+        self.status_bar.config(text="正在刷新元数据...")
+        
+        def on_done(result):
+            success, catalog = result
+            if success:
+                self.load_tables()
+                self.filter_tables()
+                self.status_bar.config(text=f"元数据已刷新，共 {len(catalog)} 个表")
+            else:
+                self.status_bar.config(text=f"刷新元数据失败: {catalog}")
+        
+        self.run_in_background(lambda: (True, self.db_manager.refresh_catalog()), on_done)
+
+    def clear_result_cache(self):
+        """清空查询结果缓存"""
+        self.db_manager.clear_result_cache()
+        self.status_bar.config(text="查询缓存已清空")
+
     def filter_tables(self, event=None):
         """根据输入的表名过滤树中的表"""
         search_text = self.table_search_var.get().strip().lower()
@@ -322,9 +508,61 @@ class DBQueryApp:
             table_name = item['text']
             self.db_manager.set_current_table(table_name)
             self.status_bar.config(text=f"已选择表: {table_name}")
+            self.selected_columns = []
+            self.column_button.config(text="查询字段: 全部")
+            # 显示估算行数（读取统计信息，不扫描表）
+            self.show_table_row_estimate(table_name)
             # 加载该表的几何字段
             self.load_geometry_fields(table_name)
 
+    def show_table_row_estimate(self, table_name):
+        """在后台获取并显示表的估算行数（元数据快照加载期间不阻塞界面）"""
+        self.table_info_label.config(text=f"{table_name}: 正在估算行数...")
+        
+        def on_done(result):
+            # 估算期间用户可能已切换到其他表
+            if table_name != self.db_manager.current_table_name:
+                return
+            success, row_count = result
+            if not success or row_count is None:
+                self.table_info_label.config(text=f"{table_name}: 行数未知")
+            else:
+                self.table_info_label.config(text=f"{table_name}: {self.format_row_count(row_count)} 行")
+            self.exact_count_button.config(state="normal")
+        
+        self.run_in_background(lambda: (True, self.db_manager.estimate_row_count(table_name)), on_done)
+
+    def count_table_rows(self):
+        """在后台精确统计当前表的行数"""
+        table_name = self.db_manager.current_table_name
+        if not table_name:
+            return
+        self.exact_count_button.config(state="disabled")
+        self.table_info_label.config(text=f"{table_name}: 正在精确计数...")
+        
+        def on_done(result):
+            success, value = result
+            # 计数期间用户可能已切换到其他表
+            if table_name != self.db_manager.current_table_name:
+                return
+            self.exact_count_button.config(state="normal")
+            if success:
+                self.table_info_label.config(text=f"{table_name}: {value:,} 行")
+            else:
+                self.table_info_label.config(text=f"{table_name}: 计数失败")
+                self.status_bar.config(text=f"精确计数失败: {value}")
+        
+        self.run_in_background(lambda: (True, self.db_manager.count_rows(table_name)), on_done)
+
+    @staticmethod
+    def format_row_count(row_count, estimated=True):
+        """格式化行数，如 ~12.3M"""
+        prefix = "~" if estimated else ""
+        for threshold, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K")):
+            if row_count >= threshold:
+                return f"{prefix}{row_count / threshold:.1f}{suffix}"
+        return f"{prefix}{row_count}"
+
     def load_geometry_fields(self, table_name):
         """加载指定表的几何字段"""
         geometry_columns = self.db_manager.get_geometry_columns(table_name)
@@ -341,6 +579,27 @@ class DBQueryApp:
             self.status_bar.config(text=f"已选择表: {table_name} | 找到 {len(geometry_columns)} 个几何字段")
         else:
             self.status_bar.config(text=f"已选择表: {table_name} | 未找到几何字段")
+        self.check_spatial_index()
+
+    def choose_columns(self):
+        """选择WHERE模式下要查询的字段（字段列表来自缓存的表结构）"""
+        table_name = self.db_manager.current_table_name
+        if not table_name:
+            messagebox.showwarning("警告", "请先选择表！")
+            return
+        table_info = self.db_manager.get_table_info(table_name)
+        if not table_info or not table_info['columns']:
+            messagebox.showerror("错误", "无法获取表的字段列表！")
+            return
+        dialog = ColumnPickerDialog(self.root, table_info['columns'], self.selected_columns or None)
+        columns = dialog.show()
+        if columns is None:
+            return
+        self.selected_columns = columns
+        if columns:
+            self.column_button.config(text=f"查询字段: {len(columns)}/{len(table_info['columns'])}")
+        else:
+            self.column_button.config(text="查询字段: 全部")
 
     def on_query_mode_change(self):
         """查询模式切换时更新提示"""
@@ -361,6 +620,97 @@ class DBQueryApp:
         selected_field = self.geom_field_var.get()
         if selected_field:
             self.status_bar.config(text=f"已选择几何字段: {selected_field}")
+        self.show_index_advice()
+
+    def check_spatial_index(self):
+        """在后台检查当前表几何字段的空间索引和统计信息"""
+        table_name = self.db_manager.current_table_name
+        self.index_advice = None
+        self.show_index_advice()
+        if not table_name or not self.geom_field_combo['values']:
+            return
+        
+        def on_done(result):
+            success, advice = result
+            # 检查期间用户可能已切换到其他表
+            if success and table_name == self.db_manager.current_table_name:
+                self.index_advice = advice
+                self.show_index_advice()
+        
+        self.run_in_background(lambda: self.db_manager.check_spatial_indexes(table_name), on_done)
+
+    def show_index_advice(self):
+        """显示当前几何字段的索引建议"""
+        advice = self.index_advice
+        column = None
+        if advice:
+            column = next((c for c in advice['columns'] if c['name'] == self.geom_field_var.get()), None)
+        self.fix_index_button.pack_forget()
+        if not column:
+            self.index_advice_label.config(text="")
+            return
+        if column['needs_index']:
+            text = "⚠ 该字段没有空间索引，空间过滤将全表扫描"
+            if column['invalid_indexes']:
+                text += f"（无效索引: {', '.join(column['invalid_indexes'])}）"
+            button_text = "创建空间索引"
+        elif advice['stale_stats']:
+            text = f"⚠ 统计信息已过期（上次分析后修改 {advice['modified_since_analyze']:,} 行）"
+            button_text = "更新统计信息"
+        else:
+            self.index_advice_label.config(text="")
+            return
+        self.index_advice_label.config(text=text)
+        if advice['can_create_index']:
+            self.fix_index_button.config(text=button_text, state="normal")
+            self.fix_index_button.pack(side="left", padx=5)
+
+    def fix_spatial_index(self):
+        """为当前几何字段创建空间索引，或更新过期的统计信息"""
+        table_name = self.db_manager.current_table_name
+        geom_field = self.geom_field_var.get()
+        if not table_name or not geom_field or not self.index_advice:
+            return
+        column = next((c for c in self.index_advice['columns'] if c['name'] == geom_field), None)
+        if column and column['needs_index']:
+            if not messagebox.askyesno("确认", f"在 {table_name}.{geom_field} 上创建GIST空间索引？\n"
+                                               f"大表可能需要较长时间，期间不影响表的读写。"):
+                return
+            task = lambda: self.db_manager.create_spatial_index(table_name, geom_field)
+        else:
+            task = lambda: self.db_manager.analyze_table(table_name)
+        self.fix_index_button.config(state="disabled")
+        self.index_advice_label.config(text="正在处理...")
+        self.index_task_running = True
+        
+        def on_done(result):
+            success, message = result
+            self.index_task_running = False
+            self.status_bar.config(text=message)
+            if success:
+                self.check_spatial_index()
+            else:
+                messagebox.showerror("错误", message)
+                self.show_index_advice()
+        
+        self.run_in_background(task, on_done)
+        self.root.after(1000, self.poll_index_progress)
+
+    def poll_index_progress(self):
+        """定时在后台读取索引创建进度并显示，直到索引创建结束"""
+        if not self.index_task_running:
+            return
+        
+        def on_progress(result):
+            success, progress = result
+            if not self.index_task_running:
+                return
+            if success and progress:
+                percent = f" {progress['percent']:.0f}%" if progress['percent'] is not None else ""
+                self.index_advice_label.config(text=f"正在创建索引: {progress['phase']}{percent}")
+            self.root.after(1000, self.poll_index_progress)
+        
+        self.run_in_background(lambda: (True, self.db_manager.get_index_progress()), on_progress)
 
     def load_spatial_file(self):
         """加载空间文件"""
@@ -374,14 +724,20 @@ class DBQueryApp:
                 self.spatial_geom = geometry
                 self.spatial_label.config(text=message)
                 self.show_spatial_button.config(state="normal")  # 启用显示按钮
+                self.spatial_join_check.config(state="normal")
                 messagebox.showinfo("成功", "空间文件加载成功！")
             else:
                 messagebox.showerror("错误", message)
 
     def execute_query(self):
-        """执行查询"""
+        """执行查询（在后台线程中执行，界面保持响应）"""
         # 获取查询内容
         query_content = self.query_input.get("1.0", tk.END).strip()
+        statement_timeout = self.get_statement_timeout()
+        if statement_timeout is None:
+            messagebox.showwarning("警告", "超时时间必须是非负数字！")
+            return
+        profile = self.profile_var.get()
         
         # 根据模式执行不同查询
         mode = self.query_mode_var.get()
@@ -389,33 +745,168 @@ class DBQueryApp:
         if mode == "WHERE":
             # WHERE条件模式：允许空条件查询全表或空间过滤
             geom_field = self.geom_field_var.get()
+            spatial_geom = self.spatial_geom
+            spatial_options = self.get_current_spatial_options()
+            if spatial_options is None:
+                messagebox.showwarning("警告", "距离必须是非负数字！")
+                return
+            # 只查询选中的字段，几何字段以二进制EWKB传输一次，显示时在本地转换为WKT
+            projection = {
+                'columns': list(self.selected_columns),
+                'geometry_column': geom_field or None,
+                'geometry_format': 'ewkb'
+            }
+            
+            # 空间连接的临时要素表只存在于执行查询的连接上，无法单独估算
+            estimate_func = None if spatial_options['spatial_join'] else lambda: self.db_manager.estimate_query_rows(
+                query_content, spatial_geom, geom_field, spatial_options['spatial_predicate'],
+                spatial_options['distance'])
             
             # 如果查询条件为空，但有空间过滤条件，只执行空间查询
-            if not query_content and self.spatial_geom:
-                success, result = self.db_manager.execute_query("", self.spatial_geom, geom_field)
+            if not query_content and spatial_geom:
+                query_func = lambda: self.db_manager.execute_query(
+                    "", spatial_geom, statement_timeout=statement_timeout, profile=profile,
+                    **spatial_options, **projection)
             # 如果查询条件为空，也没有空间过滤条件，查询全表
-            elif not query_content and not self.spatial_geom:
+            elif not query_content and not spatial_geom:
                 if not self.db_manager.current_table:
                     messagebox.showwarning("警告", "请先选择表！")
                     return
-                # 执行全表查询
-                success, result = self.db_manager.execute_query("", None, None)
+                # 分页浏览全表（键集分页，按需获取下一页/上一页）
+                self.pending_page_number = 1
+                self.browse_projection = projection
+                query_func = lambda: self.db_manager.browse_table(statement_timeout=statement_timeout,
+                                                                  **projection)
+                estimate_func = None
             else:
                 # 正常的WHERE条件查询（可能包含空间过滤）
-                success, result = self.db_manager.execute_query(query_content, self.spatial_geom, geom_field)
+                query_func = lambda: self.db_manager.execute_query(
+                    query_content, spatial_geom, statement_timeout=statement_timeout,
+                    profile=profile, **spatial_options, **projection)
         else:
             # 完整SQL模式：直接执行自定义SQL
             if not query_content:
                 messagebox.showwarning("警告", "请输入自定义SQL查询！")
                 return
-            success, result = self.db_manager.execute_custom_sql(query_content)
+            query_func = lambda: self.db_manager.execute_custom_sql(
+                query_content, statement_timeout=statement_timeout, profile=profile)
+            estimate_func = lambda: self.db_manager.estimate_custom_sql_rows(query_content)
+        
+        self.run_query_in_background(query_func, estimate_func)
+
+    def show_next_page(self):
+        """分页浏览：获取下一页"""
+        if not self.browse_page or not self.browse_page['has_next']:
+            return
+        after_key = self.browse_page['last_key']
+        statement_timeout = self.get_statement_timeout()
+        self.pending_page_number = self.browse_page_number + 1
+        self.run_query_in_background(
+            lambda: self.db_manager.browse_table(after_key=after_key, statement_timeout=statement_timeout,
+                                                 **self.browse_projection))
+
+    def show_previous_page(self):
+        """分页浏览：获取上一页"""
+        if not self.browse_page or not self.browse_page['has_previous']:
+            return
+        before_key = self.browse_page['first_key']
+        statement_timeout = self.get_statement_timeout()
+        self.pending_page_number = max(self.browse_page_number - 1, 1)
+        self.run_query_in_background(
+            lambda: self.db_manager.browse_table(before_key=before_key, statement_timeout=statement_timeout,
+                                                 **self.browse_projection))
+
+    def update_page_buttons(self):
+        """根据当前页信息更新分页按钮状态"""
+        page = self.browse_page
+        self.prev_page_button.config(state="normal" if page and page['has_previous'] else "disabled")
+        self.next_page_button.config(state="normal" if page and page['has_next'] else "disabled")
+
+    def get_statement_timeout(self):
+        """读取语句超时设置（秒），输入无效时返回None"""
+        try:
+            timeout = float(self.statement_timeout_var.get().strip() or 0)
+        except ValueError:
+            return None
+        return timeout if timeout >= 0 else None
+
+    def run_in_background(self, func, callback, poll_interval=100):
+        """在工作线程中执行func，完成后通过root.after在界面线程中调用callback(result)
+
+        func应返回(success, result)元组；抛出异常时callback收到(False, 错误信息)。
+        """
+        result_queue = queue.Queue()
+        
+        def worker():
+            try:
+                result_queue.put(func())
+            except Exception as e:
+                result_queue.put((False, str(e)))
+        
+        def poll():
+            try:
+                result = result_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(poll_interval, poll)
+                return
+            callback(result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(poll_interval, poll)
+
+    def run_query_in_background(self, query_func, estimate_func=None):
+        """在工作线程中执行查询，结果通过root.after交回界面线程
+
+        estimate_func用另一个连接池连接获取规划器的行数估算，在查询完成前先显示。
+        """
+        self.query_button.config(state="disabled")
+        self.cancel_query_button.config(state="normal")
+        self.prev_page_button.config(state="disabled")
+        self.next_page_button.config(state="disabled")
+        self.result_info_label.config(text="正在查询...")
+        self.status_bar.config(text="正在执行查询...")
+        self.query_running = True
+        
+        self.run_in_background(query_func, self.on_query_finished)
+        if estimate_func:
+            self.run_in_background(lambda: (True, estimate_func()), self.on_query_estimate)
+
+    def on_query_estimate(self, result):
+        """显示查询结果行数的估算值（查询仍在执行时）"""
+        success, row_count = result
+        if self.query_running and success and row_count is not None:
+            self.result_info_label.config(text=f"正在查询... 预计 {self.format_row_count(row_count)} 条记录")
+
+    def on_query_finished(self, result):
+        """处理后台查询结果（在界面线程中执行）"""
+        success, result = result
+        self.query_running = False
+        
+        self.query_button.config(state="normal")
+        self.cancel_query_button.config(state="disabled")
         
         if success:
+            self.browse_page = result.get('page')
+            if self.browse_page:
+                self.browse_page_number = self.pending_page_number
+            started = time.perf_counter()
             self.display_query_result(result)
+            if result.get('profile'):
+                self.root.update_idletasks()
+                result['profile']['timings']['display'] = (time.perf_counter() - started) * 1000
+                ProfileDialog(self.root, result['profile'])
         else:
             messagebox.showerror("错误", result)
             self.result_info_label.config(text="查询失败")
+            self.status_bar.config(text="查询失败")
             self.query_result = []  # 查询失败时清空结果
+            self.browse_page = None
+        self.update_page_buttons()
+
+    def cancel_query(self):
+        """取消正在执行的查询"""
+        success, message = self.db_manager.cancel_query()
+        self.status_bar.config(text=message)
 
     def display_query_result(self, result):
         """显示查询结果（包含字段宽度自适应）"""
@@ -423,9 +914,6 @@ class DBQueryApp:
         data = result['data']
         row_count = result['row_count']
         
-        # 保存查询结果用于导出
-        self.query_result = data
-        
         # 清空并填充结果树
         for item in self.result_tree.get_children():
             self.result_tree.delete(item)
@@ -434,8 +922,17 @@ class DBQueryApp:
         self.result_tree.heading("#0", text="序号")
         self.result_tree.column("#0", width=50, minwidth=50, stretch=False)
         
-        # 获取当前选中的几何字段
+        # 准备显示数据：几何字段（二进制EWKB等）整批转换为WKT格式
         geom_field = self.geom_field_var.get()
+        display_data = [list(row) for row in data]
+        if geom_field in columns:
+            geom_index = columns.index(geom_field)
+            geometry_text = self.format_geometries([row[geom_index] for row in data])
+            for display_row, text in zip(display_data, geometry_text):
+                display_row[geom_index] = text
+        
+        # 保存显示的结果，用于复制和判断是否有结果可导出
+        self.query_result = display_data
         
         # 计算每列的最佳宽度
         column_widths = {}
@@ -447,7 +944,7 @@ class DBQueryApp:
             max_width = max(max_width, title_width)
             
             # 计算该列数据的最大宽度（检查前50行数据）
-            for i, row in enumerate(data[:50]):
+            for i, row in enumerate(display_data[:50]):
                 if len(columns) == len(row):
                     cell_value = str(row[columns.index(col)])
                     cell_width = len(cell_value) * 8 + 20
@@ -462,43 +959,40 @@ class DBQueryApp:
             self.result_tree.heading(col, text=col)
             self.result_tree.column(col, width=column_widths[col], minwidth=100, stretch=False)
         
-        # 准备显示数据：将几何字段转换为WKT格式
-        display_data = []
-        for row in data:
-            display_row = []
-            for i, col in enumerate(columns):
-                value = row[i]
-                # 如果是几何字段，转换为WKT格式
-                if col == geom_field and value:
-                    try:
-                        # 尝试将几何对象转换为WKT
-                        from shapely import wkt
-                        if hasattr(value, 'wkt'):
-                            display_row.append(value.wkt)
-                        elif isinstance(value, str) and value.startswith('SRID='):
-                            # 如果是PostGIS格式，提取WKT部分
-                            wkt_str = value.split(';')[1] if ';' in value else value
-                            display_row.append(wkt_str)
-                        else:
-                            display_row.append(str(value))
-                    except:
-                        display_row.append(str(value))
-                else:
-                    display_row.append(value)
-            display_data.append(display_row)
+        # 分页浏览时序号从当前页的起始行开始
+        page = result.get('page')
+        row_offset = (self.browse_page_number - 1) * page['page_size'] if page else 0
         
         # 填充数据
         for i, row in enumerate(display_data):
-            self.result_tree.insert("", "end", text=str(i+1), values=row)
+            self.result_tree.insert("", "end", text=str(row_offset + i + 1), values=row)
         
         # 更新结果统计信息
+        if page:
+            if row_count > 0:
+                self.result_info_label.config(
+                    text=f"分页浏览：第 {self.browse_page_number} 页，第 {row_offset + 1}-{row_offset + row_count} 条记录")
+            else:
+                self.result_info_label.config(text="分页浏览：表中没有记录")
+            self.status_bar.config(text=f"已加载第 {self.browse_page_number} 页，{row_count} 条记录")
+            return
         if row_count > 0:
             self.result_info_label.config(text=f"查询结果：共 {row_count} 条记录，显示 {len(data)} 条")
         else:
             self.result_info_label.config(text="查询结果：未找到匹配的记录")
         
         # 更新状态栏
-        self.status_bar.config(text=f"查询完成，找到 {row_count} 条记录")
+        cached_note = "（来自缓存）" if result.get('cached') else ""
+        self.status_bar.config(text=f"查询完成，找到 {row_count} 条记录{cached_note}")
+
+    @staticmethod
+    def format_geometries(values):
+        """把一列几何值（EWKB二进制或十六进制）整批转换为WKT，无法解码时原样显示"""
+        try:
+            geometries = np.asarray(decode_geometries(values))
+        except Exception:
+            return [str(value) if isinstance(value, memoryview) else value for value in values]
+        return [text if text is not None else value for text, value in zip(shapely.to_wkt(geometries), values)]
 
     def show_spatial_geometry(self):
         """显示空间几何图形对话框"""
@@ -718,8 +1212,26 @@ class DBQueryApp:
         """获取当前的空间几何"""
         return self.spatial_geom
     
+    def get_current_spatial_options(self):
+        """获取空间过滤选项（空间连接、空间谓词和距离），距离无效时返回None"""
+        label = self.spatial_predicate_var.get()
+        predicate = next((key for key, text in SPATIAL_PREDICATE_LABELS if text == label), 'intersects')
+        distance = None
+        if predicate == 'dwithin':
+            try:
+                distance = float(self.distance_var.get().strip() or 0)
+            except ValueError:
+                return None
+            if distance < 0:
+                return None
+        return {
+            'spatial_join': bool(self.spatial_geom is not None and self.spatial_join_var.get()),
+            'spatial_predicate': predicate,
+            'distance': distance
+        }
+    
     def export_to_excel(self):
-        """导出为Excel的入口函数"""
+        """导出为Excel的入口函数（在后台线程中流式写出）"""
         if not self.query_result:
             messagebox.showwarning("警告", "没有可导出的查询结果！")
             return
@@ -732,25 +1244,13 @@ class DBQueryApp:
         if not file_path:
             return
         
-        try:
-            success, result = self.data_exporter.export_data(
-                'excel', self.query_result, file_path,
-                status_bar_callback=self.status_bar.config
-            )
-            
-            if success:
-                messagebox.showinfo("成功", result)
-                self.status_bar.config(text=result.split('\n')[-1])
-            else:
-                messagebox.showerror("错误", result)
-                self.status_bar.config(text="导出失败")
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"导出失败: {e}")
-            self.status_bar.config(text="导出失败")
+        options = self.get_export_options('excel', file_path)
+        if options is None:
+            return
+        self.start_export_job('excel', file_path, **options)
     
     def export_to_shapefile(self):
-        """导出为Shapefile的入口函数"""
+        """导出为Shapefile的入口函数（在后台线程中执行）"""
         if not self.query_result:
             messagebox.showwarning("警告", "没有可导出的查询结果！")
             return
@@ -763,54 +1263,234 @@ class DBQueryApp:
         if not file_path:
             return
         
-        try:
-            success, result = self.data_exporter.export_data(
-                'shapefile', self.query_result, file_path,
-                status_bar_callback=self.status_bar.config
-            )
-            
-            if success:
-                messagebox.showinfo("成功", result)
-                self.status_bar.config(text=result.split('\n')[-1])
-            else:
-                messagebox.showerror("错误", result)
-                self.status_bar.config(text="导出失败")
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"导出失败: {e}")
-            self.status_bar.config(text="导出失败")
+        self.start_export_job('shapefile', file_path)
     
     def export_to_geojson(self):
-        """导出为GeoJSON的入口函数"""
+        """导出为GeoJSON/GeoJSONSeq的入口函数（在后台线程中流式写出）"""
         if not self.query_result:
             messagebox.showwarning("警告", "没有可导出的查询结果！")
             return
         
         file_path = filedialog.asksaveasfilename(
             defaultextension=".geojson",
-            filetypes=[("GeoJSON", "*.geojson"), ("所有文件", "*.*")]
+            filetypes=[("GeoJSON", "*.geojson"), ("GeoJSON (gzip压缩)", "*.geojson.gz"),
+                       ("GeoJSON (zstd压缩)", "*.geojson.zst"),
+                       ("GeoJSONSeq（每行一个要素）", "*.geojsonl *.geojsonl.gz *.geojsonl.zst"),
+                       ("所有文件", "*.*")]
         )
         
         if not file_path:
             return
         
+        # 扩展名去掉压缩后缀后为.geojsonl/.geojsons时按GeoJSONSeq导出
+        base_name = file_path.lower()
+        for suffix in ('.gz', '.zst'):
+            if base_name.endswith(suffix):
+                base_name = base_name[:-len(suffix)]
+        export_type = 'geojsonseq' if base_name.endswith(('.geojsonl', '.geojsons')) else 'geojson'
+        precision = simpledialog.askinteger("坐标精度", "保留的坐标小数位数（取消则保留全部精度）：",
+                                            initialvalue=7, minvalue=0, maxvalue=15, parent=self.root)
+        options = self.get_export_options(export_type, file_path)
+        if options is None:
+            return
+        self.start_export_job(export_type, file_path, precision=precision, **options)
+    
+    def export_to_csv(self):
+        """导出为CSV/TSV的入口函数（在后台线程中用COPY流式导出）"""
+        if not self.query_result:
+            messagebox.showwarning("警告", "没有可导出的查询结果！")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV文件", "*.csv"), ("TSV文件", "*.tsv"), ("所有文件", "*.*")]
+        )
+        
+        if not file_path:
+            return
+        
+        export_type = 'tsv' if file_path.lower().endswith('.tsv') else 'csv'
+        use_wkt = messagebox.askyesno("几何格式", "几何字段导出为WKT文本？\n选择“否”导出为十六进制EWKB（体积更小）")
+        self.start_export_job(export_type, file_path, geometry_encoding='wkt' if use_wkt else 'hex')
+    
+    def get_export_options(self, export_type, file_path):
+        """勾选断点续传时返回续传设置，否则返回并行导出设置；取消时返回None"""
+        if self.resumable_export_var.get() and export_type in RESUMABLE_EXPORT_TYPES:
+            return self.get_resumable_export_options(export_type, file_path)
+        return self.get_parallel_export_options(export_type)
+    
+    def get_resumable_export_options(self, export_type, file_path):
+        """读取断点续传设置，返回export_data的resumable等参数；取消时返回None
+
+        目标文件已有未完成的导出清单时询问是否从断点继续。
+        """
         try:
-            success, result = self.data_exporter.export_data(
-                'geojson', self.query_result, file_path,
-                status_bar_callback=self.status_bar.config
-            )
-            
+            manifest = load_manifest(file_path)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法读取导出清单: {e}")
+            return None
+        if manifest is not None and not manifest['complete']:
+            resume = messagebox.askyesnocancel(
+                "断点续传", f"发现未完成的导出：已完成{len(manifest['chunks'])}个分块，共{manifest['rows']}行。\n\n"
+                          "是：从断点继续\n否：删除已有分块，重新导出")
+            if resume is None:
+                return None
+            if resume:
+                return {'resumable': True}
+        chunk_rows = simpledialog.askinteger("断点续传", "每个分块的行数：", initialvalue=DEFAULT_CHUNK_ROWS,
+                                             minvalue=1000, parent=self.root)
+        if chunk_rows is None:
+            return None
+        merge = False
+        if export_type in PARALLEL_EXPORT_TYPES:
+            merge = messagebox.askyesno("断点续传", "全部分块完成后合并为一个文件？\n选择“否”保留按顺序编号的分块文件（*.chunk00001 …）")
+        return {'resumable': True, 'restart': True, 'chunk_rows': chunk_rows, 'merge': merge}
+    
+    def get_parallel_export_options(self, export_type):
+        """读取并行导出设置，返回export_data的parallel/merge参数；取消时返回None"""
+        try:
+            workers = int(self.export_workers_var.get() or 0)
+        except ValueError:
+            workers = 0
+        if workers <= 1 or export_type not in PARALLEL_EXPORT_TYPES:
+            return {}
+        merge = messagebox.askyesnocancel(
+            "并行导出", f"将按键范围分为{workers}个分区并行导出。\n\n"
+                        "是：合并为一个文件\n否：保留按顺序编号的分区文件（*.part001 …）")
+        if merge is None:
+            return None
+        return {'parallel': workers, 'merge': merge}
+    
+    def export_to_gis_format(self):
+        """导出为GeoParquet/FlatGeobuf/GeoPackage的入口函数（在后台线程中流式写出）"""
+        if not self.query_result:
+            messagebox.showwarning("警告", "没有可导出的查询结果！")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".parquet",
+            filetypes=[("GeoParquet", "*.parquet"), ("FlatGeobuf", "*.fgb"),
+                       ("GeoPackage", "*.gpkg"), ("所有文件", "*.*")]
+        )
+        
+        if not file_path:
+            return
+        
+        export_type = GIS_EXPORT_SUFFIXES.get(os.path.splitext(file_path)[1].lower())
+        if not export_type:
+            messagebox.showerror("错误", "请使用 .parquet、.fgb 或 .gpkg 扩展名")
+            return
+        options = self.get_export_options(export_type, file_path)
+        if options is None:
+            return
+        self.start_export_job(export_type, file_path, **options)
+    
+    def export_to_many_formats(self):
+        """一次导出多种格式的入口函数：查询只执行一次，每批数据同时交给各格式的写出线程"""
+        if not self.query_result:
+            messagebox.showwarning("警告", "没有可导出的查询结果！")
+            return
+        
+        dialog = MultiExportDialog(self.root, self.db_manager.current_table_name or "export")
+        result = dialog.show()
+        if result is None:
+            return
+        outputs = result['outputs']
+        self.run_export_job(
+            f"{len(outputs)}种格式",
+            lambda progress: self.data_exporter.export_many(outputs, self.query_result, result['precision'],
+                                                            progress=progress))
+    
+    def set_export_buttons_state(self, state):
+        for button in (self.export_button, self.export_shape_button, self.export_geojson_button,
+                       self.export_csv_button, self.export_gis_button, self.export_many_button):
+            button.config(state=state)
+    
+    def start_export_job(self, export_type, file_path, **options):
+        """在后台线程中导出到一个文件，options原样传给DataExporter.export_data"""
+        self.run_export_job(
+            os.path.basename(file_path),
+            lambda progress: self.data_exporter.export_data(export_type, self.query_result, file_path,
+                                                            progress=progress, **options))
+    
+    def run_export_job(self, target, export_func):
+        """在后台线程中执行导出，界面显示进度并可随时取消
+
+        同一时间只运行一个导出任务（导出查询共用一个取消标识）；导出期间
+        界面仍可浏览和查询。export_func(progress)返回(成功, 导出结果或错误信息)，
+        导出结果见dbexport.export_summary；target是状态栏中显示的导出目标。
+        """
+        if self.export_progress is not None:
+            messagebox.showwarning("警告", "已有导出任务正在运行")
+            return
+        progress = ExportProgress(self.data_exporter.expected_rows())
+        self.export_progress = progress
+        self.set_export_buttons_state("disabled")
+        self.cancel_export_button.config(state="normal")
+        if progress.total_rows:
+            self.export_progress_bar.config(mode="determinate", value=0)
+        else:
+            self.export_progress_bar.config(mode="indeterminate")
+            self.export_progress_bar.start(50)
+        self.export_progress_label.config(text="正在准备导出...")
+        self.export_progress_frame.pack(side=tk.BOTTOM, fill=tk.X, after=self.status_bar)
+        self.status_bar.config(text=f"正在导出 {target}...")
+        
+        def on_done(result):
+            success, summary = result
+            self.export_progress = None
+            self.export_progress_bar.stop()
+            self.export_progress_frame.pack_forget()
+            self.set_export_buttons_state("normal")
+            # 取消请求可能在导出已经完成后才到达，此时文件已完整写出，按成功处理
             if success:
-                messagebox.showinfo("成功", result)
-                self.status_bar.config(text=result.split('\n')[-1])
+                messagebox.showinfo("成功", summary['message'])
+                self.status_bar.config(text=self.format_export_status(summary))
+            elif progress.cancelled:
+                self.status_bar.config(text="导出已取消")
             else:
-                messagebox.showerror("错误", result)
+                messagebox.showerror("错误", summary)
                 self.status_bar.config(text="导出失败")
-                
-        except Exception as e:
-            print(f"导出GeoJSON时发生错误: {e}")
-            messagebox.showerror("错误", f"导出失败: {e}")
-            self.status_bar.config(text="导出失败")
+        
+        self.run_in_background(lambda: export_func(progress), on_done)
+        self.update_export_progress(progress)
+    
+    @staticmethod
+    def format_export_status(summary):
+        """状态栏中的导出结果，如 已导出 12,345 行到 data.gpkg"""
+        files = [os.path.basename(path) for path in summary['files']]
+        if len(files) > 2:
+            files = [files[0], f"等{len(files)}个文件"]
+        text = f"已导出 {summary['rows']:,} 行到 {'、'.join(files)}"
+        if summary['skipped']:
+            text += f"（跳过 {summary['skipped']:,} 行无几何的记录）"
+        return text
+    
+    def update_export_progress(self, progress):
+        """定时刷新导出进度（在界面线程中执行），任务结束后停止"""
+        if progress is not self.export_progress:
+            return
+        state = progress.snapshot()
+        text = (f"已读取 {state['rows_fetched']:,} 行，已写入 {state['rows_written']:,} 行，"
+                f"{state['rate']:,.0f} 行/秒")
+        if state['percent'] is not None:
+            self.export_progress_bar.config(value=state['percent'])
+            text += f"，{state['percent']:.0f}%"
+        if state['eta'] is not None:
+            minutes, seconds = divmod(int(state['eta']), 60)
+            text += f"，预计剩余 {minutes:02d}:{seconds:02d}"
+        if progress.cancelled:
+            text = "正在取消导出..."
+        self.export_progress_label.config(text=text)
+        self.root.after(EXPORT_PROGRESS_INTERVAL, lambda: self.update_export_progress(progress))
+    
+    def cancel_export(self):
+        """取消正在运行的导出任务，已写出的部分文件会被删除"""
+        if self.export_progress is None:
+            return
+        self.cancel_export_button.config(state="disabled")
+        self.data_exporter.cancel_export(self.export_progress)
+        self.status_bar.config(text="正在取消导出...")
     
     def show_about(self):
         """显示关于对话框"""
@@ -818,6 +1498,8 @@ class DBQueryApp:
 
 
 if __name__ == "__main__":
+    # 并行导出的工作进程在打包后的程序中也能启动
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = DBQueryApp(root)
     root.mainloop()
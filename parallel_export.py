@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel Partitioned Export
+Split the current result into key ranges and export them concurrently in
+worker processes that all read one exported snapshot
+"""
+
+import contextlib
+import multiprocessing
+import os
+import queue
+import shutil
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+
+import psycopg2
+
+from database import DEFAULT_ITERSIZE, create_feature_table
+from stream_writers import COMPRESSION_SUFFIXES, OGR_FORMATS, create_writer, import_pyarrow
+
+# Export types that can be written in parallel; their parts can also be merged into one file
+PARALLEL_EXPORT_TYPES = ('geojsonseq', 'geoparquet', 'flatgeobuf', 'gpkg')
+
+# Default number of partitions / worker processes
+DEFAULT_EXPORT_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Seconds between progress / cancellation checks of the coordinator
+PROGRESS_POLL_INTERVAL = 0.2
+
+# Set by init_worker in each worker process: asks the partitions to stop before their next batch
+_stop_event = None
+
+
+def init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def part_path(file_path, index, label='part', digits=3):
+    """Path of one part file: data.geojsonl.gz -> data.part001.geojsonl.gz"""
+    root, suffix = os.path.splitext(file_path)
+    if suffix.lower() in COMPRESSION_SUFFIXES:
+        root, inner_suffix = os.path.splitext(root)
+        suffix = inner_suffix + suffix
+    return f"{root}.{label}{index + 1:0{digits}d}{suffix}"
+
+
+def export_partition(task):
+    """
+    Process pool task: export one key range of the query to its part file
+
+    A psycopg2 connection cannot cross a process boundary, so the worker
+    opens its own, imports the coordinator's snapshot and streams its range
+    through a server-side cursor straight into a writer. Rows are fetched,
+    decoded and encoded in this process and never pickled back.
+
+    (fetched, written) row counts of every batch are put on
+    task['progress_queue'] when there is one.
+    The connection carries task['application_name'] so the coordinator can
+    find and cancel its backend; between batches the worker also stops once
+    the coordinator sets the stop event (see stop_parts).
+
+    Returns:
+        dict: 'rows' written and 'skipped' rows (see OGRArrowWriter)
+    """
+    writer = None
+    progress_queue = task.get('progress_queue')
+    conn = psycopg2.connect(application_name=task['application_name'], **task['connect_params'])
+    try:
+        if task['features']:
+            # Commits, so it has to run before the snapshot is imported
+            create_feature_table(conn, *task['features'])
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (task['snapshot'],))
+        with conn.cursor(name='dbquery_partition') as cursor:
+            cursor.execute(task['query'])
+            batch = cursor.fetchmany(task['itersize'])
+            columns = [desc[0] for desc in cursor.description]
+            writer = create_writer(task['export_type'], task['file_path'], columns, task['geometry_column'],
+                                   precision=task['precision'])
+            reported = 0
+            while batch:
+                if _stop_event is not None and _stop_event.is_set():
+                    raise RuntimeError("Partition stopped")
+                writer.write_batch(batch)
+                if progress_queue is not None:
+                    progress_queue.put((len(batch), writer.rows_written - reported))
+                    reported = writer.rows_written
+                batch = cursor.fetchmany(task['itersize'])
+        writer.close()
+        return {'rows': writer.rows_written, 'skipped': getattr(writer, 'rows_skipped', 0)}
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        # psycopg2 errors do not always survive pickling back to the parent
+        raise RuntimeError(str(e)) from None
+    finally:
+        conn.close()
+
+
+def merged_schema(pa, schemas):
+    """Common Arrow schema of the parts; a column typed differently across parts becomes text"""
+    fields = []
+    for index, field in enumerate(schemas[0]):
+        types = {schema.field(index).type for schema in schemas}
+        fields.append(field if len(types) == 1 else field.with_type(pa.string()))
+    return pa.schema(fields, metadata=schemas[0].metadata)
+
+
+def merge_parts(export_type, part_paths, file_path):
+    """
+    Merge ordered part files into a single output file
+
+    GeoJSONSeq parts are concatenated byte for byte (gzip members and zstd
+    frames concatenate into a valid stream); GeoParquet row groups are copied
+    over; FlatGeobuf and GeoPackage parts are chained into one Arrow stream
+    so GDAL builds a single spatial index.
+    """
+    if export_type == 'geojsonseq':
+        with open(file_path, 'wb') as output:
+            for path in part_paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, output)
+    elif export_type == 'geoparquet':
+        _merge_parquet(part_paths, file_path)
+    elif export_type in OGR_FORMATS:
+        _merge_ogr(export_type, part_paths, file_path)
+    else:
+        raise ValueError(f"Unsupported export type: {export_type}")
+
+
+def _merge_parquet(part_paths, file_path):
+    pa = import_pyarrow()
+    parts = [pa.parquet.ParquetFile(path) for path in part_paths]
+    parts = [part for part in parts if part.metadata.num_rows] or parts[:1]
+    schema = merged_schema(pa, [part.schema_arrow for part in parts])
+    with pa.parquet.ParquetWriter(file_path, schema, compression='zstd') as writer:
+        for part in parts:
+            for index in range(part.num_row_groups):
+                writer.write_table(part.read_row_group(index).cast(schema))
+
+
+def _merge_ogr(export_type, part_paths, file_path):
+    pa = import_pyarrow()
+    import pyogrio
+    driver, layer_options = OGR_FORMATS[export_type]
+    # An empty FlatGeobuf reports an unknown (-1) feature count unless counted
+    paths = [path for path in part_paths
+             if pyogrio.read_info(path, force_feature_count=True)['features'] > 0] or part_paths[:1]
+    with contextlib.ExitStack() as stack:
+        sources = [stack.enter_context(pyogrio.open_arrow(path, use_pyarrow=True)) for path in paths]
+        meta = sources[0][0]
+        schema = merged_schema(pa, [reader.schema for _, reader in sources])
+
+        def batches():
+            for _, reader in sources:
+                for batch in reader:
+                    yield from pa.Table.from_batches([batch]).cast(schema).to_batches()
+
+        pyogrio.write_arrow(pa.RecordBatchReader.from_batches(schema, batches()), file_path,
+                            layer=os.path.splitext(os.path.basename(file_path))[0], driver=driver,
+                            geometry_name=meta['geometry_name'] or 'wkb_geometry', geometry_type='Unknown',
+                            crs=meta['crs'], layer_options=layer_options)
+
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def drain_progress(progress_queue, progress):
+    """Add the row counts reported by the workers to progress"""
+    while True:
+        try:
+            fetched, written = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        progress.add(fetched, written)
+
+
+def cancel_backends(cursor, application_name):
+    """Interrupt the queries of every worker connected as application_name"""
+    cursor.execute("SELECT pg_cancel_backend(pid) FROM pg_stat_activity WHERE application_name = %s",
+                   (application_name,))
+
+
+def stop_parts(futures, stop_event, cursor, application_name):
+    """
+    Drop the pending partitions and stop the running ones: the stop event
+    ends them between batches, pg_cancel_backend interrupts a running fetch
+    (repeated every poll, so a worker still connecting is caught once its
+    query starts)
+    """
+    stop_event.set()
+    for future in futures:
+        future.cancel()
+    while True:
+        cancel_backends(cursor, application_name)
+        _, pending = wait(futures, timeout=PROGRESS_POLL_INTERVAL)
+        if not pending:
+            return
+
+
+def wait_for_parts(futures, progress, progress_queue):
+    """
+    Wait for the partition futures while reporting progress; returns early
+    once a partition failed or progress was cancelled
+    """
+    while True:
+        done, pending = wait(futures, timeout=PROGRESS_POLL_INTERVAL, return_when=FIRST_EXCEPTION)
+        drain_progress(progress_queue, progress)
+        if not pending or progress.cancelled or any(future.exception() for future in done
+                                                      if not future.cancelled()):
+            return
+
+
+def export_parallel(db_manager, export_type, file_path, geometry_column, workers=DEFAULT_EXPORT_WORKERS,
+                    merge=True, precision=None, itersize=DEFAULT_ITERSIZE, progress=None):
+    """
+    Export the current result with several worker processes
+
+    The coordinator exports a snapshot from a pooled connection, splits the
+    query into key ranges inside that snapshot (see
+    DatabaseManager.partition_queries) and keeps it open while the workers
+    import it, so every partition sees exactly the same data.
+
+    Args:
+        workers: Number of partitions and worker processes
+        merge: Merge the parts into file_path; otherwise keep the ordered
+            part files (data.part001.ext, data.part002.ext, ...)
+        progress: dbexport.ExportProgress fed with the rows the workers
+            write; cancelling it stops the workers, removes every part and
+            raises from progress.check()
+
+    Returns:
+        dict: 'rows', 'skipped', 'files' (written files) and 'method'
+              (how the key ranges were split)
+    """
+    if export_type not in PARALLEL_EXPORT_TYPES:
+        raise ValueError(f"Parallel export does not support {export_type}")
+    if not db_manager.connect_params:
+        raise RuntimeError("Please connect to the database first!")
+
+    mp_context = multiprocessing.get_context('spawn')
+    with contextlib.ExitStack() as stack, db_manager.exported_snapshot() as (snapshot, cursor):
+        plan = db_manager.partition_queries(cursor, max(int(workers), 1))
+        application_name = f"dbquery_export_{snapshot}"
+        progress_queue = stack.enter_context(mp_context.Manager()).Queue() if progress else None
+        tasks = [{
+            'connect_params': db_manager.connect_params,
+            'application_name': application_name,
+            'progress_queue': progress_queue,
+            'snapshot': snapshot,
+            'query': query,
+            'features': plan['features'],
+            'export_type': export_type,
+            'file_path': part_path(file_path, index),
+            'geometry_column': geometry_column,
+            'precision': precision,
+            'itersize': itersize,
+        } for index, query in enumerate(plan['queries'])]
+        paths = [task['file_path'] for task in tasks]
+
+        # Handed over when the workers start, as events cannot be pickled into tasks
+        stop_event = mp_context.Event()
+        # spawn behaves the same on every platform and does not fork the GUI's threads
+        with ProcessPoolExecutor(max_workers=len(tasks), mp_context=mp_context,
+                                 initializer=init_worker, initargs=(stop_event,)) as pool:
+            futures = [pool.submit(export_partition, task) for task in tasks]
+            if progress:
+                wait_for_parts(futures, progress, progress_queue)
+            else:
+                wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                future.cancel()
+            try:
+                if progress:
+                    progress.check()
+                # Raise the failed partition's error rather than block on a running one
+                failed = [future for future in futures
+                          if future.done() and not future.cancelled() and future.exception()]
+                if failed:
+                    raise failed[0].exception()
+                results = [future.result() for future in futures]
+            except BaseException:
+                # A failed or cancelled partition makes the others useless: stop them instead of
+                # waiting for their ranges
+                stop_parts(futures, stop_event, cursor, application_name)
+                pool.shutdown(wait=True)
+                remove_files(paths)
+                raise
+
+    if merge:
+        try:
+            if progress:
+                progress.check()
+            merge_parts(export_type, paths, file_path)
+        except BaseException:
+            remove_files([file_path])
+            raise
+        finally:
+            remove_files(paths)
+        paths = [file_path]
+    return {
+        'rows': sum(result['rows'] for result in results),
+        'skipped': sum(result['skipped'] for result in results),
+        'files': paths,
+        'method': plan['method'],
+    }
@@ -0,0 +1,210 @@
+import tkinter as tk
+from tkinter import ttk
+
+# 估算行数与实际行数相差超过该倍数时标记为估算偏差
+MISESTIMATE_RATIO = 10
+# “最慢节点”标签页显示的节点数
+SLOWEST_NODE_COUNT = 10
+
+# 客户端耗时阶段的显示名称
+TIMING_LABELS = [
+    ('build', "构建SQL"),
+    ('explain_analyze', "EXPLAIN ANALYZE（分析用，额外执行一次）"),
+    ('server', "服务器规划+执行（来自执行计划）"),
+    ('transfer', "网络传输（执行耗时减去服务器耗时，估算）"),
+    ('execute', "执行查询合计（服务器+传输）"),
+    ('fetch', "结果转换为Python对象"),
+    ('display', "填充结果表格"),
+]
+
+
+def flatten_plan(node, depth=0, nodes=None, parent=None):
+    """把执行计划树展开为节点列表，计算每个节点的自身耗时
+
+    EXPLAIN中的Actual Total Time和Actual Rows是每次循环的平均值，这里乘以
+    Actual Loops得到总量，自身耗时为总耗时减去子节点的总耗时。
+    """
+    if nodes is None:
+        nodes = []
+    loops = node.get('Actual Loops') or 1
+    total_time = (node.get('Actual Total Time') or 0) * loops
+    children = node.get('Plans', [])
+    children_time = sum((child.get('Actual Total Time') or 0) * (child.get('Actual Loops') or 1)
+                        for child in children)
+    estimated_rows = node.get('Plan Rows') or 0
+    actual_rows = node.get('Actual Rows') or 0
+    entry = {
+        'depth': depth,
+        'parent': parent,
+        'node': node,
+        'label': describe_node(node),
+        'total_time': total_time,
+        'self_time': max(total_time - children_time, 0),
+        'loops': loops,
+        'estimated_rows': estimated_rows,
+        'actual_rows': actual_rows,
+        'misestimated': is_misestimated(estimated_rows, actual_rows),
+        'shared_hit': node.get('Shared Hit Blocks', 0),
+        'shared_read': node.get('Shared Read Blocks', 0),
+    }
+    index = len(nodes)
+    nodes.append(entry)
+    for child in children:
+        flatten_plan(child, depth + 1, nodes, index)
+    return nodes
+
+
+def describe_node(node):
+    """生成节点的简短描述，如 Index Scan using idx on parcels"""
+    label = node.get('Node Type', '?')
+    if node.get('Index Name'):
+        label += f" using {node['Index Name']}"
+    if node.get('Relation Name'):
+        label += f" on {node['Relation Name']}"
+        if node.get('Alias') and node['Alias'] != node['Relation Name']:
+            label += f" {node['Alias']}"
+    return label
+
+
+def is_misestimated(estimated_rows, actual_rows):
+    """估算行数与实际行数相差超过MISESTIMATE_RATIO倍"""
+    low, high = sorted((max(estimated_rows, 1), max(actual_rows, 1)))
+    return high / low >= MISESTIMATE_RATIO
+
+
+def plan_hints(nodes):
+    """根据执行计划给出常见问题提示"""
+    hints = []
+    for entry in nodes:
+        node = entry['node']
+        condition = (node.get('Filter') or '').lower()
+        if node.get('Node Type') == 'Seq Scan' and ('st_' in condition or '&&' in condition):
+            hints.append(f"{entry['label']} 对空间条件做了顺序扫描，几何字段可能缺少GIST索引")
+        if entry['misestimated']:
+            hints.append(f"{entry['label']} 估算 {entry['estimated_rows']} 行，实际 {entry['actual_rows']} 行，"
+                         f"统计信息可能过期（可执行ANALYZE）")
+    return hints
+
+
+class ProfileDialog:
+    """查询性能分析对话框：执行计划树、最慢节点和各阶段耗时"""
+
+    def __init__(self, parent, profile):
+        self.parent = parent
+        self.profile = profile
+        self.nodes = flatten_plan(profile['plan']['Plan'])
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("查询性能分析")
+        self.dialog.geometry("900x600")
+        self.dialog.transient(parent)
+
+        # 居中显示
+        self.dialog.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - self.dialog.winfo_width()) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - self.dialog.winfo_height()) // 2
+        self.dialog.geometry(f"+{x}+{y}")
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        """创建对话框控件"""
+        main_frame = ttk.Frame(self.dialog, padding="10")
+        main_frame.pack(fill="both", expand=True)
+
+        plan = self.profile['plan']
+        summary = f"执行耗时: {plan.get('Execution Time', 0):.1f} ms"
+        # auto_explain记录的计划不含规划耗时
+        if 'Planning Time' in plan:
+            summary = f"规划耗时: {plan['Planning Time']:.1f} ms    " + summary
+        ttk.Label(main_frame, text=summary, font=("Arial", 11, "bold")).pack(anchor="w", pady=(0, 10))
+        if self.profile.get('executions', 1) > 1:
+            ttk.Label(main_frame, foreground="red",
+                      text="注意：无法使用auto_explain（服务器未提供或需要超级用户），查询执行了两次（EXPLAIN ANALYZE一次、"
+                           "取回结果一次），执行计划和服务器耗时来自第一次执行").pack(anchor="w", pady=(0, 10))
+
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill="both", expand=True)
+
+        plan_frame = ttk.Frame(notebook)
+        notebook.add(plan_frame, text="执行计划")
+        self.create_plan_tree(plan_frame)
+
+        slow_frame = ttk.Frame(notebook)
+        notebook.add(slow_frame, text="最慢节点")
+        self.create_slowest_nodes(slow_frame)
+
+        timing_frame = ttk.Frame(notebook)
+        notebook.add(timing_frame, text="耗时分布")
+        self.create_timing_display(timing_frame)
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill="x", pady=10)
+        ttk.Button(button_frame, text="关闭", command=self.dialog.destroy).pack(side="right", padx=5)
+
+    def create_node_tree(self, parent, show="tree headings"):
+        """创建显示计划节点的Treeview"""
+        columns = ("self_time", "total_time", "estimated_rows", "actual_rows", "loops", "buffers")
+        headings = ("自身耗时(ms)", "总耗时(ms)", "估算行数", "实际行数", "循环", "缓冲 命中/读取")
+
+        container = ttk.Frame(parent)
+        container.pack(fill="both", expand=True, padx=5, pady=5)
+        tree = ttk.Treeview(container, columns=columns, show=show)
+        scrollbar = ttk.Scrollbar(container, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        tree.heading("#0", text="节点")
+        tree.column("#0", width=320, stretch=True)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=90, anchor="e", stretch=False)
+        tree.tag_configure("misestimated", foreground="red")
+        return tree
+
+    def node_values(self, entry):
+        """节点在Treeview中显示的数值"""
+        return (f"{entry['self_time']:.2f}", f"{entry['total_time']:.2f}",
+                entry['estimated_rows'], entry['actual_rows'], entry['loops'],
+                f"{entry['shared_hit']}/{entry['shared_read']}")
+
+    def create_plan_tree(self, parent):
+        """按层级显示执行计划，估算偏差大的节点标红"""
+        tree = self.create_node_tree(parent)
+        item_ids = {}
+        for index, entry in enumerate(self.nodes):
+            parent_item = item_ids[entry['parent']] if entry['parent'] is not None else ""
+            item_ids[index] = tree.insert(parent_item, "end", text=entry['label'], open=True,
+                                          values=self.node_values(entry),
+                                          tags=("misestimated",) if entry['misestimated'] else ())
+
+    def create_slowest_nodes(self, parent):
+        """按自身耗时列出最慢的节点"""
+        tree = self.create_node_tree(parent)
+        slowest = sorted(self.nodes, key=lambda entry: entry['self_time'], reverse=True)
+        for entry in slowest[:SLOWEST_NODE_COUNT]:
+            tree.insert("", "end", text=entry['label'], values=self.node_values(entry),
+                        tags=("misestimated",) if entry['misestimated'] else ())
+
+    def create_timing_display(self, parent):
+        """显示客户端各阶段耗时和计划提示"""
+        timings = self.profile['timings']
+        lines = []
+        for key, label in TIMING_LABELS:
+            if key in timings:
+                lines.append(f"{label}: {timings[key]:.1f} ms")
+
+        hints = plan_hints(self.nodes)
+        if hints:
+            lines.append("")
+            lines.append("提示:")
+            lines.extend(f"  - {hint}" for hint in hints)
+
+        text_widget = tk.Text(parent, wrap="word", height=15)
+        text_widget.pack(fill="both", expand=True, padx=5, pady=5)
+        text_widget.insert("1.0", "\n".join(lines))
+        text_widget.configure(state="disabled")
+
+    def show(self):
+        """显示对话框"""
+        self.dialog.wait_window()
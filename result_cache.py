@@ -0,0 +1,82 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# 查询结果缓存的默认内存预算（字节）
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+# 估算结果占用内存时抽样的行数
+SIZE_SAMPLE_ROWS = 100
+
+
+class ResultCache:
+    """查询结果缓存，按最近最少使用（LRU）顺序在内存预算内淘汰
+
+    每条缓存记录保存结果对应表的修改版本（由调用方从pg_stat_user_tables
+    读取的修改计数），读取时版本不一致即视为失效。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """读取缓存结果，不存在或表已被修改时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['version'] != version:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry['result']
+
+    def put(self, key, version, result):
+        """保存查询结果，超出内存预算时淘汰最久未使用的记录
+
+        单个结果超过整个预算时不缓存。
+        """
+        size = self.estimate_size(result['data'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'version': version, 'result': result, 'size': size}
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry['size']
+
+    @staticmethod
+    def estimate_size(rows):
+        """按抽样行估算结果集占用的内存（字节）"""
+        if not rows:
+            return sys.getsizeof(rows)
+        sample = rows[:SIZE_SAMPLE_ROWS]
+        sample_bytes = sum(
+            sys.getsizeof(row) + sum(ResultCache._value_size(value) for value in row)
+            for row in sample
+        )
+        return sys.getsizeof(rows) + sample_bytes * len(rows) // len(sample)
+
+    @staticmethod
+    def _value_size(value):
+        # memoryview（bytea字段）的getsizeof不包含其引用的数据
+        if isinstance(value, memoryview):
+            return sys.getsizeof(value) + value.nbytes
+        return sys.getsizeof(value)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable Checkpointed Export
+Write the current result as numbered chunks in primary key order and record
+each finished chunk in a manifest, so an interrupted export continues after
+the last committed key instead of starting over
+"""
+
+import datetime
+import json
+import os
+
+from database import DEFAULT_ITERSIZE
+from parallel_export import PARALLEL_EXPORT_TYPES, merge_parts, part_path, remove_files
+from stream_writers import create_writer
+
+# Export types written through stream_writers, which can be chunked
+RESUMABLE_EXPORT_TYPES = ('excel', 'geojson', 'geojsonseq', 'geoparquet', 'flatgeobuf', 'gpkg')
+
+# Default number of rows per chunk
+DEFAULT_CHUNK_ROWS = 1000000
+
+# The manifest sits next to the output: data.parquet -> data.parquet.manifest.json
+MANIFEST_SUFFIX = '.manifest.json'
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(file_path):
+    return file_path + MANIFEST_SUFFIX
+
+
+def chunk_path(file_path, index):
+    """Path of one chunk: data.parquet -> data.chunk00001.parquet"""
+    return part_path(file_path, index, 'chunk', 5)
+
+
+def load_manifest(file_path):
+    """Manifest of an earlier export to file_path, None when there is none"""
+    path = manifest_path(file_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}")
+    return manifest
+
+
+def save_manifest(file_path, manifest):
+    """Write the manifest atomically: a crash leaves either the old or the new version"""
+    path = manifest_path(file_path)
+    manifest['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def sync_file(path):
+    """Flush a closed file to disk before the manifest records it"""
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def key_value(value):
+    """
+    Manifest form of a key value
+
+    The value is passed back as a query parameter on resume, so it must
+    survive JSON exactly: numbers and text stay as they are, anything else
+    (numeric, dates, uuid, bytea) is stored as a literal PostgreSQL casts back
+    to the key column's type.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (bytes, memoryview)):
+        return '\\x' + bytes(value).hex()
+    return str(value)
+
+
+def discard_export(file_path):
+    """Remove the chunks and manifest of an earlier export to file_path"""
+    manifest = load_manifest(file_path)
+    if manifest is None:
+        return
+    folder = os.path.dirname(file_path)
+    paths = [os.path.join(folder, chunk['file']) for chunk in manifest['chunks']]
+    remove_files(paths + [chunk_path(file_path, len(manifest['chunks'])), manifest_path(file_path)])
+
+
+def export_resumable(db_manager, export_type, file_path, geometry_column, chunk_rows=DEFAULT_CHUNK_ROWS,
+                     precision=None, merge=False, restart=False, itersize=DEFAULT_ITERSIZE, progress=None):
+    """
+    Export the current result in primary key order as numbered chunk files
+
+    The query is fixed once when the export starts (see
+    DatabaseManager.chunk_source), so a new query or table selection made
+    while the export runs in the background does not change later chunks.
+    Every chunk is one keyset query (see DatabaseManager.stream_chunk) that
+    starts after the last key of the previous chunk. Once a chunk is closed
+    and synced, it is committed by rewriting the manifest with the chunk and
+    its last key. If the export dies, calling this again with the same
+    file_path resumes after the last committed chunk; the chunk that was in
+    progress is written again from its start.
+
+    Each chunk runs in its own transaction, so rows changed while a long
+    export is running may or may not be included.
+
+    Args:
+        chunk_rows: Rows per chunk
+        precision: Coordinate decimals for GeoJSON
+        merge: Once complete, merge the chunks into file_path and drop them
+            together with the manifest (only for PARALLEL_EXPORT_TYPES).
+            On resume, chunk_rows, precision and merge come from the manifest
+        restart: Discard an earlier export to file_path instead of resuming it
+        progress: dbexport.ExportProgress; rows of committed chunks count as
+            already exported. Cancelling it keeps the committed chunks
+
+    Returns:
+        dict: 'rows', 'skipped', 'files', 'chunks' (chunks written by this
+              call) and 'resumed' (rows already exported by earlier runs)
+    """
+    if export_type not in RESUMABLE_EXPORT_TYPES:
+        raise ValueError(f"Resumable export does not support {export_type}")
+    if merge and export_type not in PARALLEL_EXPORT_TYPES:
+        raise ValueError(f"Chunks of {export_type} cannot be merged")
+
+    source = db_manager.chunk_source()
+    fingerprint = source['fingerprint']
+    if restart:
+        discard_export(file_path)
+    manifest = load_manifest(file_path)
+    if manifest is not None and (manifest['export_type'] != export_type or manifest['fingerprint'] != fingerprint
+                                 or manifest['geometry_column'] != geometry_column):
+        raise ValueError("The existing manifest belongs to a different query or format; restart the export instead")
+    if manifest is None:
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'export_type': export_type,
+            'fingerprint': fingerprint,
+            'geometry_column': geometry_column,
+            'chunk_rows': int(chunk_rows),
+            'precision': precision,
+            'merge': bool(merge),
+            'rows': 0,
+            'skipped': 0,
+            'last_key': None,
+            'complete': False,
+            'chunks': [],
+        }
+        save_manifest(file_path, manifest)
+
+    resumed = manifest['rows']
+    if progress:
+        progress.add(resumed, resumed)
+    folder = os.path.dirname(file_path)
+    chunks_written = 0
+    while not manifest['complete']:
+        if progress:
+            progress.check()
+        path = chunk_path(file_path, len(manifest['chunks']))
+        # Leftover of a chunk that was never committed
+        remove_files([path])
+        success, result = db_manager.stream_chunk(source, manifest['last_key'], manifest['chunk_rows'], itersize)
+        if not success:
+            raise RuntimeError(result)
+        key_count = result['key_count']
+        columns = result['columns'][key_count:]
+        batches = result['batches']
+        writer = None
+        fetched = 0
+        last_key = None
+        try:
+            for batch in batches:
+                if progress:
+                    progress.check()
+                    progress.add(fetched=len(batch))
+                if writer is None:
+                    writer = create_writer(export_type, path, columns, geometry_column,
+                                           precision=manifest['precision'])
+                writer.write_batch([row[key_count:] for row in batch])
+                fetched += len(batch)
+                last_key = [key_value(value) for value in batch[-1][:key_count]]
+                if progress:
+                    progress.rows_written = manifest['rows'] + writer.rows_written
+            if writer is not None:
+                writer.close()
+                sync_file(path)
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        finally:
+            batches.close()
+
+        if writer is not None:
+            manifest['chunks'].append({
+                'file': os.path.basename(path),
+                'rows': writer.rows_written,
+                'skipped': getattr(writer, 'rows_skipped', 0),
+                'last_key': last_key,
+            })
+            manifest['rows'] += writer.rows_written
+            manifest['skipped'] += getattr(writer, 'rows_skipped', 0)
+            manifest['last_key'] = last_key
+            chunks_written += 1
+        manifest['complete'] = fetched < manifest['chunk_rows']
+        save_manifest(file_path, manifest)
+
+    paths = [os.path.join(folder, chunk['file']) for chunk in manifest['chunks']]
+    if manifest['merge'] and paths:
+        try:
+            merge_parts(export_type, paths, file_path)
+        except BaseException:
+            remove_files([file_path])
+            raise
+        remove_files(paths + [manifest_path(file_path)])
+        paths = [file_path]
+    return {
+        'rows': manifest['rows'],
+        'skipped': manifest['skipped'],
+        'files': paths,
+        'chunks': chunks_written,
+        'resumed': resumed,
+    }
@@ -0,0 +1,937 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming Export Writers
+Write query results batch by batch so memory use does not grow with the
+size of the export
+"""
+
+import csv
+import datetime
+import decimal
+import gzip
+import json
+import math
+import os
+import queue
+import threading
+import uuid
+
+import numpy as np
+import shapely
+
+from database import decode_geometries, result_to_geodataframe
+
+# File suffixes that switch on output compression
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# Rows collected into one Parquet row group
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# Record batches buffered between the fetch loop and the OGR writer thread
+OGR_QUEUE_BATCHES = 4
+
+# Seconds to wait for GDAL to finish a layer (index build, final commit) after the last batch
+OGR_FINISH_TIMEOUT = 3600
+
+# Batches buffered for each writer of a FanOutWriter
+FANOUT_QUEUE_BATCHES = 4
+
+# Seconds between checks that a FanOutWriter thread is still alive while its queue is full
+FANOUT_POLL_INTERVAL = 0.5
+
+# Export types create_writer handles, which can share one query run (see FanOutWriter)
+FANOUT_EXPORT_TYPES = ('excel', 'geojson', 'geojsonseq', 'geoparquet', 'flatgeobuf', 'gpkg')
+
+# Excel worksheet limits: rows per sheet (including the header) and characters per cell
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_CHARS = 32767
+
+# Files that make up a Shapefile besides the .shp itself
+SHAPEFILE_SIDECARS = ('.shx', '.dbf', '.prj', '.cpg')
+
+# OGR drivers and the layer creation options used for each export format
+OGR_FORMATS = {
+    'flatgeobuf': ('FlatGeobuf', {'SPATIAL_INDEX': 'YES'}),
+    'gpkg': ('GPKG', {'SPATIAL_INDEX': 'YES'}),
+}
+
+
+def compression_from_path(file_path):
+    """Infer the compression ('gzip', 'zstd' or None) from the file suffix"""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(file_path)[1].lower())
+
+
+def open_output(file_path, compression=None):
+    """
+    Open a binary output file, optionally compressing on the fly
+
+    zstd needs the optional 'zstandard' package.
+    """
+    if compression == 'gzip':
+        return gzip.open(file_path, 'wb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.ZstdCompressor().stream_writer(open(file_path, 'wb'), closefd=True)
+    if compression:
+        raise ValueError(f"Unsupported compression: {compression}")
+    return open(file_path, 'wb')
+
+
+def json_default(value):
+    """Serialize database values that json does not handle natively"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value)
+
+
+def json_property(value):
+    """
+    GeoJSON form of a property value: NaN and Infinity (float or numeric,
+    also inside arrays) have no JSON representation and become null
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, decimal.Decimal):
+        return value if value.is_finite() else None
+    if isinstance(value, list):
+        return [json_property(item) for item in value]
+    return value
+
+
+def round_coordinates(geometries, precision):
+    """Round all coordinates of a geometry array to the given number of decimals"""
+    # The input array may be shared with other writers (see FanOutWriter)
+    geometries = geometries.copy()
+    has_z = shapely.has_z(geometries)
+    for mask, include_z in ((~has_z, False), (has_z, True)):
+        subset = geometries[mask]
+        if len(subset):
+            coordinates = shapely.get_coordinates(subset, include_z=include_z)
+            geometries[mask] = shapely.set_coordinates(subset, np.round(coordinates, precision))
+    return geometries
+
+
+def import_pyarrow():
+    """Import pyarrow, which the Arrow based writers need"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("This export format requires the 'pyarrow' package (pip install pyarrow)")
+    return pyarrow
+
+
+def arrow_value(value):
+    """Convert database values that Arrow cannot infer a stable type for"""
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=json_default)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def arrow_array(pa, values, data_type=None):
+    """
+    Build an Arrow array for one property column
+
+    With a data_type (the schema fixed by the first batch) values are
+    converted to it; a column that was all NULL in the first batch is
+    typed as string and receives the text form of later values.
+    """
+    values = [arrow_value(value) for value in values]
+    if data_type is None:
+        array = pa.array(values)
+        return array.cast(pa.string()) if pa.types.is_null(array.type) else array
+    try:
+        return pa.array(values, type=data_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        if not pa.types.is_string(data_type):
+            raise
+        return pa.array([None if value is None else str(value) for value in values], type=data_type)
+
+
+def crs_for_srid(srid):
+    """Return a pyproj CRS for an SRID, None when it is unknown"""
+    if not srid:
+        return None
+    from pyproj import CRS
+    try:
+        return CRS.from_epsg(int(srid))
+    except Exception:
+        return None
+
+
+def decode_batch(rows, geometry_index):
+    """Decode the geometry column of a row batch into a shapely array"""
+    return np.asarray(decode_geometries([row[geometry_index] for row in rows]))
+
+
+class StreamWriter:
+    """
+    Base class for writers fed with row batches
+
+    Subclasses implement _write_rows(rows) and may override _finish().
+    write_batch() can be called any number of times, followed by close()
+    on success or abort() on failure, which also removes the partial file.
+    """
+
+    # Whether the result may come without a geometry column
+    geometry_optional = False
+
+    def __init__(self, file_path, columns, geometry_column):
+        self.file_path = file_path
+        self.columns = list(columns)
+        if geometry_column not in self.columns:
+            if not self.geometry_optional:
+                raise ValueError(f"Geometry column not in result: {geometry_column}")
+            geometry_column = None
+        self.geometry_column = geometry_column
+        self.geometry_index = self.columns.index(geometry_column) if geometry_column else None
+        self.rows_written = 0
+        self._decoded = None
+
+    def write_batch(self, rows, geometries=None):
+        """
+        Write one batch of result rows
+        
+        Args:
+            geometries: The batch's geometry column already decoded (see
+                decode_batch), so writers fed the same batch decode it once
+        """
+        if rows:
+            self._decoded = geometries
+            try:
+                self._write_rows(rows)
+            finally:
+                self._decoded = None
+            self.rows_written += len(rows)
+
+    def close(self):
+        """Finish the file"""
+        self._finish()
+
+    def abort(self):
+        """Close and delete the partially written file"""
+        try:
+            self._finish()
+        except Exception:
+            pass
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def _decode(self, rows):
+        """Decode the geometry column of a batch in one vectorized call, unless write_batch got it decoded"""
+        if self._decoded is not None:
+            return self._decoded
+        return decode_batch(rows, self.geometry_index)
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+
+class GeoJSONWriter(StreamWriter):
+    """
+    Incremental GeoJSON FeatureCollection or GeoJSONSeq writer
+
+    Features are serialized as they arrive: geometry with shapely.to_geojson
+    for the whole batch, properties with json.dumps. A FeatureCollection is
+    opened on the first batch and closed in close(); GeoJSONSeq writes one
+    feature per line.
+    """
+
+    def __init__(self, file_path, columns, geometry_column, sequence=False, compression=None, precision=None):
+        """
+        Args:
+            sequence: Write newline-delimited GeoJSONSeq instead of a FeatureCollection
+            compression: None, 'gzip' or 'zstd'; inferred from the file suffix when None
+            precision: Number of coordinate decimals to keep, None for full precision
+        """
+        super().__init__(file_path, columns, geometry_column)
+        self.sequence = sequence
+        self.precision = precision
+        self.property_names = [name for name in self.columns if name != geometry_column]
+        self.output = open_output(file_path, compression or compression_from_path(file_path))
+        self.started = False
+
+    def _write_rows(self, rows):
+        geometries = self._decode(rows)
+        if not self.started:
+            self._write_header(geometries)
+        if self.precision is not None:
+            geometries = round_coordinates(geometries, self.precision)
+        geometry_json = shapely.to_geojson(geometries)
+
+        features = []
+        for row, geometry in zip(rows, geometry_json):
+            properties = dict(zip(self.property_names,
+                                  (json_property(value) for i, value in enumerate(row) if i != self.geometry_index)))
+            features.append('{"type": "Feature", "properties": %s, "geometry": %s}' % (
+                json.dumps(properties, ensure_ascii=False, default=json_default, allow_nan=False),
+                geometry if geometry is not None else 'null'))
+
+        separator = '\n' if self.sequence else ',\n'
+        text = separator.join(features)
+        if self.sequence:
+            text += '\n'
+        elif self.rows_written:
+            text = ',\n' + text
+        self.output.write(text.encode('utf-8'))
+
+    def _write_header(self, geometries):
+        """Open the FeatureCollection, naming the CRS when it is not WGS 84"""
+        self.started = True
+        if self.sequence:
+            return
+        header = '{"type": "FeatureCollection",\n'
+        srids = shapely.get_srid(geometries)
+        srids = srids[srids > 0]
+        if len(srids) and srids[0] != 4326:
+            header += '"crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::%d"}},\n' % srids[0]
+        self.output.write((header + '"features": [\n').encode('utf-8'))
+
+    def _finish(self):
+        if self.output.closed:
+            return
+        if not self.sequence:
+            if not self.started:
+                self.output.write(b'{"type": "FeatureCollection",\n"features": [\n')
+            self.output.write(b'\n]}\n')
+        self.output.close()
+
+
+class ArrowWriter(StreamWriter):
+    """
+    Base class for writers that turn every batch into an Arrow record batch
+
+    Properties keep the types Arrow infers from the first batch, geometry is
+    stored as ISO WKB in a binary column.
+    """
+
+    def __init__(self, file_path, columns, geometry_column):
+        super().__init__(file_path, columns, geometry_column)
+        self.pa = import_pyarrow()
+        self.schema = None
+        self.srid = None
+
+    def _record_batch(self, rows, geometries):
+        """Convert one batch of rows and its decoded geometries to a RecordBatch"""
+        pa = self.pa
+        arrays, fields = [], []
+        for index, name in enumerate(self.columns):
+            if index == self.geometry_index:
+                array = pa.array(shapely.to_wkb(geometries, include_srid=False, flavor='iso'), type=pa.binary())
+            else:
+                data_type = self.schema.field(name).type if self.schema is not None else None
+                array = arrow_array(pa, [row[index] for row in rows], data_type)
+            arrays.append(array)
+            fields.append(pa.field(name, array.type))
+        if self.schema is None:
+            srids = shapely.get_srid(geometries)
+            srids = srids[srids > 0]
+            self.srid = int(srids[0]) if len(srids) else None
+            return pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+        return pa.RecordBatch.from_arrays(arrays, schema=self._base_schema())
+
+    def _base_schema(self):
+        """Schema of the record batches without format specific columns"""
+        return self.schema
+
+    def _empty_schema(self):
+        """Schema used when the result has no rows: text properties, binary geometry"""
+        pa = self.pa
+        return pa.schema([pa.field(name, pa.binary() if index == self.geometry_index else pa.string())
+                          for index, name in enumerate(self.columns)])
+
+
+class GeoParquetWriter(ArrowWriter):
+    """
+    GeoParquet writer streaming row groups from Arrow record batches
+
+    Rows are buffered until a row group is full and then written, so memory
+    use is bounded by the row group size. Every row also gets a bounding box
+    struct column declared as the GeoParquet 1.1 bbox covering; Parquet
+    column statistics on it let readers skip row groups spatially.
+    """
+
+    def __init__(self, file_path, columns, geometry_column, row_group_size=PARQUET_ROW_GROUP_SIZE,
+                 compression='zstd'):
+        """
+        Args:
+            row_group_size: Number of rows per Parquet row group
+            compression: Parquet column compression codec
+        """
+        super().__init__(file_path, columns, geometry_column)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.bbox_column = f"{geometry_column}_bbox"
+        while self.bbox_column in self.columns:
+            self.bbox_column += '_'
+        self.writer = None
+        self.pending = []
+        self.pending_rows = 0
+
+    def _base_schema(self):
+        return self.schema.remove(self.schema.get_field_index(self.bbox_column)).remove_metadata()
+
+    def _write_rows(self, rows):
+        geometries = self._decode(rows)
+        batch = self._record_batch(rows, geometries)
+        batch = batch.append_column(self.bbox_column, self._bbox_array(geometries))
+        if self.writer is None:
+            self._open(batch.schema)
+        self.pending.append(batch.replace_schema_metadata(self.schema.metadata))
+        self.pending_rows += len(rows)
+        if self.pending_rows >= self.row_group_size:
+            self._flush()
+
+    def _bbox_array(self, geometries):
+        """Per-row xmin/ymin/xmax/ymax struct, NULL for missing or empty geometry"""
+        pa = self.pa
+        bounds = shapely.bounds(geometries)
+        missing = np.isnan(bounds).any(axis=1)
+        return pa.StructArray.from_arrays(
+            [pa.array(bounds[:, i], mask=missing) for i in range(4)],
+            names=['xmin', 'ymin', 'xmax', 'ymax'],
+            mask=pa.array(missing))
+
+    def _geo_metadata(self):
+        """The 'geo' file metadata required by the GeoParquet specification"""
+        crs = crs_for_srid(self.srid)
+        column = {
+            'encoding': 'WKB',
+            'geometry_types': [],
+            'crs': crs.to_json_dict() if crs is not None else None,
+            'covering': {'bbox': {key: [self.bbox_column, key] for key in ('xmin', 'ymin', 'xmax', 'ymax')}},
+        }
+        return {'version': '1.1.0', 'primary_column': self.geometry_column,
+                'columns': {self.geometry_column: column}}
+
+    def _open(self, schema):
+        metadata = {b'geo': json.dumps(self._geo_metadata()).encode('utf-8')}
+        self.schema = schema.with_metadata(metadata)
+        self.writer = self.pa.parquet.ParquetWriter(self.file_path, self.schema, compression=self.compression)
+
+    def _flush(self):
+        if self.pending:
+            table = self.pa.Table.from_batches(self.pending, schema=self.schema)
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+            self.pending = []
+            self.pending_rows = 0
+
+    def _finish(self):
+        if self.writer is None:
+            pa = self.pa
+            bbox_type = pa.struct([(key, pa.float64()) for key in ('xmin', 'ymin', 'xmax', 'ymax')])
+            self._open(self._empty_schema().append(pa.field(self.bbox_column, bbox_type)))
+        elif self.writer.is_open:
+            self._flush()
+        else:
+            return
+        self.writer.close()
+
+
+class OGRArrowWriter(ArrowWriter):
+    """
+    FlatGeobuf / GeoPackage writer on top of GDAL's Arrow stream interface
+
+    pyogrio.write_arrow consumes a RecordBatchReader in a single call, so it
+    runs in a worker thread reading batches from a small bounded queue while
+    the fetch loop keeps producing them. GDAL then writes the whole layer in
+    one go: FlatGeobuf builds its packed Hilbert R-tree at the end, and
+    GeoPackage inserts all rows inside large transactions.
+
+    The FlatGeobuf spatial index cannot hold rows without geometry; they are
+    left out and counted in rows_skipped.
+    """
+
+    def __init__(self, file_path, columns, geometry_column, export_format, layer=None):
+        """
+        Args:
+            export_format: Key of OGR_FORMATS ('flatgeobuf' or 'gpkg')
+            layer: Layer name, defaults to the file name without suffix
+        """
+        super().__init__(file_path, columns, geometry_column)
+        try:
+            import pyogrio
+        except ImportError:
+            raise RuntimeError("This export format requires the 'pyogrio' package (pip install pyogrio)")
+        self.pyogrio = pyogrio
+        self.driver, self.layer_options = OGR_FORMATS[export_format]
+        self.layer = layer or os.path.splitext(os.path.basename(file_path))[0]
+        self.batches = queue.Queue(maxsize=OGR_QUEUE_BATCHES)
+        self.thread = None
+        self.error = None
+        self.stream_ended = False
+        self.closing = False
+        self.rows_skipped = 0
+
+    def _write_rows(self, rows):
+        geometries = self._decode(rows)
+        if self.driver == 'FlatGeobuf':
+            # The packed R-tree has no slot for NULL or empty geometry
+            keep = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+            if not keep.all():
+                self.rows_skipped += int((~keep).sum())
+                self.rows_written -= int((~keep).sum())
+                rows = [row for row, kept in zip(rows, keep) if kept]
+                geometries = geometries[keep]
+                if not rows:
+                    return
+        batch = self._record_batch(rows, geometries)
+        if self.thread is None:
+            self._start(batch.schema)
+        self._put(batch)
+
+    def _start(self, schema):
+        self.schema = schema
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _stream(self):
+        """Queued batches up to the None sentinel; records that the sentinel was read"""
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                self.stream_ended = True
+                return
+            yield batch
+
+    def _run(self):
+        """Writer thread: hand the queued batches to GDAL as one Arrow stream"""
+        try:
+            reader = self.pa.RecordBatchReader.from_batches(self.schema, self._stream())
+            crs = crs_for_srid(self.srid)
+            self.pyogrio.write_arrow(reader, self.file_path, layer=self.layer, driver=self.driver,
+                                     geometry_name=self.geometry_column, geometry_type='Unknown',
+                                     crs=crs.to_wkt() if crs is not None else None,
+                                     layer_options=self.layer_options)
+        except Exception as e:
+            self.error = e
+            # Keep draining so the producer never blocks on a dead consumer;
+            # after the sentinel (GDAL failed finishing the layer) nothing more comes
+            while not self.stream_ended:
+                self.stream_ended = self.batches.get() is None
+
+    def _put(self, item):
+        self.batches.put(item)
+        if self.error is not None:
+            raise self.error
+
+    def _finish(self):
+        if self.thread is None:
+            self._start(self._empty_schema())
+        if self.thread.is_alive():
+            # A second call (abort after a timeout) must not wait on the wedged thread again
+            if not self.closing:
+                self.closing = True
+                self.batches.put(None)
+                self.thread.join(OGR_FINISH_TIMEOUT)
+            if self.thread.is_alive():
+                raise RuntimeError(f"{self.driver} writer did not finish within {OGR_FINISH_TIMEOUT} seconds")
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class ShapefileWriter(StreamWriter):
+    """
+    Shapefile writer appending every batch to the layer with GeoDataFrame.to_file
+
+    The first batch creates the file set and fixes the field types and the
+    CRS; later batches are appended, so only one batch is held in memory.
+    """
+
+    def __init__(self, file_path, columns, geometry_column):
+        super().__init__(file_path, columns, geometry_column)
+        self.crs = None
+        self.started = False
+
+    def _write_rows(self, rows):
+        frame = result_to_geodataframe(self.columns, rows, self.geometry_column, self.crs)
+        frame.to_file(self.file_path, encoding='utf-8', mode='a' if self.started else 'w')
+        if not self.started:
+            self.crs = frame.crs
+            self.started = True
+
+    def _finish(self):
+        if not self.started:
+            # An empty result still produces a valid, empty layer
+            result_to_geodataframe(self.columns, [], self.geometry_column).to_file(self.file_path, encoding='utf-8')
+            self.started = True
+
+    def abort(self):
+        """Delete the partially written .shp and its sidecar files"""
+        self.started = True
+        super().abort()
+        for suffix in SHAPEFILE_SIDECARS:
+            path = os.path.splitext(self.file_path)[0] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def create_writer(export_type, file_path, columns, geometry_column, precision=None):
+    """
+    Create the streaming writer for an export type
+
+    Args:
+        export_type: 'excel', 'geojson', 'geojsonseq', 'geoparquet', 'flatgeobuf', 'gpkg' or 'shapefile'
+        precision: Coordinate decimals for GeoJSON/GeoJSONSeq, None for full precision
+    """
+    if export_type == 'excel':
+        return ExcelWriter(file_path, columns, geometry_column)
+    if export_type in ('geojson', 'geojsonseq'):
+        return GeoJSONWriter(file_path, columns, geometry_column, sequence=export_type == 'geojsonseq',
+                             precision=precision)
+    if export_type == 'geoparquet':
+        return GeoParquetWriter(file_path, columns, geometry_column)
+    if export_type in OGR_FORMATS:
+        return OGRArrowWriter(file_path, columns, geometry_column, export_type)
+    if export_type == 'shapefile':
+        return ShapefileWriter(file_path, columns, geometry_column)
+    raise ValueError(f"Unsupported export type: {export_type}")
+
+
+def csv_value(value):
+    """Text of a database value in a CSV export, written the way COPY ... (FORMAT csv) writes it"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('Infinity' if value > 0 else '-Infinity')
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (bytes, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=json_default)
+    return str(value)
+
+
+class CSVWriter(StreamWriter):
+    """
+    CSV/TSV writer for rows that were already fetched
+
+    Streamed exports let the server write CSV with COPY (see
+    DatabaseManager.copy_result_to); this writer produces the same layout
+    from a result held in memory, so it does not have to be queried again.
+    """
+
+    geometry_optional = True
+
+    def __init__(self, file_path, columns, geometry_column=None, delimiter=',', geometry_encoding='wkt'):
+        """
+        Args:
+            delimiter: Field delimiter (',' for CSV, '\t' for TSV)
+            geometry_encoding: 'wkt' for WKT text, 'hex' for hex EWKB
+        """
+        super().__init__(file_path, columns, geometry_column)
+        self.geometry_encoding = geometry_encoding
+        self.output = open(file_path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.output, delimiter=delimiter, lineterminator='\n')
+        self.writer.writerow(self.columns)
+
+    def _write_rows(self, rows):
+        geometry_text = None
+        if self.geometry_index is not None and self.geometry_encoding == 'wkt':
+            geometry_text = shapely.to_wkt(self._decode(rows), rounding_precision=-1)
+        for row_index, row in enumerate(rows):
+            values = [csv_value(value) for value in row]
+            if self.geometry_index is not None:
+                value = row[self.geometry_index]
+                if geometry_text is not None:
+                    value = geometry_text[row_index]
+                elif isinstance(value, (bytes, memoryview)):
+                    # PostGIS writes EWKB as upper case hex
+                    value = bytes(value).hex().upper()
+                values[self.geometry_index] = value if value is not None else ''
+            self.writer.writerow(values)
+
+    def _finish(self):
+        self.output.close()
+
+
+def excel_value(value):
+    """Convert a database value to something both Excel engines can store"""
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        # Excel has no time zones; keep the wall-clock time in UTC
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if isinstance(value, datetime.time) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    if isinstance(value, decimal.Decimal) and not value.is_finite():
+        value = math.nan if value.is_nan() else float(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        # Excel cells cannot hold NaN or infinity; write the text PostgreSQL shows
+        return 'NaN' if math.isnan(value) else ('Infinity' if value > 0 else '-Infinity')
+    if isinstance(value, (bool, int, float, decimal.Decimal, datetime.date, datetime.time, str)) or value is None:
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=json_default)
+    return json_default(value)
+
+
+class ExcelWriter(StreamWriter):
+    """
+    Constant-memory .xlsx writer
+
+    Uses xlsxwriter in constant_memory mode (each row is flushed to disk as
+    soon as the next one starts), falling back to openpyxl's write-only
+    workbook when xlsxwriter is not installed. Geometry is written as WKT.
+
+    A sheet that reaches Excel's row limit is continued on a new sheet with
+    the same header. Text longer than Excel's cell limit (typically large
+    WKT) is moved to a side sheet in cell-sized chunks, and the cell keeps
+    the truncated text followed by a pointer to the side sheet row, so an
+    oversized value never fails the export.
+    """
+
+    geometry_optional = True
+
+    def __init__(self, file_path, columns, geometry_column=None, sheet_name='Data', long_text_sheet='Long values',
+                 max_rows=EXCEL_MAX_ROWS):
+        """
+        Args:
+            sheet_name: Name of the first data sheet; further sheets get a number suffix
+            long_text_sheet: Name of the side sheet holding oversized values
+            max_rows: Rows per sheet including the header (Excel's limit by default)
+        """
+        super().__init__(file_path, columns, geometry_column)
+        self.sheet_name = sheet_name
+        self.long_text_sheet = long_text_sheet
+        self.max_rows = max_rows
+        try:
+            import xlsxwriter
+            self.workbook = xlsxwriter.Workbook(file_path, {
+                'constant_memory': True,
+                'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+                'strings_to_numbers': False,
+                'strings_to_formulas': False,
+                'strings_to_urls': False,
+            })
+            self.engine = 'xlsxwriter'
+        except ImportError:
+            try:
+                import openpyxl
+            except ImportError:
+                raise RuntimeError("Excel export requires 'xlsxwriter' (recommended) or 'openpyxl'")
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.engine = 'openpyxl'
+        self.sheets = []
+        self.sheet = None
+        self.sheet_rows = 0
+        self.side_sheet = None
+        self.side_sheet_name = None
+        self.side_sheets = 0
+        self.side_rows = 0
+        self.values_moved = 0
+        self.closed = False
+
+    def _add_sheet(self, name):
+        if self.engine == 'xlsxwriter':
+            return self.workbook.add_worksheet(name)
+        return self.workbook.create_sheet(name)
+
+    def _append(self, sheet, row_number, values):
+        """Write one row (0-based row_number) to a sheet"""
+        if self.engine == 'xlsxwriter':
+            sheet.write_row(row_number, 0, values)
+        else:
+            sheet.append([self._openpyxl_cell(sheet, value) for value in values])
+
+    def _openpyxl_cell(self, sheet, value):
+        """Keep text that looks like a formula as text and drop characters XML cannot hold"""
+        if not isinstance(value, str):
+            return value
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        value = ILLEGAL_CHARACTERS_RE.sub('', value)
+        if not value.startswith('='):
+            return value
+        cell = WriteOnlyCell(sheet, value)
+        cell.data_type = 's'
+        return cell
+
+    def _next_sheet(self):
+        """Start a new data sheet with the header row"""
+        number = len(self.sheets) + 1
+        self.sheet = self._add_sheet(self.sheet_name if number == 1 else f"{self.sheet_name} ({number})")
+        self.sheets.append(self.sheet)
+        self._append(self.sheet, 0, self.columns)
+        self.sheet_rows = 1
+
+    def _move_long_text(self, text, column):
+        """Store an oversized value on the side sheet and return the cell text pointing to it"""
+        if self.side_sheet is None or self.side_rows >= self.max_rows:
+            self.side_sheets += 1
+            name = self.long_text_sheet if self.side_sheets == 1 else f"{self.long_text_sheet} ({self.side_sheets})"
+            self.side_sheet = self._add_sheet(name)
+            self._append(self.side_sheet, 0, ['Sheet', 'Row', 'Column', 'Length', 'Value (split into parts)'])
+            self.side_rows = 1
+            self.side_sheet_name = name
+        data_sheet = self.sheet_name if len(self.sheets) == 1 else f"{self.sheet_name} ({len(self.sheets)})"
+        chunks = [text[i:i + EXCEL_MAX_CELL_CHARS] for i in range(0, len(text), EXCEL_MAX_CELL_CHARS)]
+        self._append(self.side_sheet, self.side_rows,
+                     [data_sheet, self.sheet_rows + 1, column, len(text)] + chunks)
+        pointer = f" ... [{len(text)} characters, full value in '{self.side_sheet_name}' row {self.side_rows + 1}]"
+        self.side_rows += 1
+        self.values_moved += 1
+        return text[:EXCEL_MAX_CELL_CHARS - len(pointer)] + pointer
+
+    def _write_rows(self, rows):
+        geometry_text = None
+        if self.geometry_index is not None:
+            # Full precision, as ST_AsText writes it (shapely rounds to 6 decimals by default)
+            geometry_text = shapely.to_wkt(self._decode(rows), rounding_precision=-1)
+        for row_index, row in enumerate(rows):
+            if self.sheet is None or self.sheet_rows >= self.max_rows:
+                self._next_sheet()
+            values = []
+            for index, value in enumerate(row):
+                if index == self.geometry_index:
+                    value = geometry_text[row_index]
+                else:
+                    value = excel_value(value)
+                if isinstance(value, str) and len(value) > EXCEL_MAX_CELL_CHARS:
+                    value = self._move_long_text(value, self.columns[index])
+                values.append(value)
+            self._append(self.sheet, self.sheet_rows, values)
+            self.sheet_rows += 1
+
+    def _finish(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.sheet is None:
+            self._next_sheet()
+        if self.engine == 'xlsxwriter':
+            self.workbook.close()
+        else:
+            self.workbook.save(self.file_path)
+
+
+class FanOutWriter(StreamWriter):
+    """
+    Feed every batch of one query run to several writers at once
+    
+    The geometry column is decoded once per batch and the same shapely array
+    goes to every writer, each running in its own thread behind a small
+    bounded queue: a slow format holds back the fetch loop instead of
+    buffering the result. Encoding that releases the GIL (GEOS, Arrow, GDAL,
+    compression) overlaps across formats. A writer that fails is aborted and
+    dropped while the others carry on; see errors. rows_written is the
+    smallest count among the writers still running, so it only counts rows
+    every format has actually written.
+    """
+    
+    geometry_optional = True
+    
+    # Queue item telling the writer threads to abort instead of close
+    ABORT = object()
+    
+    def __init__(self, writers, queue_batches=FANOUT_QUEUE_BATCHES):
+        """
+        Args:
+            writers: StreamWriters created for the same result columns
+        """
+        geometry_column = next((writer.geometry_column for writer in writers if writer.geometry_column), None)
+        super().__init__(writers[0].file_path, writers[0].columns, geometry_column)
+        self.writers = list(writers)
+        self.errors = {}
+        self.queues = [queue.Queue(maxsize=queue_batches) for _ in self.writers]
+        self.threads = [threading.Thread(target=self._run, args=(index,), daemon=True)
+                        for index in range(len(self.writers))]
+        for thread in self.threads:
+            thread.start()
+    
+    def _run(self, index):
+        """Writer thread: write the queued batches, then close (None) or abort (ABORT)"""
+        writer, batches = self.writers[index], self.queues[index]
+        item = None
+        try:
+            while True:
+                item = batches.get()
+                if item is None or item is self.ABORT:
+                    break
+                writer.write_batch(*item)
+            if item is self.ABORT:
+                writer.abort()
+            else:
+                writer.close()
+        except Exception as e:
+            self.errors[index] = e
+            try:
+                writer.abort()
+            except Exception:
+                pass
+            # Keep draining so the producer never blocks on a dead consumer
+            while item is not None and item is not self.ABORT:
+                item = batches.get()
+    
+    @property
+    def rows_written(self):
+        counts = [writer.rows_written for index, writer in enumerate(self.writers) if index not in self.errors]
+        return min(counts) if counts else 0
+    
+    @rows_written.setter
+    def rows_written(self, value):
+        # StreamWriter.write_batch counts rows when they are queued; the writers keep the real counts
+        pass
+    
+    def _put(self, index, item):
+        """Queue an item for a writer thread, unless the thread has already ended"""
+        while self.threads[index].is_alive():
+            try:
+                self.queues[index].put(item, timeout=FANOUT_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+    
+    def _raise_if_all_failed(self):
+        if len(self.errors) == len(self.writers):
+            raise self.errors[min(self.errors)]
+    
+    def _write_rows(self, rows):
+        geometries = self._decode(rows) if self.geometry_index is not None else None
+        for index in range(len(self.writers)):
+            if index not in self.errors:
+                self._put(index, (rows, geometries))
+        self._raise_if_all_failed()
+    
+    def _stop(self, item):
+        for index in range(len(self.writers)):
+            self._put(index, item)
+        for thread in self.threads:
+            thread.join()
+        self.queues = []
+    
+    def _finish(self):
+        if not self.queues:
+            return
+        self._stop(None)
+        self._raise_if_all_failed()
+    
+    def abort(self):
+        """Abort every writer and delete their partial files"""
+        if self.queues:
+            self._stop(self.ABORT)
+    
+    def results(self):
+        """
+        Returns:
+            list: (writer, exception or None) for every writer, in order
+        """
+        return [(writer, self.errors.get(index)) for index, writer in enumerate(self.writers)]
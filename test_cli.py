@@ -0,0 +1,230 @@
+import json
+import os
+
+import pytest
+
+import cli
+from cli import SpecError, build_jobs, connection_config, export_type_for, fanout_groups, read_spec
+
+CONNECTION = {'host': 'db.example.com', 'database': 'gis', 'user': 'export'}
+
+
+def write_spec(tmp_path, spec, name='spec.json'):
+    path = tmp_path / name
+    path.write_text(spec if isinstance(spec, str) else json.dumps(spec), encoding='utf-8')
+    return str(path)
+
+
+def make_output(export_type, **options):
+    return {'path': f"out.{export_type}", 'export_type': export_type, 'options': options}
+
+
+def test_read_spec_json_and_yaml(tmp_path):
+    spec = {'connection': CONNECTION, 'jobs': [{'table': 'roads', 'outputs': ['roads.parquet']}]}
+    assert read_spec(write_spec(tmp_path, spec)) == spec
+    yaml_text = "connection:\n  host: db\njobs:\n  - table: roads\n    outputs: [roads.parquet]\n"
+    assert read_spec(write_spec(tmp_path, yaml_text, 'spec.yaml'))['jobs'][0]['outputs'] == ['roads.parquet']
+
+
+@pytest.mark.parametrize('name, text, message', [
+    ('spec.json', '{"jobs": [', 'Invalid job spec'),
+    ('spec.json', '[1, 2]', 'must be a mapping'),
+    ('spec.json', '{"jobs": [], "job": []}', 'Unknown keys in job spec: job'),
+    ('spec.yaml', 'jobs: [', 'Invalid job spec'),
+])
+def test_read_spec_rejects_invalid_files(tmp_path, name, text, message):
+    with pytest.raises(SpecError, match=message):
+        read_spec(write_spec(tmp_path, text, name))
+
+
+def test_read_spec_missing_file(tmp_path):
+    with pytest.raises(SpecError, match='Cannot read job spec'):
+        read_spec(str(tmp_path / 'missing.json'))
+
+
+def test_connection_config_defaults_and_password_env(monkeypatch):
+    monkeypatch.setenv('DBQUERY_TEST_PASSWORD', 'secret')
+    config = connection_config({'connection': {**CONNECTION, 'password_env': 'DBQUERY_TEST_PASSWORD'}})
+    assert config == {**CONNECTION, 'password': 'secret', 'port': 5432, 'schema': 'public'}
+
+    monkeypatch.delenv('DBQUERY_TEST_PASSWORD')
+    with pytest.raises(SpecError, match='DBQUERY_TEST_PASSWORD'):
+        connection_config({'connection': {**CONNECTION, 'password_env': 'DBQUERY_TEST_PASSWORD'}})
+    with pytest.raises(SpecError, match='missing database, user'):
+        connection_config({'connection': {'host': 'db'}})
+
+
+@pytest.mark.parametrize('path, export_format, expected', [
+    ('a.parquet', None, 'geoparquet'),
+    ('a.GeoJSONL.gz', None, 'geojsonseq'),
+    ('a.geojson.zst', None, 'geojson'),
+    ('a.txt', 'tsv', 'tsv'),
+    ('a.fgb', None, 'flatgeobuf'),
+])
+def test_export_type_from_format_or_suffix(path, export_format, expected):
+    assert export_type_for(path, export_format) == expected
+
+
+@pytest.mark.parametrize('path, export_format', [('a.txt', None), ('a.gz', None), ('a.csv', 'xls')])
+def test_export_type_unknown(path, export_format):
+    with pytest.raises(SpecError):
+        export_type_for(path, export_format)
+
+
+def test_build_jobs_resolves_paths_defaults_and_options(tmp_path):
+    spec = {
+        'defaults': {'geometry_column': 'geom', 'precision': 5},
+        'jobs': [
+            {'table': 'roads', 'spatial_file': 'area.geojson',
+             'outputs': ['roads.geojsonl.gz', {'path': 'roads.dat', 'format': 'csv', 'geometry_encoding': 'hex'}]},
+            {'name': 'report', 'sql': 'SELECT 1', 'parallel': 4, 'outputs': [{'path': 'r.parquet', 'precision': 2}]},
+        ],
+    }
+    roads, report = build_jobs(spec, '/specs', '/exports')
+
+    assert roads['name'] == 'roads'
+    assert roads['geometry_column'] == 'geom'
+    assert roads['spatial_file'] == os.path.join('/specs', 'area.geojson')
+    assert roads['outputs'] == [
+        {'path': os.path.join('/exports', 'roads.geojsonl.gz'), 'export_type': 'geojsonseq',
+         'options': {'precision': 5}},
+        {'path': os.path.join('/exports', 'roads.dat'), 'export_type': 'csv',
+         'options': {'precision': 5, 'geometry_encoding': 'hex'}},
+    ]
+    # Output options override the job's, which override the defaults
+    assert report['outputs'][0]['options'] == {'precision': 2, 'parallel': 4}
+
+
+@pytest.mark.parametrize('jobs, message', [
+    ([], 'no jobs'),
+    (['roads'], 'must be a mapping'),
+    ([{'table': 't', 'sql': 'SELECT 1', 'outputs': ['a.csv']}], "exactly one of 'table' and 'sql'"),
+    ([{'sql': 'SELECT 1', 'spatial_file': 'a.shp', 'outputs': ['a.csv']}], 'spatial_file cannot be combined'),
+    ([{'table': 't', 'outputs': []}], 'has no outputs'),
+    ([{'table': 't', 'outputs': [{'format': 'csv'}]}], 'needs a path'),
+    ([{'table': 't', 'outputs': [{'path': 'a.csv', 'size': 1}]}], 'Unknown output keys in job t: size'),
+    ([{'table': 't', 'filters': 'x', 'outputs': ['a.csv']}], 'Unknown keys in job t: filters'),
+    ([{'table': 't', 'outputs': ['a.csv', 'a.csv']}], 'same file twice'),
+    ([{'table': 't', 'outputs': ['a.csv']}, {'table': 't', 'outputs': ['b.csv']}], 'Duplicate job names: t'),
+])
+def test_build_jobs_rejects_invalid_jobs(jobs, message):
+    with pytest.raises(SpecError, match=message):
+        build_jobs({'jobs': jobs}, '/specs', '/exports')
+
+
+def test_fanout_groups_share_one_query_per_geojson_precision():
+    excel = make_output('excel')
+    parquet = make_output('geoparquet')
+    geojson_5 = make_output('geojson', precision=5)
+    geojsonseq_5 = make_output('geojsonseq', precision=5)
+    geojson_2 = make_output('geojson', precision=2)
+    csv = make_output('csv')
+    parallel = make_output('gpkg', parallel=4)
+
+    groups = fanout_groups([excel, geojson_5, csv, parquet, geojson_2, parallel, geojsonseq_5])
+    assert groups == [[geojson_5, geojsonseq_5, excel, parquet], [csv], [geojson_2], [parallel]]
+    assert cli.fanout_precision(groups[0]) == 5
+
+
+def test_fanout_groups_without_geojson():
+    excel, gpkg = make_output('excel'), make_output('gpkg')
+    groups = fanout_groups([excel, gpkg])
+    assert groups == [[excel, gpkg]]
+    assert cli.fanout_precision(groups[0]) is None
+
+
+@pytest.fixture
+def spec_path(tmp_path):
+    return write_spec(tmp_path, {
+        'connection': CONNECTION,
+        'jobs': [{'table': 'roads', 'outputs': ['roads.parquet']},
+                 {'table': 'rivers', 'outputs': ['rivers.gpkg']}],
+    })
+
+
+def fake_run_job(failing=()):
+    def run_job(self, job):
+        success = job['name'] not in failing
+        return {'name': job['name'], 'success': success, 'error': None if success else 'boom',
+                'outputs': [{'path': output['path'], 'rows': 3 if success else 0} for output in job['outputs']]}
+    return run_job
+
+
+def test_main_invalid_spec_exits_2(tmp_path, capsys):
+    assert cli.main([write_spec(tmp_path, {'jobs': []})]) == cli.EXIT_INVALID_SPEC
+    assert 'error:' in capsys.readouterr().err
+
+
+def test_main_unknown_only_job_exits_2(spec_path):
+    assert cli.main([spec_path, '--only', 'lakes']) == cli.EXIT_INVALID_SPEC
+
+
+def test_main_invalid_concurrency_exits_2(spec_path, tmp_path):
+    assert cli.main([spec_path, '--jobs', '-1', '--dry-run']) == cli.EXIT_INVALID_SPEC
+    spec = {'connection': CONNECTION, 'concurrency': 'two', 'jobs': [{'table': 'roads', 'outputs': ['a.csv']}]}
+    assert cli.main([write_spec(tmp_path, spec, 'other.json'), '--dry-run']) == cli.EXIT_INVALID_SPEC
+
+
+def test_main_bad_arguments_exit_2(spec_path):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main([spec_path, '--jobs', 'many'])
+    assert exit_info.value.code == cli.EXIT_INVALID_SPEC
+
+
+def test_main_dry_run_lists_outputs(spec_path, tmp_path, capsys):
+    assert cli.main([spec_path, '--dry-run', '--output-dir', str(tmp_path / 'out')]) == cli.EXIT_OK
+    err = capsys.readouterr().err
+    assert f"[roads] geoparquet -> {tmp_path / 'out' / 'roads.parquet'}" in err
+
+
+def test_main_success_writes_summary(spec_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(cli.JobRunner, 'run_job', fake_run_job())
+    summary_path = str(tmp_path / 'summary.json')
+    assert cli.main([spec_path, '--only', 'roads', '--summary', summary_path]) == cli.EXIT_OK
+
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary['succeeded'], summary['failed'], summary['rows']) == (1, 0, 3)
+    assert [job['name'] for job in summary['jobs']] == ['roads']
+    with open(summary_path, encoding='utf-8') as f:
+        assert json.load(f) == summary
+
+
+def test_main_failed_job_exits_1(spec_path, monkeypatch, capsys):
+    monkeypatch.setattr(cli.JobRunner, 'run_job', fake_run_job(failing={'rivers'}))
+    assert cli.main([spec_path]) == cli.EXIT_JOB_FAILED
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary['succeeded'], summary['failed']) == (1, 1)
+
+
+def test_main_unreachable_database_fails_the_job(spec_path, monkeypatch, capsys):
+    monkeypatch.setattr(cli.DatabaseManager, 'connect', lambda self, config: (False, 'connection refused'))
+    assert cli.main([spec_path]) == cli.EXIT_JOB_FAILED
+    summary = json.loads(capsys.readouterr().out)
+    assert [job['error'] for job in summary['jobs']] == ['connection refused'] * 2
+
+
+def test_main_interrupt_cancels_and_exits_130(spec_path, monkeypatch, capsys):
+    real_wait = cli.wait
+    calls = []
+
+    def interrupted_wait(futures, timeout=None):
+        calls.append(1)
+        if len(calls) == 1:
+            raise KeyboardInterrupt
+        return real_wait(futures, timeout=timeout)
+
+    monkeypatch.setattr(cli, 'wait', interrupted_wait)
+    monkeypatch.setattr(cli.JobRunner, 'run_job', fake_run_job())
+    cancelled = []
+    monkeypatch.setattr(cli.JobRunner, 'cancel_all', lambda self: cancelled.append(True))
+    assert cli.main([spec_path]) == cli.EXIT_INTERRUPTED
+    assert cancelled == [True]
+    assert 'Interrupted' in capsys.readouterr().err
+
+
+def test_job_runner_skips_jobs_after_cancel():
+    runner = cli.JobRunner(CONNECTION)
+    runner.cancel_all()
+    summary = runner.run_job({'name': 'roads', 'outputs': []})
+    assert not summary['success']
+    assert summary['error'] == 'Not run (interrupted)'
@@ -0,0 +1,63 @@
+import json
+import struct
+
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point, Polygon
+
+from database import COPY_BINARY_HEADER, encode_features_copy
+
+
+def decode_copy(payload):
+    """Parse COPY binary data back into (feature_id, attrs, ewkb) tuples"""
+    assert payload.startswith(COPY_BINARY_HEADER)
+    offset = len(COPY_BINARY_HEADER)
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from('!h', payload, offset)
+        offset += 2
+        if field_count == -1:
+            break
+        assert field_count == 3
+        fields = []
+        for _ in range(field_count):
+            (length,) = struct.unpack_from('!i', payload, offset)
+            offset += 4
+            fields.append(payload[offset:offset + length])
+            offset += length
+        feature_id = struct.unpack('!q', fields[0])[0]
+        assert fields[1][:1] == b'\x01'
+        rows.append((feature_id, json.loads(fields[1][1:].decode('utf-8')), fields[2]))
+    assert offset == len(payload)
+    return rows
+
+
+def test_header_and_trailer_without_features():
+    features = gpd.GeoDataFrame({'geometry': gpd.GeoSeries([], dtype='geometry')})
+    assert encode_features_copy(features, 4326) == COPY_BINARY_HEADER + struct.pack('!h', -1)
+
+
+def test_rows_carry_feature_id_attributes_and_ewkb():
+    features = gpd.GeoDataFrame({
+        'name': ['北区', 'line\nbreak'],
+        'code': [1, 2],
+        'geometry': [Point(1, 2), Polygon([(0, 0), (1, 0), (1, 1)])],
+    })
+    rows = decode_copy(encode_features_copy(features, 4490))
+    assert [row[0] for row in rows] == [0, 1]
+    assert rows[0][1] == {'name': '北区', 'code': 1}
+    assert rows[1][1] == {'name': 'line\nbreak', 'code': 2}
+    geometry = shapely.from_wkb(rows[0][2])
+    assert shapely.get_srid(geometry) == 4490
+    assert geometry.equals(Point(1, 2))
+
+
+def test_empty_attributes_encode_as_empty_object():
+    features = gpd.GeoDataFrame({'geometry': [Point(0, 0)]})
+    assert decode_copy(encode_features_copy(features, 4326))[0][1] == {}
+
+
+def test_missing_geometries_are_skipped_but_keep_numbering():
+    features = gpd.GeoDataFrame({'id': [10, 11, 12], 'geometry': [Point(0, 0), None, Point(2, 2)]})
+    rows = decode_copy(encode_features_copy(features, 4326))
+    assert [(row[0], row[1]['id']) for row in rows] == [(0, 10), (2, 12)]
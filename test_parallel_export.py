@@ -0,0 +1,93 @@
+import gzip
+import json
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from shapely.geometry import Point
+
+from parallel_export import merge_parts, part_path
+from stream_writers import create_writer
+
+COLUMNS = ['id', 'name', 'geom']
+
+
+def make_rows(start, count):
+    return [(i, f"feature {i}", shapely.to_wkb(shapely.set_srid(Point(i, i), 4490), include_srid=True))
+            for i in range(start, start + count)]
+
+
+def write_parts(export_type, tmp_path, suffix, *part_rows):
+    """Write one part file per row list, as the partition workers do"""
+    paths = []
+    for index, rows in enumerate(part_rows):
+        path = part_path(str(tmp_path / f"data{suffix}"), index)
+        writer = create_writer(export_type, path, COLUMNS, 'geom')
+        if rows:
+            writer.write_batch(rows)
+        writer.close()
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize('file_path, expected', [
+    ('out/data.parquet', 'out/data.part001.parquet'),
+    ('data.geojsonl.gz', 'data.part001.geojsonl.gz'),
+    ('data.geojsonl.ZST', 'data.part001.geojsonl.ZST'),
+    ('data', 'data.part001'),
+])
+def test_part_path_keeps_format_and_compression_suffix(file_path, expected):
+    assert part_path(file_path, 0) == expected
+
+
+def test_part_path_label_and_digits():
+    assert part_path('data.gpkg', 41, label='chunk', digits=5) == 'data.chunk00042.gpkg'
+
+
+@pytest.mark.parametrize('suffix, opener', [('.geojsonl', open), ('.geojsonl.gz', gzip.open)])
+def test_merge_geojsonseq_concatenates_parts_in_order(tmp_path, suffix, opener):
+    parts = write_parts('geojsonseq', tmp_path, suffix, make_rows(0, 2), [], make_rows(2, 3))
+    merged = str(tmp_path / f"merged{suffix}")
+    merge_parts('geojsonseq', parts, merged)
+
+    with opener(merged, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['properties']['id'] for line in f] == [0, 1, 2, 3, 4]
+
+
+def test_merge_geoparquet_skips_empty_parts_and_widens_types(tmp_path):
+    text_names = make_rows(0, 2)
+    null_names = [(i, None, geometry) for i, _, geometry in make_rows(2, 2)]
+    parts = write_parts('geoparquet', tmp_path, '.parquet', text_names, [], null_names)
+    merged = str(tmp_path / 'merged.parquet')
+    merge_parts('geoparquet', parts, merged)
+
+    frame = gpd.read_parquet(merged)
+    assert list(frame['id']) == [0, 1, 2, 3]
+    assert list(frame['name'][:2]) == ['feature 0', 'feature 1']
+    assert frame['name'][2:].isna().all()
+    assert frame.crs.to_epsg() == 4490
+    assert b'geo' in pq.ParquetFile(merged).schema_arrow.metadata
+
+
+def test_merge_geoparquet_of_empty_parts(tmp_path):
+    parts = write_parts('geoparquet', tmp_path, '.parquet', [], [])
+    merged = str(tmp_path / 'merged.parquet')
+    merge_parts('geoparquet', parts, merged)
+    assert pq.ParquetFile(merged).metadata.num_rows == 0
+
+
+@pytest.mark.parametrize('export_type, suffix', [('flatgeobuf', '.fgb'), ('gpkg', '.gpkg')])
+def test_merge_ogr_parts_into_one_layer(tmp_path, export_type, suffix):
+    parts = write_parts(export_type, tmp_path, suffix, make_rows(0, 2), [], make_rows(2, 2))
+    merged = str(tmp_path / f"merged{suffix}")
+    merge_parts(export_type, parts, merged)
+
+    frame = gpd.read_file(merged, layer='merged')
+    assert sorted(frame['id']) == [0, 1, 2, 3]
+    assert frame.crs.to_epsg() == 4490
+
+
+def test_merge_rejects_unsupported_type(tmp_path):
+    with pytest.raises(ValueError):
+        merge_parts('excel', [], str(tmp_path / 'merged.xlsx'))
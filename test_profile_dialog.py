@@ -0,0 +1,75 @@
+from profile_dialog import MISESTIMATE_RATIO, flatten_plan, is_misestimated, plan_hints
+
+
+def make_node(node_type, total_time, rows, plan_rows, loops=1, children=(), **extra):
+    node = {
+        'Node Type': node_type,
+        'Actual Total Time': total_time,
+        'Actual Rows': rows,
+        'Actual Loops': loops,
+        'Plan Rows': plan_rows,
+        **extra,
+    }
+    if children:
+        node['Plans'] = list(children)
+    return node
+
+
+def test_flatten_plan_orders_nodes_depth_first_with_parents():
+    scan_a = make_node('Seq Scan', 4.0, 100, 100, **{'Relation Name': 'a'})
+    scan_b = make_node('Index Scan', 1.0, 1, 1, **{'Relation Name': 'b', 'Index Name': 'b_pkey'})
+    join = make_node('Nested Loop', 10.0, 100, 100, children=[scan_a, scan_b])
+    nodes = flatten_plan(make_node('Limit', 10.5, 100, 100, children=[join]))
+
+    assert [entry['label'] for entry in nodes] == [
+        'Limit', 'Nested Loop', 'Seq Scan on a', 'Index Scan using b_pkey on b']
+    assert [entry['depth'] for entry in nodes] == [0, 1, 2, 2]
+    assert [entry['parent'] for entry in nodes] == [None, 0, 1, 1]
+
+
+def test_flatten_plan_multiplies_loops_and_subtracts_children():
+    inner = make_node('Index Scan', 0.5, 2, 1, loops=100)
+    outer = make_node('Seq Scan', 2.0, 100, 100)
+    nodes = flatten_plan(make_node('Nested Loop', 60.0, 200, 100, children=[outer, inner]))
+
+    root, _, inner_entry = nodes
+    # The inner scan ran 100 times at 0.5 ms each
+    assert inner_entry['total_time'] == 50.0
+    assert inner_entry['self_time'] == 50.0
+    assert root['self_time'] == 60.0 - 2.0 - 50.0
+    assert inner_entry['loops'] == 100
+
+
+def test_flatten_plan_never_reports_negative_self_time():
+    child = make_node('Seq Scan', 5.0, 10, 10)
+    nodes = flatten_plan(make_node('Gather', 3.0, 10, 10, children=[child]))
+    assert nodes[0]['self_time'] == 0
+
+
+def test_flatten_plan_without_analyze_values():
+    nodes = flatten_plan({'Node Type': 'Result', 'Plan Rows': 1})
+    assert nodes[0]['total_time'] == 0
+    assert nodes[0]['loops'] == 1
+    assert nodes[0]['actual_rows'] == 0
+
+
+def test_is_misestimated_uses_ratio_in_both_directions():
+    assert not is_misestimated(100, 100)
+    assert not is_misestimated(100, 100 * MISESTIMATE_RATIO - 1)
+    assert is_misestimated(100, 100 * MISESTIMATE_RATIO)
+    assert is_misestimated(100 * MISESTIMATE_RATIO, 100)
+
+
+def test_is_misestimated_treats_zero_rows_as_one():
+    assert not is_misestimated(0, 1)
+    assert not is_misestimated(1, 0)
+    assert is_misestimated(0, MISESTIMATE_RATIO)
+
+
+def test_plan_hints_flag_spatial_seq_scan_and_misestimates():
+    scan = make_node('Seq Scan', 1.0, 5000, 10, **{'Relation Name': 'parcels',
+                                                   'Filter': 'ST_Intersects(geom, $1)'})
+    hints = plan_hints(flatten_plan(scan))
+    assert len(hints) == 2
+    assert 'GIST' in hints[0]
+    assert 'ANALYZE' in hints[1]
@@ -0,0 +1,132 @@
+import datetime
+import decimal
+import json
+import os
+import uuid
+
+import pytest
+import shapely
+from shapely.geometry import Point
+
+from resumable_export import chunk_path, export_resumable, key_value, load_manifest, manifest_path
+
+
+class FakeDatabase:
+    """Stands in for DatabaseManager: serves a keyed result the way stream_chunk does"""
+
+    def __init__(self, count, fingerprint='query-1', fail_after=None):
+        self.rows = [(i, i, f"feature {i}", shapely.to_wkb(Point(i, i))) for i in range(1, count + 1)]
+        self.fingerprint = fingerprint
+        # Number of rows served before the "connection" breaks, None to never fail
+        self.fail_after = fail_after
+        self.served = 0
+        self.after_keys = []
+
+    def chunk_source(self):
+        return {'fingerprint': self.fingerprint}
+
+    def stream_chunk(self, source, after_key=None, limit=None, itersize=1000):
+        assert source['fingerprint'] == self.fingerprint
+        self.after_keys.append(after_key)
+        rows = [row for row in self.rows if after_key is None or row[0] > after_key[0]][:limit]
+
+        def batches():
+            for start in range(0, len(rows), itersize):
+                if self.fail_after is not None and self.served >= self.fail_after:
+                    raise ConnectionError('server closed the connection unexpectedly')
+                batch = rows[start:start + itersize]
+                self.served += len(batch)
+                yield batch
+
+        return True, {'columns': ['__page_key_0', 'id', 'name', 'geom'], 'batches': batches(), 'key_count': 1}
+
+
+def read_ids(paths):
+    ids = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            ids += [json.loads(line)['properties']['id'] for line in f]
+    return ids
+
+
+def test_chunks_are_written_and_committed_in_key_order(tmp_path):
+    file_path = str(tmp_path / 'data.geojsonl')
+    result = export_resumable(FakeDatabase(10), 'geojsonseq', file_path, 'geom', chunk_rows=4)
+
+    assert result['rows'] == 10
+    assert result['chunks'] == 3
+    assert result['resumed'] == 0
+    assert result['files'] == [chunk_path(file_path, i) for i in range(3)]
+    assert read_ids(result['files']) == list(range(1, 11))
+    manifest = load_manifest(file_path)
+    assert manifest['complete']
+    assert manifest['last_key'] == [10]
+    assert [chunk['rows'] for chunk in manifest['chunks']] == [4, 4, 2]
+
+
+def test_result_of_whole_chunks_ends_with_an_empty_read(tmp_path):
+    database = FakeDatabase(8)
+    result = export_resumable(database, 'geojsonseq', str(tmp_path / 'data.geojsonl'), 'geom', chunk_rows=4)
+    assert result['chunks'] == 2
+    assert database.after_keys == [None, [4], [8]]
+
+
+def test_interrupted_export_resumes_after_last_committed_chunk(tmp_path):
+    file_path = str(tmp_path / 'data.geojsonl')
+    with pytest.raises(ConnectionError):
+        export_resumable(FakeDatabase(10, fail_after=6), 'geojsonseq', file_path, 'geom', chunk_rows=4,
+                         itersize=2)
+
+    manifest = load_manifest(file_path)
+    assert not manifest['complete']
+    assert (manifest['rows'], manifest['last_key']) == (4, [4])
+    # The chunk that was in progress is removed, the committed one stays
+    assert os.path.exists(chunk_path(file_path, 0))
+    assert not os.path.exists(chunk_path(file_path, 1))
+
+    database = FakeDatabase(10)
+    result = export_resumable(database, 'geojsonseq', file_path, 'geom', chunk_rows=100)
+    assert database.after_keys[0] == [4]
+    # chunk_rows of the manifest wins over the argument on resume
+    assert (result['chunks'], result['resumed'], result['rows']) == (2, 4, 10)
+    assert read_ids(result['files']) == list(range(1, 11))
+
+
+def test_manifest_of_another_query_is_refused_unless_restarted(tmp_path):
+    file_path = str(tmp_path / 'data.geojsonl')
+    with pytest.raises(ConnectionError):
+        export_resumable(FakeDatabase(10, fail_after=4), 'geojsonseq', file_path, 'geom', chunk_rows=4)
+
+    with pytest.raises(ValueError, match='different query'):
+        export_resumable(FakeDatabase(10, 'query-2'), 'geojsonseq', file_path, 'geom', chunk_rows=4)
+    with pytest.raises(ValueError, match='different query'):
+        export_resumable(FakeDatabase(10), 'geoparquet', file_path, 'geom', chunk_rows=4)
+
+    result = export_resumable(FakeDatabase(3, 'query-2'), 'geojsonseq', file_path, 'geom', chunk_rows=4,
+                              restart=True)
+    assert (result['resumed'], result['rows']) == (0, 3)
+    assert load_manifest(file_path)['fingerprint'] == 'query-2'
+
+
+def test_merge_leaves_one_file_and_drops_the_manifest(tmp_path):
+    file_path = str(tmp_path / 'data.geojsonl')
+    result = export_resumable(FakeDatabase(7), 'geojsonseq', file_path, 'geom', chunk_rows=3, merge=True)
+
+    assert result['files'] == [file_path]
+    assert read_ids([file_path]) == list(range(1, 8))
+    assert sorted(os.listdir(tmp_path)) == ['data.geojsonl']
+    assert not os.path.exists(manifest_path(file_path))
+
+
+def test_unsupported_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        export_resumable(FakeDatabase(1), 'shapefile', str(tmp_path / 'data.shp'), 'geom')
+    with pytest.raises(ValueError):
+        export_resumable(FakeDatabase(1), 'excel', str(tmp_path / 'data.xlsx'), 'geom', merge=True)
+
+
+def test_key_values_survive_json():
+    values = [7, 'abc', 1.5, None, decimal.Decimal('12.50'), datetime.date(2024, 5, 1),
+              uuid.UUID('12345678-1234-5678-1234-567812345678'), b'\x00\xff', memoryview(b'\x01')]
+    assert json.loads(json.dumps([key_value(value) for value in values])) == [
+        7, 'abc', 1.5, None, '12.50', '2024-05-01', '12345678-1234-5678-1234-567812345678', '\\x00ff', '\\x01']
@@ -0,0 +1,327 @@
+import csv
+import datetime
+import decimal
+import gzip
+import json
+import os
+import sys
+
+import geopandas as gpd
+import openpyxl
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from shapely.geometry import Point
+
+from stream_writers import (
+    EXCEL_MAX_CELL_CHARS, CSVWriter, ExcelWriter, FanOutWriter, GeoJSONWriter, GeoParquetWriter, OGRArrowWriter, ShapefileWriter)
+
+COLUMNS = ['id', 'name', 'geom']
+
+
+def ewkb(geometry, srid=4326):
+    return shapely.to_wkb(shapely.set_srid(geometry, srid), include_srid=True)
+
+
+def make_rows(start, count, srid=4326):
+    return [(i, f"feature {i}", ewkb(Point(i + 0.123456789, i / 3), srid)) for i in range(start, start + count)]
+
+
+def write_batches(writer, *batches):
+    for rows in batches:
+        writer.write_batch(rows)
+    writer.close()
+    return writer
+
+
+def test_shapefile_appends_every_batch(tmp_path):
+    path = str(tmp_path / 'out.shp')
+    writer = write_batches(ShapefileWriter(path, COLUMNS, 'geom'), make_rows(0, 3, 4490), make_rows(3, 2, 4490))
+
+    frame = gpd.read_file(path)
+    assert writer.rows_written == 5
+    assert list(frame['id']) == [0, 1, 2, 3, 4]
+    assert frame.crs.to_epsg() == 4490
+    assert frame.geometry[4].equals(Point(4.123456789, 4 / 3))
+
+
+def test_shapefile_without_rows_writes_empty_layer(tmp_path):
+    path = str(tmp_path / 'empty.shp')
+    write_batches(ShapefileWriter(path, COLUMNS, 'geom'))
+    assert len(gpd.read_file(path)) == 0
+
+
+def test_shapefile_abort_removes_sidecars(tmp_path):
+    path = str(tmp_path / 'out.shp')
+    writer = ShapefileWriter(path, COLUMNS, 'geom')
+    writer.write_batch(make_rows(0, 2))
+    writer.abort()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_csv_writes_header_values_and_full_precision_wkt(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = [(1, None, ewkb(Point(1.123456789, 2))), (2, 'a,"b"', None)]
+    write_batches(CSVWriter(path, COLUMNS, 'geom'), rows)
+
+    with open(path, encoding='utf-8', newline='') as f:
+        assert list(csv.reader(f)) == [COLUMNS, ['1', '', 'POINT (1.123456789 2)'], ['2', 'a,"b"', '']]
+
+
+def test_csv_hex_geometry_and_postgres_value_text(tmp_path):
+    path = str(tmp_path / 'out.tsv')
+    geometry = ewkb(Point(0, 0))
+    rows = [(True, float('nan'), {'k': '值'}, geometry)]
+    write_batches(CSVWriter(path, ['flag', 'ratio', 'extra', 'geom'], 'geom', delimiter='\t',
+                            geometry_encoding='hex'), rows)
+
+    with open(path, encoding='utf-8', newline='') as f:
+        lines = list(csv.reader(f, delimiter='\t'))
+    assert lines[1] == ['t', 'NaN', '{"k": "值"}', geometry.hex().upper()]
+
+
+def test_csv_without_geometry_column(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    write_batches(CSVWriter(path, ['id', 'data'], 'geom'), [(1, b'\x01\xff')])
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == 'id,data\n1,\\x01ff\n'
+
+
+def test_geometry_column_required_by_geometry_writers(tmp_path):
+    with pytest.raises(ValueError):
+        ShapefileWriter(str(tmp_path / 'out.shp'), ['id'], 'geom')
+
+
+def test_geojson_feature_collection_round_trip(tmp_path):
+    path = str(tmp_path / 'out.geojson')
+    writer = write_batches(GeoJSONWriter(path, COLUMNS, 'geom'), make_rows(0, 2), make_rows(2, 1))
+
+    with open(path, encoding='utf-8') as f:
+        collection = json.load(f)
+    assert writer.rows_written == 3
+    assert 'crs' not in collection
+    assert [feature['properties'] for feature in collection['features']] == [
+        {'id': i, 'name': f"feature {i}"} for i in range(3)]
+    assert collection['features'][2]['geometry'] == {'type': 'Point', 'coordinates': [2.123456789, 2 / 3]}
+    assert len(gpd.read_file(path)) == 3
+
+
+def test_geojson_names_crs_other_than_wgs84(tmp_path):
+    path = str(tmp_path / 'out.geojson')
+    write_batches(GeoJSONWriter(path, COLUMNS, 'geom'), make_rows(0, 1, 4490))
+    assert gpd.read_file(path).crs.to_epsg() == 4490
+
+
+def test_geojson_empty_result_is_valid(tmp_path):
+    path = str(tmp_path / 'out.geojson')
+    write_batches(GeoJSONWriter(path, COLUMNS, 'geom'))
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'type': 'FeatureCollection', 'features': []}
+
+
+def test_geojson_non_finite_numbers_become_null(tmp_path):
+    path = str(tmp_path / 'out.geojson')
+    rows = [(float('nan'), decimal.Decimal('Infinity'), [1.5, float('-inf')], ewkb(Point(0, 0)))]
+    write_batches(GeoJSONWriter(path, ['a', 'b', 'c', 'geom'], 'geom'), rows)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['features'][0]['properties'] == {'a': None, 'b': None, 'c': [1.5, None]}
+
+
+def test_geojson_serializes_database_types(tmp_path):
+    path = str(tmp_path / 'out.geojson')
+    rows = [(decimal.Decimal('1.25'), datetime.date(2024, 5, 1), b'\x00\xab', None)]
+    write_batches(GeoJSONWriter(path, ['n', 'd', 'b', 'geom'], 'geom'), rows)
+    with open(path, encoding='utf-8') as f:
+        feature = json.load(f)['features'][0]
+    assert feature['properties'] == {'n': 1.25, 'd': '2024-05-01', 'b': '00ab'}
+    assert feature['geometry'] is None
+
+
+@pytest.mark.parametrize('suffix', ['', '.gz'])
+def test_geojsonseq_writes_one_feature_per_line_with_precision(tmp_path, suffix):
+    path = str(tmp_path / f"out.geojsonl{suffix}")
+    write_batches(GeoJSONWriter(path, COLUMNS, 'geom', sequence=True, precision=3), make_rows(0, 2), make_rows(2, 2))
+
+    opener = gzip.open if suffix else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        features = [json.loads(line) for line in f]
+    assert [feature['properties']['id'] for feature in features] == [0, 1, 2, 3]
+    assert features[1]['geometry']['coordinates'] == [1.123, 0.333]
+
+
+def test_geoparquet_round_trip_with_row_groups_and_bbox(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    write_batches(GeoParquetWriter(path, COLUMNS, 'geom', row_group_size=4),
+                  make_rows(0, 3, 4490), make_rows(3, 3, 4490))
+
+    frame = gpd.read_parquet(path)
+    assert list(frame['id']) == list(range(6))
+    assert frame.crs.to_epsg() == 4490
+    assert frame.geometry[5].equals(Point(5.123456789, 5 / 3))
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 2
+    geo = json.loads(parquet.schema_arrow.metadata[b'geo'])
+    assert geo['version'] == '1.1.0'
+    assert geo['columns']['geom']['covering']['bbox']['xmin'] == ['geom_bbox', 'xmin']
+    assert parquet.read(columns=['geom_bbox']).column(0)[1].as_py() == {
+        'xmin': 1.123456789, 'ymin': 1 / 3, 'xmax': 1.123456789, 'ymax': 1 / 3}
+
+
+def test_geoparquet_empty_result_and_null_geometry(tmp_path):
+    empty = str(tmp_path / 'empty.parquet')
+    write_batches(GeoParquetWriter(empty, COLUMNS, 'geom'))
+    assert len(gpd.read_parquet(empty)) == 0
+
+    path = str(tmp_path / 'out.parquet')
+    write_batches(GeoParquetWriter(path, COLUMNS, 'geom'), [(1, 'x', None)])
+    assert pq.read_table(path, columns=['geom_bbox']).column(0)[0].as_py() is None
+
+
+def test_flatgeobuf_skips_rows_without_geometry(tmp_path):
+    path = str(tmp_path / 'out.fgb')
+    rows = make_rows(0, 3, 4490) + [(3, 'missing', None), (4, 'empty', ewkb(Point(), 4490))]
+    writer = write_batches(OGRArrowWriter(path, COLUMNS, 'geom', 'flatgeobuf'), rows, make_rows(5, 2, 4490))
+
+    frame = gpd.read_file(path)
+    assert (writer.rows_written, writer.rows_skipped) == (5, 2)
+    # The packed R-tree stores features in Hilbert order
+    assert sorted(frame['id']) == [0, 1, 2, 5, 6]
+    assert frame.crs.to_epsg() == 4490
+
+
+def test_gpkg_round_trip_names_layer_after_file(tmp_path):
+    path = str(tmp_path / 'parcels.gpkg')
+    write_batches(OGRArrowWriter(path, COLUMNS, 'geom', 'gpkg'), make_rows(0, 2), [(2, 'none', None)])
+
+    frame = gpd.read_file(path, layer='parcels')
+    assert list(frame['name']) == ['feature 0', 'feature 1', 'none']
+    assert frame.geometry[2] is None
+    assert frame.geometry[1].equals(Point(1.123456789, 1 / 3))
+
+
+def test_ogr_writer_failure_is_raised_and_partial_file_removed(tmp_path):
+    path = str(tmp_path / 'missing_dir' / 'out.gpkg')
+    writer = OGRArrowWriter(path, COLUMNS, 'geom', 'gpkg')
+    with pytest.raises(Exception):
+        write_batches(writer, make_rows(0, 2))
+    writer.abort()
+    assert not (tmp_path / 'missing_dir').exists()
+
+
+@pytest.fixture(params=['xlsxwriter', 'openpyxl'])
+def excel_engine(request, monkeypatch):
+    if request.param == 'openpyxl':
+        monkeypatch.setitem(sys.modules, 'xlsxwriter', None)
+    return request.param
+
+
+def sheet_values(workbook, name):
+    return [list(row) for row in workbook[name].iter_rows(values_only=True)]
+
+
+def test_excel_continues_on_new_sheets_at_row_limit(tmp_path, excel_engine):
+    path = str(tmp_path / 'out.xlsx')
+    writer = write_batches(ExcelWriter(path, COLUMNS, 'geom', max_rows=3), make_rows(0, 3), make_rows(3, 2))
+
+    assert writer.engine == excel_engine
+    workbook = openpyxl.load_workbook(path)
+    assert workbook.sheetnames == ['Data', 'Data (2)', 'Data (3)']
+    assert sheet_values(workbook, 'Data (3)') == [COLUMNS, [4, 'feature 4', 'POINT (4.123456789 1.3333333333333333)']]
+
+
+def test_excel_moves_long_values_to_side_sheet(tmp_path, excel_engine):
+    path = str(tmp_path / 'out.xlsx')
+    long_text = 'x' * (EXCEL_MAX_CELL_CHARS + 10)
+    rows = [(1, 'short', ewkb(Point(0, 0))), (2, long_text, ewkb(Point(1, 1)))]
+    writer = write_batches(ExcelWriter(path, COLUMNS, 'geom', max_rows=2), rows)
+
+    workbook = openpyxl.load_workbook(path)
+    assert writer.values_moved == 1
+    cell = workbook['Data (2)']['B2'].value
+    assert len(cell) == EXCEL_MAX_CELL_CHARS
+    assert cell.endswith(f"[{len(long_text)} characters, full value in 'Long values' row 2]")
+    side = sheet_values(workbook, 'Long values')
+    assert side[1][:4] == ['Data (2)', 2, 'name', len(long_text)]
+    assert ''.join(side[1][4:]) == long_text
+
+
+def test_excel_values_without_geometry(tmp_path, excel_engine):
+    path = str(tmp_path / 'out.xlsx')
+    moment = datetime.datetime(2024, 5, 1, 8, tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+    rows = [(float('nan'), decimal.Decimal('-Infinity'), moment, {'k': 1}, '=1+1')]
+    write_batches(ExcelWriter(path, ['a', 'b', 'c', 'd', 'e'], 'geom'), rows)
+
+    workbook = openpyxl.load_workbook(path)
+    assert sheet_values(workbook, 'Data')[1] == [
+        'NaN', '-Infinity', datetime.datetime(2024, 5, 1, 0, 0), '{"k": 1}', '=1+1']
+    # Text that looks like a formula stays text
+    assert workbook['Data']['E2'].data_type == 's'
+
+
+def test_excel_empty_result_keeps_header(tmp_path, excel_engine):
+    path = str(tmp_path / 'out.xlsx')
+    write_batches(ExcelWriter(path, COLUMNS, 'geom'))
+    assert sheet_values(openpyxl.load_workbook(path), 'Data') == [COLUMNS]
+
+
+class FailingWriter(CSVWriter):
+    """CSV writer that fails on the given batch"""
+
+    def __init__(self, file_path, columns, geometry_column, fail_on=1):
+        super().__init__(file_path, columns, geometry_column)
+        self.batches = 0
+        self.fail_on = fail_on
+
+    def _write_rows(self, rows):
+        self.batches += 1
+        if self.batches == self.fail_on:
+            raise OSError(f"disk full: {self.file_path}")
+        super()._write_rows(rows)
+
+
+def test_fanout_feeds_every_writer_the_same_batches(tmp_path):
+    writers = [GeoJSONWriter(str(tmp_path / 'out.geojsonl'), COLUMNS, 'geom', sequence=True),
+               GeoParquetWriter(str(tmp_path / 'out.parquet'), COLUMNS, 'geom'),
+               ExcelWriter(str(tmp_path / 'out.xlsx'), COLUMNS, 'geom')]
+    fanout = write_batches(FanOutWriter(writers), make_rows(0, 3), make_rows(3, 3))
+
+    assert fanout.rows_written == 6
+    assert [error for _, error in fanout.results()] == [None, None, None]
+    assert len(gpd.read_file(str(tmp_path / 'out.geojsonl'))) == 6
+    assert list(gpd.read_parquet(str(tmp_path / 'out.parquet'))['id']) == list(range(6))
+
+
+def test_fanout_drops_a_failing_writer_without_blocking_the_others(tmp_path):
+    good = CSVWriter(str(tmp_path / 'good.csv'), COLUMNS, 'geom')
+    bad = FailingWriter(str(tmp_path / 'bad.csv'), COLUMNS, 'geom', fail_on=2)
+    fanout = FanOutWriter([good, bad], queue_batches=1)
+    write_batches(fanout, *(make_rows(i * 2, 2) for i in range(10)))
+
+    (_, good_error), (_, bad_error) = fanout.results()
+    assert good_error is None
+    assert isinstance(bad_error, OSError)
+    assert fanout.rows_written == good.rows_written == 20
+    assert not os.path.exists(bad.file_path)
+
+
+def test_fanout_raises_when_every_writer_failed(tmp_path):
+    writers = [FailingWriter(str(tmp_path / f"{name}.csv"), COLUMNS, 'geom') for name in ('a', 'b')]
+    fanout = FanOutWriter(writers, queue_batches=1)
+    with pytest.raises(OSError, match='a.csv'):
+        for i in range(10):
+            fanout.write_batch(make_rows(i, 1))
+        fanout.close()
+    fanout.abort()
+    assert fanout.rows_written == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fanout_abort_removes_every_partial_file(tmp_path):
+    writers = [CSVWriter(str(tmp_path / 'out.csv'), COLUMNS, 'geom'),
+               GeoJSONWriter(str(tmp_path / 'out.geojson'), COLUMNS, 'geom')]
+    fanout = FanOutWriter(writers)
+    fanout.write_batch(make_rows(0, 2))
+    fanout.abort()
+    fanout.abort()
+    assert list(tmp_path.iterdir()) == []